@@ -1,75 +1,157 @@
 # app.py
+import time
 import streamlit as st
 from PIL import Image
-from scripts.classical import classify_email
-from scripts.preprocess.extract_features import extract_features
-from scripts.ocr import (
-    load_ocr_model, 
-    process_file_upload, 
-    process_camera_capture
-)
-from scripts.llm import generate_llm_explanation, get_fallback_explanation
+from scripts.classical import classify_email_cached
+from scripts.registry import get_model_version
+from scripts.llm import stream_llm_explanation, get_fallback_explanation
+from scripts.client import get_service_client
+from scripts.cascade import should_explain
+from scripts.startup import prewarm
+from scripts import metrics
 
 # Initialize minimal session state for tracking
 if 'extracted_text' not in st.session_state:
     st.session_state.extracted_text = ""
+    # File ids of the images extracted_text was read from
+    st.session_state.extracted_from = ()
+
+# Serve /metrics when SALAIN_METRICS_PORT is set
+metrics.start_metrics_server()
+
+# Use the scoring service when SALAIN_SERVICE_URL is set, otherwise run inference here
+service = get_service_client()
 
-# Initialize OCR model at app startup
-ocr_model = load_ocr_model()
+# OCR and the LLM client load on first use; SALAIN_PREWARM=classifier,ocr,llm
+# loads them in the background instead
+if service is None:
+    prewarm()
 
 # Streamlit UI
 st.title("Salain - Malicious Email Detector")
 st.markdown("Protect yourself from malicious emails 🇵🇭")
 
+def reset_extracted_text():
+    st.session_state.extracted_text = ""
+    st.session_state.extracted_from = ()
+
 # Input Method Selection
 input_method = st.radio(
     "Choose input method:",
-    ["Text Input", "Upload Image", "Camera Capture"],
+    ["Text Input", "Upload Image", "Camera Capture", "Upload .eml"],
     horizontal=True,
-    on_change=lambda: setattr(st.session_state, 'extracted_text', "")
+    on_change=reset_extracted_text
 )
 
-def analyze_email_content(text):
+def refresh_extracted_text(files, extract, text_key):
+    """
+    Extract text again whenever the set of images changes.
+
+    Adding or removing a screenshot re-runs OCR on the new set (images already
+    seen come from the OCR cache) and replaces any edits in the text box.
+
+    Args:
+        files (list): Uploaded or captured image files
+        extract (callable): Returns the combined text of a list of files
+        text_key (str): Key of the text area showing the extracted text
+    """
+    file_ids = tuple(f.file_id for f in files)
+    if file_ids == st.session_state.get("extracted_from", ()):
+        return
+    st.session_state.extracted_text = extract(files) if files else ""
+    st.session_state.extracted_from = file_ids
+    # Drop the text area's own state so it shows the new text
+    st.session_state.pop(text_key, None)
+
+def analyze_email_content(text, extra_features=None, explain=False):
     """Analyze email content and display results with explanations"""
+    with metrics.profile_slow("analyze_email"), metrics.span("analyze_email"):
+        _render_analysis(text, extra_features, explain)
+
+def request_explanation(text, extra_features):
+    """Re-run the analysis with an LLM explanation on the next rerun"""
+    st.session_state.explain_request = {"text": text, "extra_features": extra_features}
+
+def _render_analysis(text, extra_features=None, explain=False):
     if not text.strip():
         st.warning("Please enter text to analyze")
         return
+
+    started = time.perf_counter()
+    try:
+        # Get classification and features
+        with st.spinner("Analyzing email content..."):
+            if service is not None:
+                prediction, confidence, features = service.classify_email(text)
+            else:
+                prediction, confidence, features = classify_email_cached(text)
+        if extra_features:
+            # Header signals are explained alongside the body features but not scored
+            features = {**features, **extra_features}
+        time_to_verdict = time.perf_counter() - started
         
-    with st.spinner("Analyzing email content..."):
-        try:
-            # Get classification and features
-            prediction, confidence = classify_email(text)
-            features = extract_features(text)
-            
-            # Display classification results
-            col1, col2 = st.columns([1, 3])
-            with col1:
-                if prediction[0] == 1:
-                    st.error(f"⚠️ Malicious Detected\n(Confidence: {confidence:.2%})")
-                else:
-                    st.success(f"✅ Safe Email\n(Confidence: {1-confidence:.2%})")
-            
-            with col2:
-                # Generate and display LLM explanation
+        # Display classification results as soon as they are ready
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            if prediction[0] == 1:
+                st.error(f"⚠️ Malicious Detected\n(Confidence: {confidence:.2%})")
+            else:
+                st.success(f"✅ Safe Email\n(Confidence: {1-confidence:.2%})")
+        
+        with col2:
+            # Stream the LLM explanation; falls back to a canned one past the deadline.
+            # Confident safe verdicts only get one on request (SALAIN_EXPLAIN)
+            timings = {}
+            with st.expander("📖 Explanation", expanded=True):
+                st.markdown("**Analysis Summary**")
                 try:
-                    explanation = generate_llm_explanation(
-                        text, 
-                        prediction[0], 
-                        confidence,
-                        features
-                    )
+                    if not (explain or should_explain(prediction[0], confidence)):
+                        st.markdown(get_fallback_explanation(prediction[0], features))
+                        st.button(
+                            "Generate detailed explanation",
+                            key="explain_button",
+                            on_click=request_explanation,
+                            args=(text, extra_features)
+                        )
+                    elif service is not None:
+                        explained = service.explain(text, prediction[0], confidence, features)
+                        timings.update(explained["timings"], fallback=explained["fallback"])
+                        st.markdown(explained["explanation"])
+                    else:
+                        st.write_stream(stream_llm_explanation(
+                            text, 
+                            prediction[0], 
+                            confidence,
+                            features,
+                            timings=timings
+                        ))
                 except Exception as e:
                     st.warning(f"Couldn't generate detailed explanation: {str(e)}")
-                    explanation = get_fallback_explanation(prediction[0], features)
-                
-                with st.expander("📖 Explanation", expanded=True):
-                    st.markdown(f"""
-                    **Analysis Summary**  
-                    {explanation}
-                    """)
-            
-        except Exception as e:
-            st.error(f"Analysis Error: {str(e)}")
+                    st.markdown(get_fallback_explanation(prediction[0], features))
+
+        latency = f"Verdict in {time_to_verdict * 1000:.0f} ms"
+        if "first_token" in timings:
+            latency += f" · first explanation text in {(time_to_verdict + timings['first_token']) * 1000:.0f} ms"
+        if timings.get("fallback"):
+            latency += " (fallback explanation)"
+        model_version = service.model_version if service is not None else get_model_version()
+        st.caption(f"Model version: {model_version} · {latency}")
+        
+    except Exception as e:
+        st.error(f"Analysis Error: {str(e)}")
+
+def extract_text_from_images(files):
+    """OCR uploaded or captured images, on the scoring service if one is configured"""
+    if service is None:
+        # PaddleOCR is only imported once an image input is used
+        from scripts.ocr import process_file_uploads
+        return process_file_uploads(files)
+    try:
+        with st.spinner(f"Extracting text from {len(files)} image(s)..."):
+            return "\n\n".join(text for text in (service.ocr(f.getvalue()) for f in files) if text)
+    except Exception as e:
+        st.error(f"OCR Error: {str(e)}")
+        return ""
 
 # Display the appropriate input method
 if input_method == "Text Input":
@@ -85,26 +167,25 @@ if input_method == "Text Input":
         analyze_email_content(text_input_value)
 
 elif input_method == "Upload Image":
-    # Image upload
-    uploaded_file = st.file_uploader(
-        "Upload email screenshot:",
+    # Image upload; a long email can be sent as several screenshots
+    uploaded_files = st.file_uploader(
+        "Upload email screenshot(s), in reading order:",
         type=["png", "jpg", "jpeg"],
+        accept_multiple_files=True,
         key="uploaded_file"
     )
     
-    # Process the uploaded file
-    if uploaded_file is not None:
-        # Display the image
-        image = Image.open(uploaded_file)
-        st.image(image, caption="Uploaded Email Image", use_container_width=True)
-        
-        # Extract text if not already done
-        if st.session_state.extracted_text == "":
-            with st.spinner("Extracting text from image..."):
-                st.session_state.extracted_text = process_file_upload(uploaded_file)
+    # Process the uploaded files
+    if uploaded_files:
+        # Display the images
+        for uploaded_file in uploaded_files:
+            st.image(Image.open(uploaded_file), caption=uploaded_file.name, use_container_width=True)
+
+    # Extract text when screenshots are added or removed
+    refresh_extracted_text(uploaded_files or [], extract_text_from_images, "upload_extracted_text")
     
     # Display text area for editing OCR results or manual entry
-    if uploaded_file is not None:
+    if uploaded_files:
         if st.session_state.extracted_text:
             text_value = st.text_area(
                 "Extracted text (edit if needed):",
@@ -138,10 +219,16 @@ elif input_method == "Camera Capture":
         key="camera_file"
     )
     
-    # Process the camera file
-    if camera_file is not None and st.session_state.extracted_text == "":
+    def extract_camera_text(files):
+        if service is not None:
+            return extract_text_from_images(files)
+        from scripts.ocr import process_camera_capture
         with st.spinner("Extracting text from image..."):
-            st.session_state.extracted_text = process_camera_capture(camera_file)
+            return process_camera_capture(files[0])
+
+    # Extract text from each new photo
+    refresh_extracted_text([camera_file] if camera_file is not None else [], extract_camera_text,
+                           "camera_extracted_text")
     
     # Display text area for editing OCR results or manual entry
     if camera_file is not None:
@@ -169,4 +256,57 @@ elif input_method == "Camera Capture":
     
     # Add analyze button
     if st.button("Analyze Email", key="camera_analyze_button"):
-        analyze_email_content(text_value)
\ No newline at end of file
+        analyze_email_content(text_value)
+
+elif input_method == "Upload .eml":
+    # Raw message file; only the text body is classified
+    eml_file = st.file_uploader(
+        "Upload a raw email message (.eml):",
+        type=["eml"],
+        key="eml_file"
+    )
+
+    header_signals = None
+    message = None
+    if eml_file is not None:
+        from scripts.preprocess.mime import parse_message
+        # A new file replaces any edits to the previous message's body
+        if st.session_state.get("eml_body_from") != eml_file.file_id:
+            st.session_state.eml_body_from = eml_file.file_id
+            st.session_state.pop("eml_body_text", None)
+        try:
+            message = parse_message(eml_file.getvalue())
+        except Exception as e:
+            st.error(f"Message Parsing Error: {str(e)}")
+
+    if message is not None:
+        header_signals = message["features"]
+        # Attacker-controlled; shown as plain text, never as markdown
+        st.text(f"Subject: {message['subject'] or '(none)'}")
+        st.caption(
+            " · ".join(f"{name}: {value}" for name, value in header_signals.items())
+            + f" · skipped attachments: {len(message['attachments'])}"
+        )
+        if not message["body"]:
+            st.warning("No text body found in the message.")
+        text_value = st.text_area(
+            "Message body (edit if needed):",
+            value=message["body"],
+            height=200,
+            key="eml_body_text"
+        )
+    else:
+        text_value = st.text_area(
+            "Enter email text manually:",
+            height=200,
+            key="eml_no_file_text"
+        )
+
+    # Add analyze button
+    if st.button("Analyze Email", key="eml_analyze_button"):
+        analyze_email_content(text_value, header_signals)
+
+# Analysis whose detailed explanation was requested; the verdict comes from the cache
+explain_request = st.session_state.pop("explain_request", None)
+if explain_request:
+    analyze_email_content(explain=True, **explain_request)
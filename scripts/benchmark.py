@@ -0,0 +1,392 @@
+"""
+Latency and throughput benchmarks for every inference stage.
+
+Replays the labeled synthetic corpus from test.py, plus scaled-up synthetic
+corpora, through each pipeline stage and writes p50/p95/p99 latency,
+throughput and memory per stage to a CSV under results/benchmark/.
+
+Usage:
+    python -m scripts.benchmark
+    python -m scripts.benchmark --save-baseline
+    python -m scripts.benchmark --compare results/benchmark/baseline.csv
+    python -m scripts.benchmark --stages adversarial --max-adversarial-ms 1000
+"""
+import argparse
+import base64
+import csv
+import gc
+import glob
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+RESULTS_DIR = "results/benchmark"
+DEFAULT_OUTPUT = os.path.join(RESULTS_DIR, "latest.csv")
+DEFAULT_BASELINE = os.path.join(RESULTS_DIR, "baseline.csv")
+OCR_SAMPLE_IMAGES = "results/ocr_testing/*.png"
+
+FIELDS = [
+    "stage", "corpus", "calls", "p50_ms", "p95_ms", "p99_ms", "max_ms", "mean_ms",
+    "throughput_per_s", "peak_alloc_mb", "peak_rss_mb",
+]
+
+# A stage regresses when its p95 latency grows, or its throughput drops, by more than this
+DEFAULT_TOLERANCE = 0.25
+
+# Guarded processing must finish every adversarial input within this many milliseconds
+DEFAULT_MAX_ADVERSARIAL_MS = 1000.0
+
+
+# --- Corpora -----------------------------------------------------------------
+
+def labeled_corpus():
+    from test import synthetic_labeld_emails
+    return list(synthetic_labeld_emails)
+
+def long_html_corpus(emails, paragraphs=200):
+    """Wrap each email in a newsletter-sized HTML document"""
+    template = (
+        "<html><head><style>p {{ color: #333; }} .x {{ margin: 0 }}</style>"
+        "<script>var tracking = '{0}';</script></head><body><table>{1}</table></body></html>"
+    )
+    row = "<tr><td class='x'><p>{0}</p><a href='http://example.com/track?id={1}'>Read more</a></td></tr>"
+    return [
+        template.format(i, "".join(row.format(email, j) for j in range(paragraphs)))
+        for i, email in enumerate(emails[:20])
+    ]
+
+def large_body_corpus(emails, target_chars=1_000_000):
+    """Build a few very large plain-text bodies"""
+    text = " ".join(emails)
+    body = (text + " ") * (target_chars // (len(text) + 1) + 1)
+    return [body[:target_chars]] * 3
+
+# Building blocks for inputs aimed at the worst cases of the HTML parser, the
+# feature regexes and the vectorizer
+ADVERSARIAL_FRAGMENTS = [
+    "<", "<a ", "</a ", "<!x ", "<?x ", "<![CDATA[", "<!--", "<div>", "&amp", "&#", "&",
+    "a@", "w$", "http", "www", "@", "$", " ", "\n", "x" * 64, "verify", "urgent ",
+]
+
+def adversarial_corpus(chars=2_000_000, fuzz_cases=10, seed=0):
+    """
+    Return named inputs built to be slow to process, each about `chars` long.
+
+    Besides fixed worst cases (unclosed tags, deep nesting, base64 attachments),
+    fuzz cases mix random runs of ADVERSARIAL_FRAGMENTS from a fixed seed.
+    """
+    rng = random.Random(seed)
+    blob = base64.b64encode(rng.randbytes(chars * 3 // 4)).decode()
+    cases = {
+        "unclosed_tags": "<" * chars,
+        "unclosed_start_tags": "<a " * (chars // 3),
+        "huge_start_tag": "<a " * (chars // 3) + ">",
+        "unclosed_comment": "<!--" + "a" * chars,
+        "unclosed_cdata": "<![CDATA[" * (chars // 9) + ">",
+        "deep_nesting": "<div>" * (chars // 5),
+        "entities": "&amp" * (chars // 4),
+        "obfuscation_runs": "a@" * (chars // 2),
+        "link_prefixes": "http" * (chars // 4),
+        "base64_inline": blob,
+        "base64_mime": "\r\n".join(blob[i:i + 76] for i in range(0, len(blob), 76)),
+        "no_whitespace": "a" * chars,
+    }
+    for case in range(fuzz_cases):
+        parts, size = [], 0
+        while size < chars:
+            part = rng.choice(ADVERSARIAL_FRAGMENTS) * rng.randint(1, 2000)
+            parts.append(part)
+            size += len(part)
+        cases[f"fuzz_{case}"] = "".join(parts)[:chars]
+    return cases
+
+
+# --- Measurement -------------------------------------------------------------
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def measure(stage, corpus, func, inputs, repeat=3, items_per_call=1):
+    """
+    Time func over every input and summarize the latency distribution.
+
+    A separate untimed pass under tracemalloc records the peak Python
+    allocation, so memory tracing does not distort the latencies.
+    """
+    func(inputs[0])  # warm-up
+
+    latencies = []
+    gc.collect()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for item in inputs:
+            call_started = time.perf_counter()
+            func(item)
+            latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    for item in inputs:
+        func(item)
+    _, peak_alloc = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "stage": stage,
+        "corpus": corpus,
+        "calls": len(latencies),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 4),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 4),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 4),
+        "max_ms": round(latencies[-1] * 1000, 4),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 4),
+        "throughput_per_s": round(len(latencies) * items_per_call / elapsed, 2) if elapsed else 0.0,
+        "peak_alloc_mb": round(peak_alloc / (1024 * 1024), 3),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+# --- Stages ------------------------------------------------------------------
+
+def _text_stages(corpora, repeat):
+    from scripts.preprocess.clean_email import clean_email
+    from scripts.preprocess.extract_features import extract_features
+
+    rows = []
+    for name, inputs in corpora.items():
+        rows.append(measure("clean_email", name, clean_email, inputs, repeat))
+        rows.append(measure("extract_features", name, extract_features, inputs, repeat))
+    return rows
+
+def _model_stages(corpora, repeat, batch_size):
+    try:
+        from scripts.registry import get_classifier_artifacts
+        model, tfidf_vectorizer, _ = get_classifier_artifacts()
+    except (OSError, ImportError) as e:
+        print(f"Skipping model stages: {e}", file=sys.stderr)
+        return []
+
+    from scipy.sparse import hstack
+    from scripts.classical import classify_email, classify_emails
+    from scripts.preprocess.clean_email import clean_email
+    from scripts.preprocess.extract_features import extract_features_batch
+
+    rows = []
+    for name, inputs in corpora.items():
+        cleaned = [clean_email(text) for text in inputs]
+        combined = [
+            hstack([tfidf_vectorizer.transform([clean]), extract_features_batch([text])], format="csr")
+            for clean, text in zip(cleaned, inputs)
+        ]
+        rows.append(measure("tfidf_transform", name, lambda clean: tfidf_vectorizer.transform([clean]), cleaned, repeat))
+        rows.append(measure("model_predict_proba", name, model.predict_proba, combined, repeat))
+        rows.append(measure("classify_email", name, classify_email, inputs, repeat))
+
+    # Batch throughput over the labeled corpus scaled up to a few thousand emails
+    emails = corpora["labeled"] * max(batch_size // len(corpora["labeled"]), 1)
+    rows.append(measure(
+        "classify_emails", f"labeled_x{len(emails)}",
+        lambda texts: list(classify_emails(texts, chunk_size=batch_size)),
+        [emails], repeat, items_per_call=len(emails),
+    ))
+    return rows
+
+def _ocr_stage(repeat):
+    images = sorted(glob.glob(OCR_SAMPLE_IMAGES))
+    try:
+        from PIL import Image
+        from scripts.ocr import load_ocr_model, ocr_cache, process_image_with_ocr
+        ocr_model = load_ocr_model()
+    except ImportError as e:
+        print(f"Skipping OCR stage: {e}", file=sys.stderr)
+        return []
+    if ocr_model is None or not images:
+        print("Skipping OCR stage: model or sample images unavailable", file=sys.stderr)
+        return []
+
+    loaded = [Image.open(path).convert("RGB") for path in images]
+
+    def uncached(image):
+        ocr_cache.clear()
+        return process_image_with_ocr(image, ocr_model)
+
+    return [
+        measure("ocr", "sample_images", uncached, loaded, repeat),
+        measure("ocr_cached", "sample_images", lambda image: process_image_with_ocr(image, ocr_model), loaded, repeat),
+    ]
+
+def _llm_stage(corpora, repeat):
+    try:
+        from scripts import llm
+    except ImportError as e:
+        print(f"Skipping LLM stage: {e}", file=sys.stderr)
+        return []
+
+    llm.set_llm_backend(llm.StubLLM())
+
+    def uncached(text):
+        llm.explanation_cache.clear()
+        return "".join(llm.stream_llm_explanation(text, 1, 0.9, {"num_links": 1}))
+
+    inputs = corpora["labeled"]
+    rows = [
+        measure("llm_explanation_stub", "labeled", uncached, inputs, repeat),
+        measure(
+            "llm_explanation_cached", "labeled",
+            lambda text: "".join(llm.stream_llm_explanation(text, 1, 0.9, {"num_links": 1})),
+            inputs, repeat,
+        ),
+    ]
+    llm.set_llm_backend(None)
+    return rows
+
+def _adversarial_stage():
+    """Latency of the guarded pipeline on inputs built to be slow"""
+    from scripts.preprocess.clean_email import clean_email
+    from scripts.preprocess.extract_features import extract_features
+    from scripts.preprocess.guard import GUARD_ENABLED, guard_email
+
+    if not GUARD_ENABLED:
+        print("Adversarial stage measures guarded mode; unset SALAIN_GUARD=0", file=sys.stderr)
+        return []
+
+    def preprocess(text):
+        guarded = guard_email(text)
+        return clean_email(guarded), extract_features(guarded)
+
+    cases = adversarial_corpus()
+    rows = [measure("guarded_preprocess", name, preprocess, [text], repeat=1) for name, text in cases.items()]
+
+    try:
+        from scripts.classical import classify_email
+        from scripts.registry import get_classifier_artifacts
+        get_classifier_artifacts()
+    except (OSError, ImportError) as e:
+        print(f"Skipping adversarial classify_email: {e}", file=sys.stderr)
+        return rows
+    rows.append(measure("guarded_classify_email", "adversarial", classify_email, list(cases.values()), repeat=1))
+    return rows
+
+def run_benchmarks(stages, repeat=3, batch_size=2000):
+    emails = labeled_corpus()
+    corpora = {
+        "labeled": emails,
+        "long_html": long_html_corpus(emails),
+        "large_body": large_body_corpus(emails),
+    }
+
+    rows = []
+    if "text" in stages:
+        rows += _text_stages(corpora, repeat)
+    if "model" in stages:
+        rows += _model_stages(corpora, repeat, batch_size)
+    if "ocr" in stages:
+        rows += _ocr_stage(repeat)
+    if "llm" in stages:
+        rows += _llm_stage(corpora, repeat)
+    if "adversarial" in stages:
+        rows += _adversarial_stage()
+    return rows
+
+
+# --- Reporting ---------------------------------------------------------------
+
+def write_csv(rows, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def read_csv(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+def compare(rows, baseline_rows, tolerance=DEFAULT_TOLERANCE):
+    """
+    Return a description of every stage that is slower than its baseline.
+
+    Rows are matched on (stage, corpus); stages missing from either side are ignored.
+    """
+    baseline = {(row["stage"], row["corpus"]): row for row in baseline_rows}
+    regressions = []
+    for row in rows:
+        base = baseline.get((row["stage"], row["corpus"]))
+        if base is None:
+            continue
+        p95, base_p95 = float(row["p95_ms"]), float(base["p95_ms"])
+        throughput, base_throughput = float(row["throughput_per_s"]), float(base["throughput_per_s"])
+        if base_p95 and p95 > base_p95 * (1 + tolerance):
+            regressions.append(f"{row['stage']}/{row['corpus']}: p95 {base_p95:.3f} -> {p95:.3f} ms")
+        if base_throughput and throughput < base_throughput * (1 - tolerance):
+            regressions.append(
+                f"{row['stage']}/{row['corpus']}: throughput {base_throughput:.1f} -> {throughput:.1f}/s"
+            )
+    return regressions
+
+def latency_violations(rows, max_ms=DEFAULT_MAX_ADVERSARIAL_MS):
+    """Return a description of every guarded stage whose slowest call exceeded max_ms"""
+    return [
+        f"{row['stage']}/{row['corpus']}: {float(row['max_ms']):.1f} ms > {max_ms:.0f} ms"
+        for row in rows
+        if row["stage"].startswith("guarded_") and float(row["max_ms"]) > max_ms
+    ]
+
+def print_table(rows):
+    print(f"{'stage':<26}{'corpus':<18}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'per s':>12}{'alloc MB':>10}")
+    for row in rows:
+        print(
+            f"{row['stage']:<26}{row['corpus']:<18}{row['p50_ms']:>10.3f}{row['p95_ms']:>10.3f}"
+            f"{row['p99_ms']:>10.3f}{row['throughput_per_s']:>12.1f}{row['peak_alloc_mb']:>10.2f}"
+        )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Salain inference stages")
+    parser.add_argument("--stages", default="text,model,ocr,llm,adversarial",
+                        help="Comma-separated: text, model, ocr, llm, adversarial")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over each corpus per stage")
+    parser.add_argument("--batch-size", type=int, default=2000, help="Emails per classify_emails run")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="CSV file for this run")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Also write the results to {DEFAULT_BASELINE}")
+    parser.add_argument("--compare", metavar="BASELINE_CSV", help="Flag regressions against a stored baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed relative slowdown")
+    parser.add_argument("--max-adversarial-ms", type=float, default=DEFAULT_MAX_ADVERSARIAL_MS,
+                        help="Worst-case latency bound for guarded processing")
+    args = parser.parse_args(argv)
+
+    rows = run_benchmarks(set(args.stages.split(",")), repeat=args.repeat, batch_size=args.batch_size)
+    print_table(rows)
+    write_csv(rows, args.output)
+    if args.save_baseline:
+        write_csv(rows, DEFAULT_BASELINE)
+
+    violations = latency_violations(rows, args.max_adversarial_ms)
+    if violations:
+        print("\nLatency bound exceeded:")
+        for violation in violations:
+            print(f"  {violation}")
+        sys.exit(1)
+
+    if args.compare:
+        regressions = compare(rows, read_csv(args.compare), args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from scripts import metrics
+
+# Defaults for the shared caches, overridable through the environment
+DEFAULT_MAX_ENTRIES = int(os.getenv("SALAIN_CACHE_SIZE", "2048"))
+DEFAULT_TTL = float(os.getenv("SALAIN_CACHE_TTL", "86400"))
+DEFAULT_DB_PATH = os.getenv("SALAIN_CACHE_DB") or None
+# Rows kept per namespace in the SQLite tier; the oldest are deleted beyond this
+DEFAULT_MAX_DB_ENTRIES = int(os.getenv("SALAIN_CACHE_DB_SIZE", "100000"))
+# Writes between sweeps of expired and surplus rows from the SQLite tier
+DB_PURGE_INTERVAL = 256
+
+_MISSING = object()
+
+def normalize_text(text):
+    """
+    Collapse whitespace so reformatted copies share a key.
+
+    Only for text already reduced to words, such as clean_email output; raw
+    bodies go through the guard, whose output depends on whitespace.
+    """
+    return " ".join(text.split())
+
+def make_key(*parts):
+    """Return a content hash of the given parts"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8", errors="surrogatepass"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with a TTL and an optional SQLite second tier.
+
+    The in-memory tier is shared by every thread in the process. When db_path is
+    set, entries are also written to SQLite so they survive restarts; a memory
+    miss falls back to the database and promotes the entry. Expired rows are
+    deleted when a lookup finds one and in periodic sweeps on write, which also
+    keep at most max_db_entries rows. Values must be JSON-serializable.
+    """
+
+    def __init__(self, namespace, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, db_path=None,
+                 max_db_entries=DEFAULT_MAX_DB_ENTRIES):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_db_entries = max_db_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0, "misses": 0, "disk_hits": 0, "evictions": 0, "expirations": 0, "db_deletions": 0,
+        }
+        self._writes_since_purge = 0
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "namespace TEXT, key TEXT, value TEXT, stored_at REAL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS cache_age ON cache (namespace, stored_at)")
+            with self._lock:
+                self._purge(time.time())
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, stored_at = entry
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    metrics.increment("cache_lookups_total", cache=self.namespace, result="hit")
+                    return value
+                del self._entries[key]
+                self._counters["expirations"] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, stored_at FROM cache WHERE namespace = ? AND key = ?",
+                    (self.namespace, key),
+                ).fetchone()
+                if row is not None and now - row[1] <= self.ttl:
+                    value = json.loads(row[0])
+                    self._store(key, value, row[1])
+                    self._counters["hits"] += 1
+                    self._counters["disk_hits"] += 1
+                    metrics.increment("cache_lookups_total", cache=self.namespace, result="disk_hit")
+                    return value
+                if row is not None:
+                    self._db.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+                    self._counters["expirations"] += 1
+                    self._counters["db_deletions"] += 1
+
+            self._counters["misses"] += 1
+            metrics.increment("cache_lookups_total", cache=self.namespace, result="miss")
+            return default
+
+    def set(self, key, value):
+        """Store a value in memory and, if configured, on disk"""
+        now = time.time()
+        with self._lock:
+            self._store(key, value, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, stored_at) VALUES (?, ?, ?, ?)",
+                    (self.namespace, key, json.dumps(value), now),
+                )
+                self._writes_since_purge += 1
+                if self._writes_since_purge >= DB_PURGE_INTERVAL:
+                    self._purge(now)
+
+    def _purge(self, now):
+        """Delete expired rows, then the oldest rows beyond max_db_entries; needs the lock"""
+        self._writes_since_purge = 0
+        deleted = self._db.execute(
+            "DELETE FROM cache WHERE namespace = ? AND stored_at < ?", (self.namespace, now - self.ttl)
+        ).rowcount
+        if self.max_db_entries:
+            deleted += self._db.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key IN ("
+                "SELECT key FROM cache WHERE namespace = ? ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                (self.namespace, self.namespace, self.max_db_entries),
+            ).rowcount
+        if deleted:
+            self._counters["db_deletions"] += deleted
+            metrics.increment("cache_db_deletions_total", deleted, cache=self.namespace)
+
+    def _store(self, key, value, stored_at):
+        self._entries[key] = (value, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+            metrics.increment("cache_evictions_total", cache=self.namespace)
+
+    def clear(self):
+        """Drop every entry in this namespace, in memory and on disk"""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+
+    def stats(self):
+        """Return hit/miss/eviction counters and the current size"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+# Shared by every session in the process
+classification_cache = ResultCache("classification", db_path=DEFAULT_DB_PATH)
@@ -0,0 +1,311 @@
+"""
+Confidence-gated model cascade and explanation policy.
+
+The logistic model (models/logreg.pkl) scores every email first. Only emails
+whose malicious probability falls inside the uncertainty band (LOW, HIGH) are
+rescored by the heavy LightGBM model, whose probability then replaces the
+linear one. Both tiers read the same TF-IDF + manual feature matrix, so the
+cascade adds no preprocessing.
+
+CascadeModel has the predict_proba/classes_ interface of the models it wraps,
+so every inference path (app, scoring service, bulk scorer) uses it through
+get_classifier_artifacts when SALAIN_CASCADE=1. Its version string includes
+the linear model and the band, so cached verdicts never mix the two paths.
+
+Environment:
+    SALAIN_CASCADE=1                enable the cascade (off by default)
+    SALAIN_CASCADE_BAND=0.2,0.8     probabilities strictly inside go to the heavy model
+    SALAIN_EXPLAIN=auto             LLM explanations: auto (uncertain or malicious
+                                    verdicts, others on demand), always, on_demand
+
+The evaluation CLI scores the held-out split that scripts.train keeps out of
+training (20%, stratified, random_state 42), so the deltas are not measured on
+rows the models have seen. Pass --all-rows for an input file that is already
+held out.
+
+Usage:
+    python -m scripts.cascade                              # held-out split of the Kaggle corpus
+    python -m scripts.cascade --input labeled.csv --bands 0.1:0.9,0.2:0.8,0.3:0.7
+    python -m scripts.cascade --input holdout.csv --all-rows
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import numpy as np
+from scripts import metrics
+
+CASCADE_ENABLED = os.getenv("SALAIN_CASCADE", "0") == "1"
+UNCERTAIN_LOW, UNCERTAIN_HIGH = (float(bound) for bound in os.getenv("SALAIN_CASCADE_BAND", "0.2,0.8").split(","))
+
+EXPLAIN_POLICIES = ("auto", "always", "on_demand")
+EXPLAIN_POLICY = os.getenv("SALAIN_EXPLAIN", "auto")
+
+# Emails timed one at a time by evaluate(), as the app scores them
+DEFAULT_TIMING_SAMPLE = 200
+
+_stats_lock = threading.Lock()
+_stats = {"linear": {"emails": 0, "seconds": 0.0}, "heavy": {"emails": 0, "seconds": 0.0}}
+_warned_missing = False
+
+def in_band(probability, low=UNCERTAIN_LOW, high=UNCERTAIN_HIGH):
+    """True when a malicious probability is inside the uncertainty band"""
+    return low < probability < high
+
+def should_explain(prediction, probability, policy=EXPLAIN_POLICY):
+    """
+    Decide whether to generate an LLM explanation without being asked.
+
+    Args:
+        prediction (int): 1 for malicious, 0 for safe
+        probability (float): Probability of the email being malicious
+        policy (str): One of EXPLAIN_POLICIES
+
+    Returns:
+        bool: True to explain right away; otherwise only on demand
+    """
+    if policy == "always":
+        return True
+    if policy == "on_demand":
+        return False
+    return prediction == 1 or in_band(probability)
+
+
+class CascadeModel:
+    """
+    Linear first tier with the heavy model as the second tier for uncertain emails.
+
+    Args:
+        linear: Fitted logistic model (or its compact equivalent)
+        heavy: Fitted heavy model with the same classes
+        low, high (float): Uncertainty band on the linear malicious probability
+    """
+
+    def __init__(self, linear, heavy, low=UNCERTAIN_LOW, high=UNCERTAIN_HIGH):
+        if list(linear.classes_) != list(heavy.classes_):
+            raise ValueError("Cascade tiers must be trained on the same classes")
+        self.linear = linear
+        self.heavy = heavy
+        self.low = low
+        self.high = high
+        self.classes_ = heavy.classes_
+
+    def uncertain_rows(self, probabilities):
+        """Return the indices of rows the heavy model must rescore"""
+        malicious = probabilities[:, 1]
+        return np.flatnonzero((malicious > self.low) & (malicious < self.high))
+
+    def predict_proba(self, X):
+        started = time.perf_counter()
+        with metrics.span("cascade_tier", tier="linear"):
+            probabilities = self.linear.predict_proba(X)
+        linear_seconds = time.perf_counter() - started
+
+        rows = self.uncertain_rows(probabilities)
+        heavy_seconds = 0.0
+        if rows.size:
+            started = time.perf_counter()
+            with metrics.span("cascade_tier", tier="heavy"):
+                probabilities[rows] = self.heavy.predict_proba(X[rows])
+            heavy_seconds = time.perf_counter() - started
+
+        _record(X.shape[0], linear_seconds, rows.size, heavy_seconds)
+        return probabilities
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def _record(emails, linear_seconds, heavy_emails, heavy_seconds):
+    with _stats_lock:
+        _stats["linear"]["emails"] += emails
+        _stats["linear"]["seconds"] += linear_seconds
+        _stats["heavy"]["emails"] += heavy_emails
+        _stats["heavy"]["seconds"] += heavy_seconds
+        heavy = _stats["heavy"]
+        heavy_per_email = heavy["seconds"] / heavy["emails"] if heavy["emails"] else 0.0
+
+    metrics.increment("cascade_emails_total", emails, tier="linear")
+    if heavy_emails:
+        metrics.increment("cascade_emails_total", heavy_emails, tier="heavy")
+    metrics.increment("cascade_saved_seconds_total", (emails - heavy_emails) * heavy_per_email)
+
+def tier_stats():
+    """
+    Return how often each tier was reached in this process and the time saved.
+
+    Saved time is estimated as the emails answered by the linear tier times the
+    mean per-email cost of the heavy tier; evaluate() measures it directly.
+
+    Returns:
+        dict: Per tier 'emails', 'share' and 'seconds', plus 'estimated_saved_seconds'
+    """
+    with _stats_lock:
+        stats = {tier: dict(values) for tier, values in _stats.items()}
+    total = stats["linear"]["emails"]
+    for values in stats.values():
+        values["share"] = values["emails"] / total if total else 0.0
+    heavy = stats["heavy"]
+    heavy_per_email = heavy["seconds"] / heavy["emails"] if heavy["emails"] else 0.0
+    stats["estimated_saved_seconds"] = (total - heavy["emails"]) * heavy_per_email
+    return stats
+
+def reset_stats():
+    with _stats_lock:
+        for values in _stats.values():
+            values.update(emails=0, seconds=0.0)
+
+def wrap(heavy, linear, low=UNCERTAIN_LOW, high=UNCERTAIN_HIGH):
+    """Wrap the heavy classifier in a cascade with the linear model"""
+    return CascadeModel(linear, heavy, low, high)
+
+def cascade_version(version, low=UNCERTAIN_LOW, high=UNCERTAIN_HIGH):
+    """
+    Return the version of a cascade over the given artifacts.
+
+    Args:
+        version (str): Version of the heavy model, vectorizer and linear model
+    """
+    return f"{version}-cascade-{low:g}-{high:g}"
+
+def warn_linear_missing(error):
+    """Report once that the heavy model is served alone because the linear one is missing"""
+    global _warned_missing
+    if not _warned_missing:
+        print(f"Cascade disabled, linear model unavailable: {error}", file=sys.stderr)
+        _warned_missing = True
+
+
+# --- Evaluation --------------------------------------------------------------
+
+def _scores(labels, probabilities):
+    from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+
+    predictions = (probabilities > 0.5).astype(int)
+    return {
+        "accuracy": accuracy_score(labels, predictions),
+        "precision": precision_score(labels, predictions, zero_division=0),
+        "recall": recall_score(labels, predictions, zero_division=0),
+        "f1": f1_score(labels, predictions, zero_division=0),
+    }
+
+def _per_email_ms(predict_proba, X, rows):
+    """Mean milliseconds of predict_proba on one row at a time"""
+    started = time.perf_counter()
+    for row in rows:
+        predict_proba(X[row:row + 1])
+    return (time.perf_counter() - started) / max(len(rows), 1) * 1000
+
+def evaluate(texts, labels, bands=((UNCERTAIN_LOW, UNCERTAIN_HIGH),), timing_sample=DEFAULT_TIMING_SAMPLE):
+    """
+    Compare cascades against the always-heavy path on a labeled set.
+
+    Both tiers score every email once; each band's cascade probabilities are
+    then taken from the linear or heavy scores. Per-email latency is measured
+    on up to `timing_sample` emails, one at a time, for the heavy model and for
+    the first band's cascade.
+
+    Args:
+        texts (list of str): Raw email texts
+        labels (array-like): 0/1 labels
+        bands (sequence of (low, high)): Uncertainty bands to evaluate
+        timing_sample (int): Emails timed one at a time
+
+    Returns:
+        dict: 'heavy' and 'linear' scores and per-email ms, and one 'bands' row per band
+    """
+    from scripts.classical import _featurize_chunk
+    from scripts.registry import get_classifier_artifacts, get_linear_model
+
+    heavy, tfidf_vectorizer, _ = get_classifier_artifacts(cascade=False)
+    linear, _ = get_linear_model()
+    labels = np.asarray(labels).astype(int)
+
+    X, _, _ = _featurize_chunk(tfidf_vectorizer, texts)
+    heavy_probabilities = heavy.predict_proba(X)[:, 1]
+    linear_probabilities = linear.predict_proba(X)[:, 1]
+
+    sample = np.random.default_rng(0).permutation(X.shape[0])[:timing_sample]
+    heavy_ms = _per_email_ms(heavy.predict_proba, X, sample)
+    linear_ms = _per_email_ms(linear.predict_proba, X, sample)
+    heavy_scores = _scores(labels, heavy_probabilities)
+
+    rows = []
+    for index, (low, high) in enumerate(bands):
+        uncertain = (linear_probabilities > low) & (linear_probabilities < high)
+        scores = _scores(labels, np.where(uncertain, heavy_probabilities, linear_probabilities))
+        heavy_share = uncertain.mean()
+        row = {
+            "band": f"{low:g}-{high:g}",
+            "linear_share": 1.0,
+            "heavy_share": heavy_share,
+            **scores,
+            "f1_delta": scores["f1"] - heavy_scores["f1"],
+            "accuracy_delta": scores["accuracy"] - heavy_scores["accuracy"],
+            "estimated_ms": linear_ms + heavy_share * heavy_ms,
+            "measured_ms": None,
+        }
+        if index == 0:
+            cascade = CascadeModel(linear, heavy, low, high)
+            row["measured_ms"] = _per_email_ms(cascade.predict_proba, X, sample)
+        rows.append(row)
+
+    return {
+        "emails": len(labels),
+        "heavy": {**heavy_scores, "ms": heavy_ms},
+        "linear": {**_scores(labels, linear_probabilities), "ms": linear_ms},
+        "bands": rows,
+    }
+
+def _parse_bands(value):
+    bands = []
+    for band in value.split(","):
+        low, high = (float(bound) for bound in band.split(":"))
+        bands.append((low, high))
+    return bands
+
+def main(argv=None):
+    from scripts.train import RANDOM_STATE, TEST_SIZE, load_corpus, split_corpus
+
+    parser = argparse.ArgumentParser(description="Evaluate the model cascade on a labeled set")
+    parser.add_argument("--input", help="Labeled CSV the models were trained on (default: the Kaggle datasets)")
+    parser.add_argument("--all-rows", action="store_true",
+                        help="Evaluate every row of --input instead of its held-out split")
+    parser.add_argument("--test-size", type=float, default=TEST_SIZE, help="Held-out share used by scripts.train")
+    parser.add_argument("--random-state", type=int, default=RANDOM_STATE, help="Split seed used by scripts.train")
+    parser.add_argument("--text-field", default="body", help="CSV column with the email text")
+    parser.add_argument("--label-field", default="label", help="CSV column with the label")
+    parser.add_argument("--bands", default=f"{UNCERTAIN_LOW:g}:{UNCERTAIN_HIGH:g}",
+                        help="Comma-separated LOW:HIGH bands; the first is also timed end to end")
+    parser.add_argument("--timing-sample", type=int, default=DEFAULT_TIMING_SAMPLE,
+                        help="Emails timed one at a time")
+    args = parser.parse_args(argv)
+
+    if args.all_rows and not args.input:
+        parser.error("--all-rows needs an --input file that was held out of training")
+    texts, labels = load_corpus(args.input, args.text_field, args.label_field)
+    if not args.all_rows:
+        _, texts, _, labels = split_corpus(texts, labels, args.test_size, args.random_state)
+    result = evaluate(texts, labels, _parse_bands(args.bands), args.timing_sample)
+
+    print(f"{result['emails']:,} {'emails' if args.all_rows else 'held-out emails'}")
+    print(f"{'path':<16}{'heavy %':>9}{'accuracy':>10}{'F1':>8}{'ΔF1':>9}{'ms/email':>10}{'saved':>8}")
+    heavy_ms = result["heavy"]["ms"]
+    for name in ("heavy", "linear"):
+        scores = result[name]
+        print(
+            f"{name + ' only':<16}{100.0 if name == 'heavy' else 0.0:>8.1f}%{scores['accuracy']:>10.4f}"
+            f"{scores['f1']:>8.4f}{scores['f1'] - result['heavy']['f1']:>+9.4f}{scores['ms']:>10.3f}"
+            f"{1 - scores['ms'] / heavy_ms:>7.0%}"
+        )
+    for row in result["bands"]:
+        ms = row["measured_ms"] if row["measured_ms"] is not None else row["estimated_ms"]
+        print(
+            f"{'cascade ' + row['band']:<16}{row['heavy_share'] * 100:>8.1f}%{row['accuracy']:>10.4f}"
+            f"{row['f1']:>8.4f}{row['f1_delta']:>+9.4f}{ms:>10.3f}{1 - ms / heavy_ms:>7.0%}"
+            f"{'' if row['measured_ms'] is not None else '  (estimated)'}"
+        )
+
+if __name__ == "__main__":
+    main()
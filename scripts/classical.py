@@ -1,40 +1,192 @@
 from scripts.preprocess.clean_email import clean_email
-from scripts.preprocess.extract_features import extract_features
-import joblib
+from scripts.preprocess.extract_features import extract_features_batch, features_to_dict
+from scripts.preprocess.guard import guard_emails, guard_settings
+from scripts.preprocess.domains import domain_features, index_version
+from scripts.registry import get_classifier_artifacts
+from scripts.cache import classification_cache, make_key
+from scripts.train import PREPROCESSING_VERSION
+from scripts import metrics
+from itertools import islice
+import time
 import numpy as np
 from scipy.sparse import hstack
 
-def classify_email(email_text):
+# Number of emails vectorized and scored together in classify_emails
+DEFAULT_CHUNK_SIZE = 1000
+
+def _featurize_chunk(tfidf_vectorizer, email_texts):
+    """
+    Build the model input for a list of raw emails.
+
+    Returns:
+        tuple: (CSR matrix of TF-IDF and manual features, manual feature rows,
+            guarded email texts)
+    """
+    # Cap the size of untrusted bodies (guarded mode, on by default)
+    with metrics.span("guard"):
+        email_texts = guard_emails(email_texts)
+
+    # Extract manual features before cleaning
+    with metrics.span("extract_features"):
+        manual_features = extract_features_batch(email_texts)
+
+    # Clean emails for TF-IDF
+    with metrics.span("clean_email"):
+        email_texts_clean = [clean_email(text) for text in email_texts]
+    with metrics.span("tfidf_transform"):
+        email_tfidf = tfidf_vectorizer.transform(email_texts_clean)
+
+    # Combine features
+    return hstack([email_tfidf, manual_features], format="csr"), manual_features, email_texts
+
+def _predict_chunk(model, tfidf_vectorizer, email_texts):
+    """
+    Score a list of raw emails in one vectorized pass.
+
+    Returns:
+        tuple: (labels, malicious probabilities, manual feature rows) as numpy
+            arrays, and the guarded email texts
+    """
+    features_combined, manual_features, guarded_texts = _featurize_chunk(tfidf_vectorizer, email_texts)
+
+    # One probability pass; the label is the class with the highest probability,
+    # which is what predict() computes internally
+    with metrics.span("model_predict"):
+        probabilities = model.predict_proba(features_combined)
+    labels = model.classes_[np.argmax(probabilities, axis=1)]
+
+    return labels, probabilities[:, 1], manual_features, guarded_texts
+
+def _features_dict(guarded_text, row):
+    """Manual features of one email plus link domain signals, which the model does not score"""
+    features = features_to_dict(row)
+    # The text has already been through the guard in _featurize_chunk
+    features.update(domain_features(guarded_text))
+    return features
+
+def _update_stats(stats, total, elapsed):
+    if stats is not None:
+        stats["emails"] = total
+        stats["seconds"] = elapsed
+        stats["emails_per_sec"] = total / elapsed if elapsed > 0 else 0.0
+
+def classify_email(email_text, return_features=False):
     """
     Classifies an email as 'safe' or 'malicious'.
 
     Args:
         email_text (str): The raw email text to classify
+        return_features (bool): Also return the extract_features dict computed on the way
 
     Returns:
-        str: Classification result ('safe' or 'malicious')
+        tuple: (prediction array, probability of the email being malicious),
+            plus the features dict when return_features is True
     """
-    # Load model and vectorizer
-    model = joblib.load("models/malicious_email_classifier.pkl")
-    tfidf_vectorizer = joblib.load("models/tfidf_vectorizer.pkl")
+    # Model and vectorizer stay resident in the process-wide registry
+    model, tfidf_vectorizer, _ = get_classifier_artifacts()
 
-    # Extract manual features before cleaning
-    email_manual_features = extract_features(email_text)
-    email_manual_features_array = np.array([[
-        email_manual_features['num_links'],
-        email_manual_features['num_obfuscated'],
-        email_manual_features['urgency_score']
-    ]])
+    prediction, probability, manual_features, guarded_texts = _predict_chunk(model, tfidf_vectorizer, [email_text])
 
-    # Clean email for TF-IDF
-    email_text_clean = clean_email(email_text)
-    email_tfidf = tfidf_vectorizer.transform([email_text_clean])
+    if return_features:
+        return prediction, probability[0], _features_dict(guarded_texts[0], manual_features[0])
+    return prediction, probability[0]
 
-    # Combine features
-    email_features_combined = hstack([email_tfidf, email_manual_features_array])
+def classification_key(model_version, email_text):
+    """
+    Cache key of one verdict.
+
+    Combines the exact text with everything else the verdict depends on: the
+    model, the domain index, the guard settings and the preprocessing code.
+    """
+    return make_key(model_version, index_version(), guard_settings(), PREPROCESSING_VERSION, email_text)
+
+def classify_email_cached(email_text, cache=classification_cache):
+    """
+    Classifies an email, reusing the result for previously seen content.
 
-    # Predict and convert to text label
-    prediction = model.predict(email_features_combined)
-    probability = model.predict_proba(email_features_combined)[0][1]
+    The cache key (classification_key) combines the exact text with the loaded
+    model and domain index versions and the preprocessing settings, so changing
+    any of them invalidates old entries automatically.
+    Whitespace is not normalized: the guard's truncation and base64 stripping
+    depend on it, so reformatted copies can get different verdicts.
 
-    return prediction, probability
\ No newline at end of file
+    Args:
+        email_text (str): The raw email text to classify
+        cache (ResultCache): Cache to read and fill
+
+    Returns:
+        tuple: (prediction array, probability of the email being malicious, features dict)
+    """
+    _, _, model_version = get_classifier_artifacts()
+    key = classification_key(model_version, email_text)
+
+    cached = cache.get(key)
+    if cached is not None:
+        label, probability, features = cached
+        return np.array([label]), probability, features
+
+    prediction, probability, features = classify_email(email_text, return_features=True)
+    cache.set(key, [prediction[0].item(), float(probability), features])
+    return prediction, probability, features
+
+def classify_emails(email_texts, chunk_size=DEFAULT_CHUNK_SIZE, stats=None):
+    """
+    Classifies many emails, scoring them in fixed-size chunks.
+
+    Results are identical to calling classify_email on each text, but
+    vectorization and inference run once per chunk. Only one chunk is held
+    in memory at a time, so any iterable (including a generator) can be passed.
+
+    Args:
+        email_texts (iterable of str): Raw email texts to classify
+        chunk_size (int): Number of emails scored per pass
+        stats (dict, optional): Filled with 'emails', 'seconds' and 'emails_per_sec'
+
+    Yields:
+        tuple: (label, probability of the email being malicious) for each email, in order
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+
+    model, tfidf_vectorizer, _ = get_classifier_artifacts()
+
+    iterator = iter(email_texts)
+    total = 0
+    elapsed = 0.0
+    _update_stats(stats, total, elapsed)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            break
+
+        start = time.perf_counter()
+        labels, probabilities, _, _ = _predict_chunk(model, tfidf_vectorizer, chunk)
+        elapsed += time.perf_counter() - start
+        total += len(chunk)
+
+        _update_stats(stats, total, elapsed)
+
+        for label, probability in zip(labels.tolist(), probabilities.tolist()):
+            yield label, probability
+
+def classify_email_batch(email_texts, artifacts=None):
+    """
+    Classifies a list of emails in one vectorized pass.
+
+    Used by the scoring service to answer many concurrent requests at once.
+
+    Args:
+        email_texts (list of str): Raw email texts to classify
+        artifacts (tuple, optional): (model, tfidf_vectorizer, model_version) from
+            get_classifier_artifacts, so the caller knows which version scored the batch
+
+    Returns:
+        list: One (label, probability of the email being malicious, features dict)
+            tuple per email, in order
+    """
+    model, tfidf_vectorizer, _ = artifacts or get_classifier_artifacts()
+    labels, probabilities, manual_features, guarded_texts = _predict_chunk(model, tfidf_vectorizer, email_texts)
+    return [
+        (label, probability, _features_dict(text, row))
+        for text, label, probability, row in zip(guarded_texts, labels.tolist(), probabilities.tolist(), manual_features)
+    ]
@@ -0,0 +1,107 @@
+"""
+Thin client for the scoring service in scripts.service.
+
+The Streamlit app uses it instead of in-process inference when
+SALAIN_SERVICE_URL is set, e.g. SALAIN_SERVICE_URL=http://127.0.0.1:8080.
+"""
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+import numpy as np
+
+SERVICE_URL = os.getenv("SALAIN_SERVICE_URL") or None
+
+# Seconds to wait for a response
+DEFAULT_TIMEOUT = float(os.getenv("SALAIN_SERVICE_TIMEOUT", "30"))
+# Retries after a 503 from an overloaded service
+MAX_RETRIES = 2
+
+
+class ServiceError(RuntimeError):
+    def __init__(self, status, message):
+        super().__init__(f"Scoring service returned {status}: {message}")
+        self.status = status
+
+
+class ServiceClient:
+    def __init__(self, base_url, timeout=DEFAULT_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.model_version = None
+
+    def _request(self, method, path, body=None, content_type="application/json"):
+        for attempt in range(MAX_RETRIES + 1):
+            request = urllib.request.Request(self.base_url + path, data=body, method=method)
+            if body is not None:
+                request.add_header("Content-Type", content_type)
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    return json.loads(response.read())
+            except urllib.error.HTTPError as e:
+                if e.code == 503 and attempt < MAX_RETRIES:
+                    time.sleep(float(e.headers.get("Retry-After", "1")))
+                    continue
+                try:
+                    message = json.loads(e.read()).get("error", e.reason)
+                except ValueError:
+                    message = e.reason
+                raise ServiceError(e.code, message)
+
+    def _post_json(self, path, payload):
+        return self._request("POST", path, json.dumps(payload).encode("utf-8"))
+
+    def classify(self, text):
+        """
+        Classify one email on the service.
+
+        Returns:
+            dict: 'prediction', 'label', 'probability', 'features' and 'model_version'
+        """
+        result = self._post_json("/classify", {"text": text})
+        self.model_version = result["model_version"]
+        return result
+
+    def classify_many(self, texts):
+        """Classify several emails; returns one result dict per text, in order"""
+        return self._post_json("/classify", {"texts": list(texts)})["results"]
+
+    def classify_email(self, text):
+        """
+        Drop-in replacement for scripts.classical.classify_email_cached.
+
+        Returns:
+            tuple: (prediction array, probability of the email being malicious, features dict)
+        """
+        result = self.classify(text)
+        return np.array([result["prediction"]]), result["probability"], result["features"]
+
+    def explain(self, text, prediction=None, confidence=None, features=None):
+        """
+        Ask the service for an explanation of a classification.
+
+        Returns:
+            dict: 'explanation', whether the 'fallback' was used, and 'timings'
+        """
+        payload = {"text": text}
+        if prediction is not None:
+            payload.update(prediction=int(prediction), confidence=float(confidence), features=features)
+        return self._post_json("/explain", payload)
+
+    def ocr(self, image_bytes):
+        """Extract text from an encoded image (PNG/JPEG bytes)"""
+        return self._request("POST", "/ocr", image_bytes, "application/octet-stream")["text"]
+
+    def health(self):
+        return self._request("GET", "/healthz")
+
+
+_client = None
+
+def get_service_client():
+    """Return a client for SALAIN_SERVICE_URL, or None to run inference in-process"""
+    global _client
+    if SERVICE_URL and _client is None:
+        _client = ServiceClient(SERVICE_URL)
+    return _client
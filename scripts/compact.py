@@ -0,0 +1,448 @@
+"""
+Compact, memory-mapped inference artifacts.
+
+Converts the pickled TF-IDF vectorizer and classifier into plain .npy arrays
+plus a small JSON header:
+
+    vectorizer.json     analyzer parameters and array metadata
+    vocab.npy           vocabulary terms as UTF-8 bytes, sorted
+    term_index.npy      TF-IDF column of each sorted term
+    idf.npy             IDF weight per column
+    model.json          model type, classes and array metadata
+    tree_*.npy          LightGBM trees flattened into node arrays
+    coef.npy            linear model coefficients (and intercept.npy)
+
+The loaders open every array with np.load(mmap_mode="r"), so the pages are
+shared through the OS page cache by every process that serves the model instead
+of each process unpickling its own vocabulary dict and booster. Outputs are
+bit-for-bit identical to the joblib artifacts.
+
+Usage:
+    python -m scripts.compact                       # models/*.pkl -> models/compact/
+    python -m scripts.compact --model models/logreg.pkl --output models/compact_logreg
+    python -m scripts.compact --verify              # compare against the pickles on test.py
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+import numpy as np
+from scipy.sparse import csr_matrix
+
+COMPACT_DIR = "models/compact"
+FORMAT_VERSION = 1
+
+# LightGBM missing-value handling, as encoded in dump_model()
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+_MISSING_TYPES = {"None": MISSING_NONE, "Zero": MISSING_ZERO, "NaN": MISSING_NAN}
+# LightGBM treats |x| <= kZeroThreshold (a float32 constant) as zero
+_ZERO_THRESHOLD = float(np.float32(1e-35))
+
+# Vectorizer parameters needed to rebuild the analyzer
+_ANALYZER_PARAMS = (
+    "analyzer", "lowercase", "strip_accents", "token_pattern", "ngram_range",
+    "stop_words", "binary", "norm", "use_idf", "smooth_idf", "sublinear_tf", "dtype",
+)
+
+
+# --- Export ------------------------------------------------------------------
+
+def save_array(directory, name, array, digest):
+    """
+    Write one .npy atomically and fold its bytes into the artifact digest.
+
+    Shared by every memory-mapped artifact (also the domain index), so they
+    are written and versioned the same way.
+    """
+    path = os.path.join(directory, name)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(array))
+    os.replace(tmp_path, path)
+    digest.update(name.encode())
+    digest.update(np.ascontiguousarray(array).tobytes())
+
+def save_header(directory, name, header):
+    """Write an artifact's JSON header atomically; write it after every array"""
+    # The registry watches this file, so a reload only sees complete arrays
+    path = os.path.join(directory, name)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(header, f, indent=1)
+    os.replace(tmp_path, path)
+
+def export_vectorizer(vectorizer, directory):
+    """Write a fitted TfidfVectorizer as vocab.npy, term_index.npy, idf.npy and vectorizer.json"""
+    if vectorizer.preprocessor is not None or vectorizer.tokenizer is not None or callable(vectorizer.analyzer):
+        raise ValueError("Custom preprocessors, tokenizers and analyzers cannot be exported")
+
+    params = {name: getattr(vectorizer, name) for name in _ANALYZER_PARAMS}
+    params["ngram_range"] = list(params["ngram_range"])
+    params["dtype"] = np.dtype(params["dtype"]).name
+    if params["stop_words"] is not None and not isinstance(params["stop_words"], str):
+        params["stop_words"] = sorted(params["stop_words"])
+
+    terms = sorted((term.encode("utf-8"), index) for term, index in vectorizer.vocabulary_.items())
+    vocab = np.array([term for term, _ in terms])
+    term_index = np.array([index for _, index in terms], dtype=np.int32)
+
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    save_array(directory, "vocab.npy", vocab, digest)
+    save_array(directory, "term_index.npy", term_index, digest)
+    save_array(directory, "idf.npy", np.asarray(vectorizer.idf_, dtype=np.float64), digest)
+    save_header(directory, "vectorizer.json", {
+        "format": FORMAT_VERSION,
+        "params": params,
+        "n_features": len(vectorizer.vocabulary_),
+        "sha256": digest.hexdigest(),
+    })
+
+def _flatten_tree(structure, nodes):
+    """
+    Append the nodes of one dumped LightGBM tree and return the index of its root.
+
+    Leaves become nodes whose children point at themselves, so every row can
+    take the same number of steps through a tree.
+    """
+    root = len(nodes["feature"])
+    stack = [(structure, None, None)]
+    while stack:
+        node, parent, side = stack.pop()
+        index = len(nodes["feature"])
+        if parent is not None:
+            nodes[side][parent] = index
+
+        if "leaf_value" in node:
+            if "leaf_coeff" in node:
+                raise ValueError("Linear trees are not supported")
+            nodes["feature"].append(0)
+            nodes["threshold"].append(0.0)
+            nodes["left"].append(index)
+            nodes["right"].append(index)
+            nodes["missing_type"].append(MISSING_NONE)
+            nodes["default_left"].append(False)
+            nodes["value"].append(node["leaf_value"])
+            continue
+
+        if node["decision_type"] != "<=":
+            raise ValueError("Categorical splits are not supported")
+        nodes["feature"].append(node["split_feature"])
+        nodes["threshold"].append(node["threshold"])
+        nodes["left"].append(-1)
+        nodes["right"].append(-1)
+        nodes["missing_type"].append(_MISSING_TYPES[node["missing_type"]])
+        nodes["default_left"].append(node["default_left"])
+        nodes["value"].append(0.0)
+        stack.append((node["right_child"], index, "right"))
+        stack.append((node["left_child"], index, "left"))
+    return root
+
+def _tree_depth(structure):
+    depth, stack = 0, [(structure, 0)]
+    while stack:
+        node, level = stack.pop()
+        depth = max(depth, level)
+        if "leaf_value" not in node:
+            stack.append((node["left_child"], level + 1))
+            stack.append((node["right_child"], level + 1))
+    return depth
+
+def export_lightgbm(model, directory):
+    """Write a binary LGBMClassifier as flattened tree arrays"""
+    # Defaults to the best iteration, like predict_proba
+    dump = model.booster_.dump_model()
+    objective = dump["objective"].split()
+    if objective[0] != "binary" or dump["num_tree_per_iteration"] != 1 or dump["average_output"]:
+        raise ValueError(f"Only binary boosted models can be exported, not '{dump['objective']}'")
+    sigmoid = 1.0
+    for option in objective[1:]:
+        if option.startswith("sigmoid:"):
+            sigmoid = float(option.split(":", 1)[1])
+
+    nodes = {key: [] for key in ("feature", "threshold", "left", "right", "missing_type", "default_left", "value")}
+    roots = [_flatten_tree(tree["tree_structure"], nodes) for tree in dump["tree_info"]]
+    depth = max((_tree_depth(tree["tree_structure"]) for tree in dump["tree_info"]), default=0)
+
+    # Trees only read a few columns; store them as positions in used_features
+    used_features = np.unique(np.array(nodes["feature"], dtype=np.int32))
+    feature = np.searchsorted(used_features, np.array(nodes["feature"], dtype=np.int32)).astype(np.int32)
+
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    save_array(directory, "tree_roots.npy", np.array(roots, dtype=np.int32), digest)
+    save_array(directory, "tree_used_features.npy", used_features, digest)
+    save_array(directory, "tree_feature.npy", feature, digest)
+    save_array(directory, "tree_threshold.npy", np.array(nodes["threshold"], dtype=np.float64), digest)
+    save_array(directory, "tree_left.npy", np.array(nodes["left"], dtype=np.int32), digest)
+    save_array(directory, "tree_right.npy", np.array(nodes["right"], dtype=np.int32), digest)
+    save_array(directory, "tree_missing_type.npy", np.array(nodes["missing_type"], dtype=np.int8), digest)
+    save_array(directory, "tree_default_left.npy", np.array(nodes["default_left"], dtype=bool), digest)
+    save_array(directory, "tree_value.npy", np.array(nodes["value"], dtype=np.float64), digest)
+    save_header(directory, "model.json", {
+        "format": FORMAT_VERSION,
+        "type": "lightgbm",
+        "classes": model.classes_.tolist(),
+        "n_features": int(model.n_features_in_),
+        "sigmoid": sigmoid,
+        "depth": depth,
+        "sha256": digest.hexdigest(),
+    })
+
+def export_linear(model, directory):
+    """Write a fitted LogisticRegression as coefficient arrays"""
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    save_array(directory, "coef.npy", np.asarray(model.coef_, dtype=np.float64), digest)
+    save_array(directory, "intercept.npy", np.asarray(model.intercept_, dtype=np.float64), digest)
+    save_header(directory, "model.json", {
+        "format": FORMAT_VERSION,
+        "type": "linear",
+        "classes": model.classes_.tolist(),
+        "n_features": int(model.n_features_in_),
+        "params": {key: value for key, value in model.get_params().items()
+                   if isinstance(value, (str, int, float, bool, type(None)))},
+        "sha256": digest.hexdigest(),
+    })
+
+def export_model(model, directory):
+    """Write a fitted classifier in the compact format"""
+    if hasattr(model, "booster_"):
+        export_lightgbm(model, directory)
+    elif hasattr(model, "coef_"):
+        export_linear(model, directory)
+    else:
+        raise ValueError(f"Cannot export {type(model).__name__}")
+
+
+# --- Loading -----------------------------------------------------------------
+
+def _load_array(directory, name):
+    return np.load(os.path.join(directory, name), mmap_mode="r")
+
+class CompactVectorizer:
+    """
+    TF-IDF transform over a memory-mapped, sorted vocabulary.
+
+    Terms are looked up with one vectorized binary search per batch instead of
+    a Python dict. The analyzer, counting and normalization follow
+    TfidfVectorizer.transform step for step, so the output matrix is identical.
+    """
+
+    def __init__(self, directory, header):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.preprocessing import normalize
+
+        params = dict(header["params"])
+        params["ngram_range"] = tuple(params["ngram_range"])
+        params["dtype"] = np.dtype(params["dtype"]).type
+        if isinstance(params["stop_words"], list):
+            params["stop_words"] = frozenset(params["stop_words"])
+        self.params = params
+        self._analyze = TfidfVectorizer(**params).build_analyzer()
+        self._normalize = normalize
+
+        self.n_features = header["n_features"]
+        self.vocab = _load_array(directory, "vocab.npy")
+        self.term_index = _load_array(directory, "term_index.npy")
+        self.idf = _load_array(directory, "idf.npy")
+        self._width = self.vocab.dtype.itemsize
+
+    def _lookup(self, terms):
+        """Return the column of each term, or -1 for terms outside the vocabulary"""
+        columns = np.full(len(terms), -1, dtype=np.int64)
+        if not terms or not len(self.vocab):
+            return columns
+        encoded = [term.encode("utf-8") for term in terms]
+        # Longer terms cannot be in the vocabulary, and numpy would truncate them to fit
+        fits = np.fromiter((len(term) <= self._width for term in encoded), dtype=bool, count=len(encoded))
+        candidates = np.array([term for term, ok in zip(encoded, fits) if ok], dtype=self.vocab.dtype)
+        positions = np.searchsorted(self.vocab, candidates)
+        positions[positions == len(self.vocab)] = 0
+        found = self.vocab[positions] == candidates
+        fit_columns = np.full(len(candidates), -1, dtype=np.int64)
+        fit_columns[found] = self.term_index[positions[found]]
+        columns[fits] = fit_columns
+        return columns
+
+    def transform(self, raw_documents):
+        if isinstance(raw_documents, str):
+            raise ValueError("Iterable over raw text documents expected, string object received.")
+
+        documents = [self._analyze(doc) for doc in raw_documents]
+        columns = self._lookup([term for terms in documents for term in terms])
+
+        indptr = [0]
+        indices = []
+        counts = []
+        start = 0
+        for terms in documents:
+            doc_columns = columns[start:start + len(terms)]
+            start += len(terms)
+            doc_columns, doc_counts = np.unique(doc_columns[doc_columns >= 0], return_counts=True)
+            indices.append(doc_columns)
+            counts.append(doc_counts)
+            indptr.append(indptr[-1] + len(doc_columns))
+
+        X = csr_matrix(
+            (
+                np.concatenate(counts).astype(self.params["dtype"]) if counts else np.zeros(0),
+                np.concatenate(indices).astype(np.int32) if indices else np.zeros(0, dtype=np.int32),
+                np.array(indptr, dtype=np.int32),
+            ),
+            shape=(len(documents), self.n_features),
+        )
+        if self.params["binary"]:
+            X.data.fill(1)
+        if self.params["sublinear_tf"]:
+            np.log(X.data, X.data)
+            X.data += 1.0
+        if self.params["use_idf"]:
+            X.data *= self.idf[X.indices]
+        if self.params["norm"] is not None:
+            X = self._normalize(X, norm=self.params["norm"], copy=False)
+        return X
+
+class CompactTreeModel:
+    """
+    Binary LightGBM model evaluated from memory-mapped node arrays.
+
+    All rows walk all trees at once, one level per step. Leaf values are summed
+    in tree order and passed through math.exp, as LightGBM does in C++, so the
+    probabilities match predict_proba exactly.
+    """
+
+    # Rows densified at a time (only the columns the trees read)
+    ROW_BLOCK = 512
+
+    def __init__(self, directory, header):
+        self.classes_ = np.array(header["classes"])
+        self.n_features_in_ = header["n_features"]
+        self.sigmoid = header["sigmoid"]
+        self.depth = header["depth"]
+        self.roots = _load_array(directory, "tree_roots.npy")
+        self.used_features = _load_array(directory, "tree_used_features.npy")
+        self.feature = _load_array(directory, "tree_feature.npy")
+        self.threshold = _load_array(directory, "tree_threshold.npy")
+        self.left = _load_array(directory, "tree_left.npy")
+        self.right = _load_array(directory, "tree_right.npy")
+        self.missing_type = _load_array(directory, "tree_missing_type.npy")
+        self.default_left = _load_array(directory, "tree_default_left.npy")
+        self.value = _load_array(directory, "tree_value.npy")
+
+    def _raw_scores(self, dense):
+        rows = np.arange(len(dense))[:, None]
+        nodes = np.broadcast_to(np.asarray(self.roots), (len(dense), len(self.roots))).copy()
+        for _ in range(self.depth):
+            values = dense[rows, self.feature[nodes]]
+            missing_type = self.missing_type[nodes]
+            is_nan = np.isnan(values)
+            values = np.where(is_nan & (missing_type != MISSING_NAN), 0.0, values)
+            is_missing = (
+                ((missing_type == MISSING_ZERO) & (values > -_ZERO_THRESHOLD) & (values <= _ZERO_THRESHOLD))
+                | ((missing_type == MISSING_NAN) & is_nan)
+            )
+            go_left = np.where(is_missing, self.default_left[nodes], values <= self.threshold[nodes])
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        # cumsum adds in tree order, like LightGBM's sequential accumulation
+        return np.cumsum(self.value[nodes], axis=1)[:, -1] if len(self.roots) else np.zeros(len(dense))
+
+    def predict_proba(self, X):
+        X = csr_matrix(X)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has {X.shape[1]} features, but the model expects {self.n_features_in_}")
+
+        positive = np.empty(X.shape[0])
+        used = np.asarray(self.used_features)
+        for start in range(0, X.shape[0], self.ROW_BLOCK):
+            dense = X[start:start + self.ROW_BLOCK][:, used].toarray()
+            raw = self._raw_scores(dense)
+            positive[start:start + len(raw)] = [1.0 / (1.0 + math.exp(-self.sigmoid * score)) for score in raw]
+        return np.vstack((1.0 - positive, positive)).transpose()
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+def _linear_model(directory, header):
+    """Rebuild a LogisticRegression around memory-mapped coefficients"""
+    from sklearn.linear_model import LogisticRegression
+
+    model = LogisticRegression(**header["params"])
+    model.coef_ = _load_array(directory, "coef.npy")
+    model.intercept_ = _load_array(directory, "intercept.npy")
+    model.classes_ = np.array(header["classes"])
+    model.n_features_in_ = header["n_features"]
+    return model
+
+def load_compact(header_path):
+    """
+    Load a compact artifact from its JSON header (vectorizer.json or model.json).
+
+    Used as the ArtifactRegistry loader for compact artifacts.
+    """
+    with open(header_path) as f:
+        header = json.load(f)
+    if header.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported compact artifact format in {header_path}")
+
+    directory = os.path.dirname(header_path)
+    if os.path.basename(header_path) == "vectorizer.json":
+        return CompactVectorizer(directory, header)
+    if header["type"] == "lightgbm":
+        return CompactTreeModel(directory, header)
+    if header["type"] == "linear":
+        return _linear_model(directory, header)
+    raise ValueError(f"Unknown compact model type '{header['type']}'")
+
+
+# --- CLI ---------------------------------------------------------------------
+
+def verify(model_path, vectorizer_path, directory, texts):
+    """Return the number of texts whose compact output differs from the joblib artifacts"""
+    import joblib
+    from scipy.sparse import hstack
+    from scripts.preprocess.clean_email import clean_email
+    from scripts.preprocess.extract_features import extract_features_batch
+
+    cleaned = [clean_email(text) for text in texts]
+    features = extract_features_batch(texts)
+    outputs = []
+    for model, vectorizer in (
+        (joblib.load(model_path), joblib.load(vectorizer_path)),
+        (load_compact(os.path.join(directory, "model.json")), load_compact(os.path.join(directory, "vectorizer.json"))),
+    ):
+        tfidf = vectorizer.transform(cleaned)
+        outputs.append((tfidf, model.predict_proba(hstack([tfidf, features], format="csr"))))
+
+    (tfidf, proba), (compact_tfidf, compact_proba) = outputs
+    tfidf.sort_indices()
+    mismatched_tfidf = (tfidf != compact_tfidf).max(axis=1).toarray().ravel()
+    mismatched_proba = (proba != compact_proba).any(axis=1)
+    return int(np.count_nonzero(mismatched_tfidf | mismatched_proba))
+
+def main(argv=None):
+    from scripts.registry import MODEL_PATH, VECTORIZER_PATH
+
+    parser = argparse.ArgumentParser(description="Export model artifacts as memory-mappable arrays")
+    parser.add_argument("--model", default=MODEL_PATH, help="Pickled classifier")
+    parser.add_argument("--vectorizer", default=VECTORIZER_PATH, help="Pickled TF-IDF vectorizer")
+    parser.add_argument("--output", default=COMPACT_DIR, help="Output directory")
+    parser.add_argument("--verify", action="store_true", help="Check outputs against the pickles on test.py")
+    args = parser.parse_args(argv)
+
+    import joblib
+    export_vectorizer(joblib.load(args.vectorizer), args.output)
+    export_model(joblib.load(args.model), args.output)
+    print(f"Wrote compact artifacts to {args.output}")
+
+    if args.verify:
+        from test import synthetic_labeld_emails
+        mismatches = verify(args.model, args.vectorizer, args.output, list(synthetic_labeld_emails))
+        print(f"{mismatches} of {len(synthetic_labeld_emails)} emails differ from the joblib artifacts")
+        if mismatches:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,71 +1,307 @@
 # scripts/llm_explainer.py
-from langchain_anthropic import ChatAnthropic
-from langchain.schema import HumanMessage, SystemMessage
+# langchain and the Anthropic client are imported on first use, not at app startup
+from scripts.cache import ResultCache, DEFAULT_DB_PATH, make_key, normalize_text
+from scripts.preprocess.clean_email import clean_email
+from scripts.preprocess.guard import guard_if_enabled
+from scripts import metrics
+from concurrent.futures import ThreadPoolExecutor
 import hashlib
 import os
+import queue
+import threading
+import time
 import streamlit as st
 
+# Width of the confidence buckets used in explanation cache keys
+CONFIDENCE_BUCKET = 0.05
+# Bump when the explanation prompt changes so cached explanations are regenerated
+PROMPT_VERSION = 1
+LLM_MODEL = "claude-3-haiku-20240307"
+
+# Shared by every session; persisted alongside the classification cache when configured
+explanation_cache = ResultCache(
+    "llm_explanations",
+    max_entries=int(os.getenv("SALAIN_LLM_CACHE_SIZE", "512")),
+    db_path=DEFAULT_DB_PATH,
+)
+
+# Seconds to wait for the first streamed token before showing the fallback explanation
+LLM_DEADLINE = float(os.getenv("SALAIN_LLM_DEADLINE", "3.0"))
+# Seconds to wait for each later token before cutting the explanation short
+LLM_TOKEN_TIMEOUT = float(os.getenv("SALAIN_LLM_TOKEN_TIMEOUT", "5.0"))
+TRUNCATED_NOTICE = "\n\n*The explanation was cut short because the model stopped responding.*"
+
+_llm = None
+# Set when set_llm_backend replaces the configured model
+_llm_name = None
+_llm_lock = threading.Lock()
+
+# Runs streamed LLM calls, which may outlive the request that started them. The
+# calls wait on the network, so more workers than cores is fine; concurrent
+# sessions beyond this many queue and may get the fallback at the deadline
+LLM_WORKERS = int(os.getenv("SALAIN_LLM_WORKERS", "4"))
+_background = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm-explanation")
+# Calls running or queued on _background; further requests get the fallback at once
+LLM_MAX_PENDING = int(os.getenv("SALAIN_LLM_MAX_PENDING", str(LLM_WORKERS * 4)))
+_pending = threading.BoundedSemaphore(LLM_MAX_PENDING)
+_END_OF_STREAM = object()
+
+class _StubResponse:
+    def __init__(self, content):
+        self.content = content
+
+class StubLLM:
+    """
+    Offline stand-in for the chat model, for tests and benchmarks.
+
+    Returns a deterministic explanation after an optional simulated latency.
+    Select it with SALAIN_LLM_BACKEND=stub or set_llm_backend(StubLLM()).
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return _StubResponse(self._text(messages))
+
+    def stream(self, messages):
+        self.calls += 1
+        words = self._text(messages).split(" ")
+        for i, word in enumerate(words):
+            if self.latency:
+                time.sleep(self.latency / len(words))
+            yield _StubResponse(word if i == len(words) - 1 else word + " ")
+
+    def _text(self, messages):
+        digest = hashlib.md5(messages[-1].content.encode()).hexdigest()[:8]
+        return (
+            "- Stub explanation generated offline\n"
+            f"- Prompt fingerprint: {digest}\n"
+        )
+
+def _create_llm():
+    if os.getenv("SALAIN_LLM_BACKEND", "anthropic") == "stub":
+        return StubLLM(latency=float(os.getenv("SALAIN_LLM_STUB_LATENCY", "0")))
+    from langchain_anthropic import ChatAnthropic
+    return ChatAnthropic(
+        temperature=0.2,
+        model=LLM_MODEL,
+        anthropic_api_key=st.secrets.get("ANTHROPIC_API_KEY", os.getenv("ANTHROPIC_API_KEY"))
+    )
+
+def get_llm():
+    """Return the process-wide chat model, creating it on first use"""
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                _llm = _create_llm()
+    return _llm
+
+def set_llm_backend(llm):
+    """Replace the chat model used for explanations (e.g. with StubLLM); None resets it"""
+    global _llm, _llm_name
+    with _llm_lock:
+        _llm = llm
+        _llm_name = None if llm is None else f"{type(llm).__name__}:{getattr(llm, 'model', '')}"
+
+def llm_name():
+    """Backend and model that write explanations, without creating the client"""
+    if _llm_name is not None:
+        return _llm_name
+    backend = os.getenv("SALAIN_LLM_BACKEND", "anthropic")
+    return backend if backend == "stub" else f"{backend}:{LLM_MODEL}"
+
+def explanation_cache_key(text, prediction, confidence, features=None):
+    """
+    Key explanations on cleaned content, a rounded confidence and the prompt inputs.
+
+    Cleaning drops URLs, addresses and punctuation, so campaign copies that differ
+    only in tracking links or recipients share one explanation. The prompt
+    version, the model and the signals listed in the prompt are part of the key,
+    so changing any of them regenerates the explanation.
+    """
+    bucket = round(confidence / CONFIDENCE_BUCKET)
+    return make_key(
+        PROMPT_VERSION, llm_name(), normalize_text(clean_email(guard_if_enabled(text))),
+        int(prediction), bucket, describe_features(features),
+    )
+
+def describe_features(features):
+    """Return 'name: value' for each signal that fired, skipping zero counts and flags"""
+    return [f"{key}: {value}" for key, value in (features or {}).items() if value]
+
+def build_explanation_messages(text, prediction, confidence, features=None):
+    """Return the chat messages asking the LLM to explain a classification"""
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    # Drop base64 blobs first so they do not fill the truncated excerpt
+    text = guard_if_enabled(text)
+
+    # Prepare prompts
+    system_prompt = """You are a cybersecurity expert explaining email classification results. 
+    Provide clear, concise explanations in bullet points. Use simple language for non-experts. 
+    """
+
+    # Only signals that fired; a list of zero counts reads as a list of red flags
+    feature_text = ", ".join(describe_features(features)) or "None detected"
+
+    user_prompt = f"""
+    Email Content: {text[:3000]}  # Truncate to avoid context limits
+    Classification: {'Malicious' if prediction == 1 else 'Safe'}
+    Confidence: {confidence:.2%}
+    Key Features: {feature_text}
+    
+    No need to include pleasantries like 'thank you' or 'nice question' in your response. 
+    Directly explain this classification to a non-technical user. Highlight 3-5 main reasons.
+    For malicious classifications, list red flags. For safe emails, explain positive indicators.
+    """
+
+    return [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=user_prompt)
+    ]
+
 def generate_llm_explanation(text, prediction, confidence, features=None):
     """Generate natural language explanation using LLM."""
-    # Create cache key based on inputs to avoid redundant API calls
-    cache_key = hashlib.md5(f"{text}{prediction}{confidence}".encode()).hexdigest()
-    
-    # Try to get cached response
-    if cache_key in st.session_state:
-        return st.session_state[cache_key]
-    
-    # Initialize LLM - Choose one approach below
+    # Reuse explanations across sessions to avoid redundant API calls
+    cache_key = explanation_cache_key(text, prediction, confidence, features)
+    cached = explanation_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        # Option 1: OpenAI (requires API key)
-        llm = ChatAnthropic(
-            temperature=0.2,
-            model="claude-3-haiku-20240307",
-            anthropic_api_key=st.secrets.get("ANTHROPIC_API_KEY", os.getenv("ANTHROPIC_API_KEY"))
-        )
+        llm = get_llm()
 
-        # Prepare prompts
-        system_prompt = """You are a cybersecurity expert explaining email classification results. 
-        Provide clear, concise explanations in bullet points. Use simple language for non-experts. 
-        """
-
-        # Format features for display
-        feature_text = "None detected"
-        if features:
-            feature_text = ", ".join([f"{k}" for k in features.keys()])
-
-        user_prompt = f"""
-        Email Content: {text[:3000]}  # Truncate to avoid context limits
-        Classification: {'Malicious' if prediction == 1 else 'Safe'}
-        Confidence: {confidence:.2%}
-        Key Features: {feature_text}
-        
-        No need to include pleasantries like 'thank you' or 'nice question' in your response. 
-        Directly explain this classification to a non-technical user. Highlight 3-5 main reasons.
-        For malicious classifications, list red flags. For safe emails, explain positive indicators.
-        """
-        
         # Generate response
-        response = llm([
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt)
-        ])
+        with metrics.span("llm_explanation"):
+            response = llm.invoke(build_explanation_messages(text, prediction, confidence, features))
         explanation = response.content
         
         # Cache the response
-        st.session_state[cache_key] = explanation
+        explanation_cache.set(cache_key, explanation)
         return explanation
         
     except Exception as e:
+        metrics.increment("llm_failures_total")
         st.error(f"Explanation generation failed: {str(e)}")
         return "Could not generate explanation at this time."
 
+def _stream_to_queue(messages, cache_key, chunks):
+    """Run a streaming LLM call, forwarding chunks and caching the full text"""
+    try:
+        parts = []
+        for chunk in get_llm().stream(messages):
+            if chunk.content:
+                parts.append(chunk.content)
+                chunks.put(chunk.content)
+        explanation_cache.set(cache_key, "".join(parts))
+        chunks.put(_END_OF_STREAM)
+    except Exception as e:
+        metrics.increment("llm_failures_total")
+        chunks.put(e)
+    finally:
+        _pending.release()
+
+def stream_llm_explanation(text, prediction, confidence, features=None, deadline=None, timings=None,
+                           token_timeout=None):
+    """
+    Stream an LLM explanation, falling back to a canned one if it is too slow.
+
+    The LLM call runs on a background thread. If no token arrives within
+    `deadline` seconds (or the call fails first), the fallback explanation is
+    yielded instead. It is also yielded straight away when LLM_MAX_PENDING calls
+    are already running or queued. If the stream then stalls for `token_timeout` seconds
+    between tokens, or fails, a truncation notice is yielded and streaming stops.
+    A slow call is left to finish in the background so the cache is warm for the
+    next request.
+
+    Args:
+        text (str): Email text
+        prediction (int): Predicted label
+        confidence (float): Probability of the email being malicious
+        features (dict, optional): Manual features for the prompt and fallback
+        deadline (float, optional): Seconds to wait for the first token
+        timings (dict, optional): Filled with 'first_token' and 'total' seconds
+            and whether the 'fallback' was used or the stream was 'truncated'
+        token_timeout (float, optional): Seconds to wait for each later token
+
+    Yields:
+        str: Explanation text chunks
+    """
+    started = time.perf_counter()
+    deadline = LLM_DEADLINE if deadline is None else deadline
+    token_timeout = LLM_TOKEN_TIMEOUT if token_timeout is None else token_timeout
+    timings = {} if timings is None else timings
+    timings["fallback"] = False
+    timings["truncated"] = False
+
+    def _mark(key):
+        if key not in timings:
+            timings[key] = time.perf_counter() - started
+            metrics.observe(f"llm_{key}_seconds", timings[key])
+
+    cache_key = explanation_cache_key(text, prediction, confidence, features)
+    cached = explanation_cache.get(cache_key)
+    if cached is not None:
+        _mark("first_token")
+        yield cached
+        _mark("total")
+        return
+
+    chunks = queue.Queue()
+    messages = build_explanation_messages(text, prediction, confidence, features)
+    if _pending.acquire(blocking=False):
+        _background.submit(_stream_to_queue, messages, cache_key, chunks)
+        try:
+            chunk = chunks.get(timeout=deadline)
+        except queue.Empty:
+            chunk = TimeoutError(f"No explanation within {deadline:.1f}s")
+    else:
+        metrics.increment("llm_rejected_total")
+        chunk = RuntimeError(f"{LLM_MAX_PENDING} explanations already pending")
+
+    while True:
+        if isinstance(chunk, Exception) and "first_token" in timings:
+            # Part of the explanation is already shown; end it like a stalled stream
+            timings["truncated"] = True
+            timings["error"] = str(chunk)
+            metrics.increment("llm_truncated_total")
+            yield TRUNCATED_NOTICE
+            break
+        if isinstance(chunk, Exception):
+            timings["fallback"] = True
+            timings["error"] = str(chunk)
+            metrics.increment("llm_fallbacks_total")
+            _mark("first_token")
+            yield get_fallback_explanation(prediction, features)
+            break
+        if chunk is _END_OF_STREAM:
+            break
+        _mark("first_token")
+        yield chunk
+        try:
+            chunk = chunks.get(timeout=token_timeout)
+        except queue.Empty:
+            timings["truncated"] = True
+            metrics.increment("llm_truncated_total")
+            yield TRUNCATED_NOTICE
+            break
+
+    _mark("total")
+
 def get_fallback_explanation(prediction, features):
     """Generate a simple explanation without LLM when API access fails."""
     if prediction == 1:
         explanation = "## Potential Warning Signs:\n\n"
-        if features:
-            for key, value in features.items():
-                explanation += f"- {key}\n"
+        signals = describe_features(features)
+        if signals:
+            for signal in signals:
+                explanation += f"- {signal}\n"
         else:
             explanation += "- Suspicious patterns detected in email content\n"
             explanation += "- Unusual formatting or structure\n"
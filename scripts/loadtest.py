@@ -0,0 +1,286 @@
+"""
+Concurrent-session load test of the app's inference paths.
+
+Each simulated session runs one input flow the way main.py does, on its own
+thread as Streamlit does:
+
+    text     classify_email_cached, then an explanation when the policy asks for one
+    upload   OCR of one to three screenshots through the shared OCR pool, then as text
+    camera   OCR of one photo, then as text
+
+A session's state (uploaded image bytes and extracted text, which Streamlit
+keeps for every connected session) stays alive until its concurrency level
+finishes, so resident memory growth per session can be measured.
+
+--stub-ocr and --stub-llm replace PaddleOCR and the chat model with offline
+stand-ins that sleep for a simulated latency. The stub OCR model records the
+most calls it ever served at once, which shows whether the models are shared
+safely. --unsafe-shared-ocr bypasses the pool to show the old behaviour, where
+every session called a single model.
+
+Usage:
+    python -m scripts.loadtest --stub-ocr --stub-llm --concurrency 1,10,50,100
+    python -m scripts.loadtest --stub-ocr --stub-llm --ocr-pool 4 --mix text=0.5,upload=0.3,camera=0.2
+    python -m scripts.loadtest --concurrency 1,4 --mix upload=1        # real PaddleOCR
+"""
+import argparse
+import gc
+import io
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+FLOWS = ("text", "upload", "camera")
+STAGES = ("ocr", "classify", "explain")
+DEFAULT_MIX = "text=0.6,upload=0.3,camera=0.1"
+
+# Share of sessions that ask for an explanation the policy did not generate
+ON_DEMAND_RATE = 0.2
+
+
+def render_screenshot(text, seed, width=900):
+    """Draw text on a white image, as a stand-in for an email screenshot"""
+    from PIL import Image, ImageDraw
+
+    words, lines, line = text.split(), [], ""
+    for word in words:
+        if len(line) + len(word) > 70:
+            lines.append(line)
+            line = ""
+        line += word + " "
+    lines.append(line)
+
+    image = Image.new("RGB", (width, 40 + 28 * len(lines)), "white")
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((20, 20 + 28 * i), line, fill="black")
+    # A unique pixel per session keeps the OCR cache from answering
+    image.putpixel((width - 1, 0), (seed % 256, seed // 256 % 256, 0))
+    return image
+
+def _png_bytes(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class SessionRunner:
+    """
+    Runs simulated sessions against the in-process inference functions.
+
+    Args:
+        texts (list of str): Email texts sessions draw from
+        mix (dict): Flow name -> relative weight
+        unique_ratio (float): Share of sessions whose content is new to every cache
+        shared_ocr_model: Call this single model from every session instead of the pool
+    """
+
+    def __init__(self, texts, mix, unique_ratio=1.0, shared_ocr_model=None, seed=0):
+        self.texts = texts
+        self.flows = list(mix)
+        self.weights = [mix[flow] for flow in self.flows]
+        self.unique_ratio = unique_ratio
+        self.shared_ocr_model = shared_ocr_model
+        self.seed = seed
+        self.states = {}
+        self._states_lock = threading.Lock()
+
+    def _ocr(self, flow, images):
+        from scripts.ocr import combine_ocr_results, process_image_with_ocr, process_images_with_ocr
+
+        if flow == "upload":
+            return combine_ocr_results(process_images_with_ocr(images, ocr_model=self.shared_ocr_model))
+        return process_image_with_ocr(images[0], ocr_model=self.shared_ocr_model)
+
+    def run(self, session_id):
+        """
+        Run one session.
+
+        Returns:
+            dict: 'flow', per-stage 'timings' in seconds, 'total', 'fallback' and 'error'
+        """
+        from scripts.cascade import should_explain
+        from scripts.classical import classify_email_cached
+        from scripts.llm import stream_llm_explanation
+
+        rng = random.Random(self.seed * 1_000_003 + session_id)
+        flow = rng.choices(self.flows, self.weights)[0]
+        text = self.texts[session_id % len(self.texts)]
+        if rng.random() < self.unique_ratio:
+            text += f" (ref {session_id})"
+
+        state = {"extracted_text": ""}
+        timings, fallback, error = {}, False, None
+        started = time.perf_counter()
+        try:
+            if flow != "text":
+                pages = rng.randint(1, 3) if flow == "upload" else 1
+                images = [render_screenshot(text, session_id * 4 + page) for page in range(pages)]
+                state["uploads"] = [_png_bytes(image) for image in images]
+
+                stage_started = time.perf_counter()
+                state["extracted_text"] = self._ocr(flow, images)
+                timings["ocr"] = time.perf_counter() - stage_started
+                # OCR text is the same for every image with the stub; keep sessions distinct
+                text = f"{state['extracted_text']} {text}"
+
+            stage_started = time.perf_counter()
+            prediction, confidence, features = classify_email_cached(text)
+            timings["classify"] = time.perf_counter() - stage_started
+
+            if should_explain(prediction[0], confidence) or rng.random() < ON_DEMAND_RATE:
+                stage_started = time.perf_counter()
+                explained = {}
+                state["explanation"] = "".join(
+                    stream_llm_explanation(text, prediction[0], confidence, features, timings=explained)
+                )
+                timings["explain"] = time.perf_counter() - stage_started
+                fallback = explained.get("fallback", False)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+
+        with self._states_lock:
+            self.states[session_id] = state
+        return {
+            "flow": flow,
+            "timings": timings,
+            "total": time.perf_counter() - started,
+            "fallback": fallback,
+            "error": error,
+        }
+
+    def reset(self):
+        """Drop the state of finished sessions, as Streamlit does when they disconnect"""
+        with self._states_lock:
+            self.states.clear()
+
+
+def _ocr_models():
+    """Return the models in the shared OCR pool, if it has been created"""
+    from scripts.ocr import load_ocr_model
+    pool = load_ocr_model()
+    return [model for model in getattr(pool, "models", []) if model is not None]
+
+def run_level(runner, concurrency, sessions, first_session=0):
+    """
+    Run `sessions` sessions with at most `concurrency` of them active at once.
+
+    Returns:
+        dict: Throughput, latency percentiles per stage, errors, fallbacks and memory growth
+    """
+    from scripts.benchmark import _percentile
+    from scripts.startup import _rss_mb
+
+    runner.reset()
+    gc.collect()
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="session") as pool:
+        results = list(pool.map(runner.run, range(first_session, first_session + sessions)))
+    elapsed = time.perf_counter() - started
+    rss_growth = _rss_mb() - rss_before
+
+    totals = sorted(result["total"] for result in results)
+    row = {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "sessions_per_s": sessions / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": _percentile(totals, 0.50) * 1000,
+        "p95_ms": _percentile(totals, 0.95) * 1000,
+        "p99_ms": _percentile(totals, 0.99) * 1000,
+        "errors": sum(1 for result in results if result["error"]),
+        "fallbacks": sum(1 for result in results if result["fallback"]),
+        "rss_mb": rss_growth,
+        "mb_per_session": rss_growth / sessions,
+        "first_error": next((result["error"] for result in results if result["error"]), None),
+    }
+    for stage in STAGES:
+        stage_times = sorted(result["timings"][stage] for result in results if stage in result["timings"])
+        row[f"{stage}_p99_ms"] = _percentile(stage_times, 0.99) * 1000
+    # Only the stub counts overlapping calls; more than 1 means a model was shared unsafely
+    models = []
+    if set(runner.flows) - {"text"}:
+        models = [runner.shared_ocr_model] if runner.shared_ocr_model else _ocr_models()
+    row["max_concurrent_ocr_calls"] = max((getattr(model, "max_concurrent_calls", 0) for model in models), default=0)
+    return row
+
+def print_table(rows):
+    print(
+        f"{'conc':>5}{'sessions/s':>12}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        f"{'ocr p99':>9}{'cls p99':>9}{'llm p99':>9}{'errors':>8}{'fallbk':>8}{'MB/sess':>9}{'ocr conc':>10}"
+    )
+    for row in rows:
+        print(
+            f"{row['concurrency']:>5}{row['sessions_per_s']:>12.1f}{row['p50_ms']:>9.0f}{row['p95_ms']:>9.0f}"
+            f"{row['p99_ms']:>9.0f}{row['ocr_p99_ms']:>9.0f}{row['classify_p99_ms']:>9.0f}{row['explain_p99_ms']:>9.0f}"
+            f"{row['errors']:>8}{row['fallbacks']:>8}{row['mb_per_session']:>9.2f}{row['max_concurrent_ocr_calls']:>10}"
+        )
+    for row in rows:
+        if row["first_error"]:
+            print(f"concurrency {row['concurrency']}: {row['errors']} errors, first: {row['first_error']}", file=sys.stderr)
+
+def _parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        flow, _, weight = part.partition("=")
+        if flow not in FLOWS:
+            raise ValueError(f"Unknown flow {flow!r}; expected one of {', '.join(FLOWS)}")
+        mix[flow] = float(weight or 1)
+    return mix
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the app with concurrent simulated sessions")
+    parser.add_argument("--concurrency", default="1,10,50,100", help="Comma-separated concurrent session counts")
+    parser.add_argument("--sessions", type=int, default=0, help="Sessions per level (default: 4x the concurrency)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Flow weights, e.g. text=0.6,upload=0.3,camera=0.1")
+    parser.add_argument("--unique-ratio", type=float, default=1.0, help="Share of sessions with uncached content")
+    parser.add_argument("--stub-ocr", action="store_true", help="Use the offline OCR stand-in")
+    parser.add_argument("--ocr-latency", type=float, default=0.2, help="Seconds per stub OCR call")
+    parser.add_argument("--ocr-pool", type=int, help="OCR models shared by sessions (SALAIN_OCR_POOL_SIZE)")
+    parser.add_argument("--unsafe-shared-ocr", action="store_true", help="Call one OCR model from every session")
+    parser.add_argument("--stub-llm", action="store_true", help="Use the offline LLM stand-in")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds per stub LLM call")
+    parser.add_argument("--llm-workers", type=int, help="Concurrent LLM calls (SALAIN_LLM_WORKERS)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    # Read by scripts.ocr and scripts.llm when they are first imported
+    if args.stub_ocr:
+        os.environ["SALAIN_OCR_BACKEND"] = "stub"
+        os.environ["SALAIN_OCR_STUB_LATENCY"] = str(args.ocr_latency)
+    if args.ocr_pool:
+        os.environ["SALAIN_OCR_POOL_SIZE"] = str(args.ocr_pool)
+    if args.llm_workers:
+        os.environ["SALAIN_LLM_WORKERS"] = str(args.llm_workers)
+
+    from scripts import llm
+    from scripts.benchmark import labeled_corpus
+    if args.stub_llm:
+        llm.set_llm_backend(llm.StubLLM(latency=args.llm_latency))
+
+    mix = _parse_mix(args.mix)
+    shared_ocr_model = None
+    if args.unsafe_shared_ocr and set(mix) - {"text"}:
+        from scripts.ocr import _create_ocr_model
+        shared_ocr_model = _create_ocr_model()
+    runner = SessionRunner(labeled_corpus(), mix, args.unique_ratio, shared_ocr_model, args.seed)
+
+    # Load models and fill one-off caches before measuring
+    for flow in mix:
+        warm = SessionRunner(runner.texts, {flow: 1}, 0.0, shared_ocr_model, args.seed).run(0)
+        if warm["error"]:
+            print(f"Warm-up of the {flow} flow failed: {warm['error']}", file=sys.stderr)
+
+    rows, first_session = [], 1
+    for concurrency in (int(value) for value in args.concurrency.split(",")):
+        sessions = args.sessions or concurrency * 4
+        rows.append(run_level(runner, concurrency, sessions, first_session))
+        first_session += sessions
+    print_table(rows)
+    return rows
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Lightweight in-process instrumentation.
+
+Timing spans, counters and latency histograms for each pipeline stage,
+exportable as Prometheus text or as structured JSON log lines. Everything is
+off unless SALAIN_METRICS=1 (or enable() is called); when off, span() returns a
+shared no-op context manager and counters return immediately.
+
+Environment:
+    SALAIN_METRICS=1            record metrics
+    SALAIN_METRICS_LOG=1        also log one JSON line per finished span
+    SALAIN_METRICS_PORT=9108    serve /metrics in Prometheus text format
+    SALAIN_METRICS_HOST=127.0.0.1  address the metrics server binds to
+    SALAIN_PROFILE_SLOW=2.0     sample stacks of requests slower than this many seconds
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("salain.metrics")
+
+# Innermost frames kept per profiler sample
+MAX_STACK_DEPTH = 24
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_enabled = os.getenv("SALAIN_METRICS", "0") == "1"
+_log_spans = os.getenv("SALAIN_METRICS_LOG", "0") == "1"
+_profile_threshold = float(os.getenv("SALAIN_PROFILE_SLOW", "0")) or None
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_slow_hooks = []
+
+def enable(flag=True, log_spans=None):
+    """Turn metric recording on or off at runtime"""
+    global _enabled, _log_spans
+    _enabled = flag
+    if log_spans is not None:
+        _log_spans = log_spans
+
+def is_enabled():
+    return _enabled
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def increment(name, amount=1, **labels):
+    """Add to a counter, e.g. increment("ocr_failures_total")"""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def observe(name, value, **labels):
+    """Record one value (in seconds) in a latency histogram"""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * len(BUCKETS), "count": 0, "sum": 0.0}
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                histogram["buckets"][i] += 1
+                break
+        histogram["count"] += 1
+        histogram["sum"] += value
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+class _Span:
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        duration = time.perf_counter() - self.started
+        observe("stage_duration_seconds", duration, stage=self.name, **self.labels)
+        if exc_type is not None:
+            increment("stage_errors_total", stage=self.name, **self.labels)
+        if _log_spans:
+            logger.info(json.dumps({
+                "event": "span",
+                "stage": self.name,
+                "seconds": round(duration, 6),
+                "error": exc_type.__name__ if exc_type else None,
+                **self.labels,
+            }))
+        return False
+
+def span(name, **labels):
+    """
+    Time a pipeline stage.
+
+    Usage:
+        with metrics.span("clean_email"):
+            ...
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span(name, labels)
+
+def timed(name):
+    """Decorator form of span()"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# --- Slow-request profiling --------------------------------------------------
+
+def add_slow_request_hook(hook):
+    """Call hook(name, seconds, stacks) for every profiled request over the threshold"""
+    _slow_hooks.append(hook)
+
+def _log_slow_request(name, seconds, stacks):
+    top = "\n".join(f"{count:6d} {stack}" for stack, count in stacks.most_common(15))
+    logger.warning(f"Slow request '{name}' took {seconds:.2f}s; sampled stacks:\n{top}")
+
+class _Sampler:
+    """Samples the stack of one thread at a fixed interval"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="salain-profiler")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None and len(names) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+class _ProfiledRequest:
+    def __init__(self, name, threshold, interval):
+        self.name = name
+        self.threshold = threshold
+        self.sampler = _Sampler(threading.get_ident(), interval)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.sampler.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.sampler.__exit__(*exc_info)
+        seconds = time.perf_counter() - self.started
+        if seconds >= self.threshold:
+            increment("slow_requests_total", request=self.name)
+            for hook in _slow_hooks or [_log_slow_request]:
+                hook(self.name, seconds, self.sampler.stacks)
+        return False
+
+def profile_slow(name, threshold=None, interval=0.005):
+    """
+    Sample the current thread's stack while a request runs, and report the
+    samples if it ends up slower than threshold seconds.
+
+    Disabled (a no-op) unless a threshold is given or SALAIN_PROFILE_SLOW is set.
+    """
+    threshold = threshold if threshold is not None else _profile_threshold
+    if threshold is None:
+        return _NOOP_SPAN
+    return _ProfiledRequest(name, threshold, interval)
+
+# --- Export ------------------------------------------------------------------
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+def render_prometheus():
+    """Return all metrics in the Prometheus text exposition format"""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: {**value, "buckets": list(value["buckets"])} for key, value in _histograms.items()}
+
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE salain_{name} counter")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"salain_{name}{_format_labels(labels)} {value}")
+
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# TYPE salain_{name} histogram")
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram["buckets"]):
+                cumulative += count
+                lines.append(f"salain_{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"salain_{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"salain_{name}_sum{_format_labels(labels)} {histogram['sum']}")
+            lines.append(f"salain_{name}_count{_format_labels(labels)} {histogram['count']}")
+
+    return "\n".join(lines) + "\n"
+
+def snapshot():
+    """Return all metrics as a JSON-serializable dict"""
+    with _lock:
+        return {
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in _counters.items()
+            ],
+            "histograms": [
+                {"name": name, "labels": dict(labels), "count": h["count"], "sum": h["sum"],
+                 "buckets": dict(zip(map(str, BUCKETS), h["buckets"]))}
+                for (name, labels), h in _histograms.items()
+            ],
+        }
+
+def reset():
+    """Clear all recorded metrics"""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body, content_type = render_prometheus().encode(), "text/plain; version=0.0.4"
+        elif self.path.split("?")[0] == "/metrics.json":
+            body, content_type = json.dumps(snapshot()).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+_server = None
+
+def start_metrics_server(port=None, host=None):
+    """
+    Serve /metrics (Prometheus) and /metrics.json on a background thread.
+
+    Safe to call on every Streamlit rerun; only the first call starts a server.
+    Does nothing if no port is given and SALAIN_METRICS_PORT is unset. Binds to
+    SALAIN_METRICS_HOST, by default loopback only, since the metrics expose
+    internal latencies and cache statistics.
+    """
+    global _server
+    port = port or int(os.getenv("SALAIN_METRICS_PORT", "0"))
+    host = host or os.getenv("SALAIN_METRICS_HOST", "127.0.0.1")
+    if not port:
+        return None
+    with _lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, daemon=True, name="salain-metrics").start()
+    return _server
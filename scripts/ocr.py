@@ -1,15 +1,178 @@
-from paddleocr import PaddleOCR
+from scripts.cache import ResultCache, make_key
+from scripts import metrics
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import hashlib
+import os
+import queue
+import threading
+import time
 import numpy as np
 import cv2
 from PIL import Image
 import streamlit as st
 
+# Screenshots taller than this are OCR'd as overlapping horizontal tiles
+TILE_HEIGHT = 1600
+TILE_OVERLAP = 120
+
+# Preprocessing: text lines taller than this (in pixels) are downscaled towards it,
+# close to the 48 px input height of PaddleOCR's recognizer
+TARGET_TEXT_HEIGHT = 32
+# Images are also capped at this size on their longest side
+MAX_IMAGE_SIDE = 2560
+# Text line heights are measured separately in this many vertical bands, so a
+# border, sidebar or photo only spoils the bands it covers
+TEXT_HEIGHT_BANDS = 8
+# Ink runs taller than this share of the image height are not text lines
+MAX_LINE_FRACTION = 0.25
+# Never downscale below this factor, whatever the estimated text height
+MIN_SCALE = 0.3
+# Pixels differing from the background by more than this count as ink
+INK_THRESHOLD = 40
+# Average channel spread below which an image is treated as grayscale
+GRAYSCALE_MAX_CHROMA = 12
+# Recognition confidence below which a line is recognized again with the angle classifier
+ANGLE_RETRY_CONFIDENCE = 0.8
+
+# Bump when preprocessing changes so cached OCR text is not reused
+OCR_PIPELINE_VERSION = 3
+
+# OCR text for images already seen (re-uploads and Streamlit reruns)
+ocr_cache = ResultCache("ocr", max_entries=256)
+
+# PaddleOCR models shared by all sessions. A predictor is not safe to call from
+# two threads at once, so each model serves one call at a time; more models let
+# sessions OCR in parallel at the cost of one model's memory each
+OCR_POOL_SIZE = int(os.getenv("SALAIN_OCR_POOL_SIZE", "1"))
+
+class StubOCR:
+    """
+    Offline stand-in for PaddleOCR, for load tests and benchmarks.
+
+    Returns fixed email-like lines after an optional simulated latency, and
+    records the most calls it ever served at once, which must stay at 1 for a
+    model that is not thread-safe. Select it with SALAIN_OCR_BACKEND=stub.
+    """
+
+    LINES = (
+        "Your account has been temporarily suspended.",
+        "Verify your password immediately at http://secure-login.example.net",
+    )
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self.max_concurrent_calls = 0
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def ocr(self, img_array, det=True, cls=False):
+        with self._lock:
+            self.calls += 1
+            self._active += 1
+            self.max_concurrent_calls = max(self.max_concurrent_calls, self._active)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if not det:
+                return [[(self.LINES[0], 0.99)]]
+            return [[
+                [[[0, 40 * i], [400, 40 * i], [400, 40 * i + 30], [0, 40 * i + 30]], (line, 0.99)]
+                for i, line in enumerate(self.LINES)
+            ]]
+        finally:
+            with self._lock:
+                self._active -= 1
+
+class OCRModelPool:
+    """
+    Lends OCR models to one caller at a time, creating up to `size` on demand.
+
+    Exposes the model's ocr() method, so it can be passed wherever a model is
+    expected; each call borrows a model for its duration.
+    """
+
+    def __init__(self, factory, size=OCR_POOL_SIZE):
+        self._factory = factory
+        self.size = max(size, 1)
+        self.models = []
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+
+    def _create(self):
+        with self._lock:
+            if len(self.models) >= self.size:
+                return None
+            # Reserve the slot so concurrent callers do not overshoot the size
+            self.models.append(None)
+        try:
+            model = self._factory()
+        except Exception:
+            with self._lock:
+                self.models.remove(None)
+            raise
+        with self._lock:
+            self.models[self.models.index(None)] = model
+        return model
+
+    def preload(self, count=1):
+        """Create models up front so load errors surface at startup"""
+        for _ in range(min(count, self.size) - len(self.models)):
+            self._idle.put(self._create())
+
+    @contextmanager
+    def borrow(self, timeout=None):
+        """Hold a model for exclusive use, waiting if every model is busy"""
+        try:
+            model = self._idle.get_nowait()
+        except queue.Empty:
+            model = self._create()
+            if model is None:
+                started = time.perf_counter()
+                model = self._idle.get(timeout=timeout)
+                metrics.observe("ocr_pool_wait_seconds", time.perf_counter() - started)
+        try:
+            yield model
+        finally:
+            self._idle.put(model)
+
+    def ocr(self, img_array, det=True, cls=False):
+        with self.borrow() as model:
+            return model.ocr(img_array, det=det, cls=cls)
+
+def _create_ocr_model():
+    if os.getenv("SALAIN_OCR_BACKEND", "paddle") == "stub":
+        return StubOCR(latency=float(os.getenv("SALAIN_OCR_STUB_LATENCY", "0")))
+    # PaddleOCR pulls in PaddlePaddle; import it only when a model is first needed
+    from paddleocr import PaddleOCR
+    return PaddleOCR(use_angle_cls=True, lang='en', show_log=False)
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+def get_ocr_pool(min_size=OCR_POOL_SIZE):
+    """
+    Return the process-wide OCR model pool, allowing it at least `min_size` models.
+
+    Models are only created when callers need them, so raising the size costs
+    nothing until that many images are OCR'd at once.
+    """
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = OCRModelPool(_create_ocr_model, min_size)
+        _shared_pool.size = max(_shared_pool.size, min_size)
+        return _shared_pool
+
 # Load OCR model only once
 @st.cache_resource
 def load_ocr_model():
-    """Initialize and cache the PaddleOCR model"""
+    """Initialize and cache the pool of OCR models shared by all sessions"""
     try:
-        return PaddleOCR(use_angle_cls=True, lang='en', show_log=False)
+        pool = get_ocr_pool()
+        pool.preload()
+        return pool
     except Exception as e:
         st.error(f"Failed to load OCR model: {str(e)}")
         return None
@@ -17,57 +180,320 @@ def load_ocr_model():
 def normalize_image(image):
     """Normalize image to ensure it's in correct format for OCR"""
     img_array = np.array(image)
-    
+
     # Convert grayscale to RGB if needed
     if len(img_array.shape) == 2:
         img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB)
     # Convert RGBA to RGB if needed
     elif img_array.shape[2] == 4:
         img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2RGB)
-    
+
     return img_array
 
+def _ink_runs(mask):
+    """Return (start, length) of consecutive True runs in a 1-D boolean array"""
+    padded = np.concatenate(([False], mask, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    starts, ends = edges[::2], edges[1::2]
+    return starts, ends - starts
+
+def estimate_text_height(ink):
+    """
+    Estimate the height of text lines from an ink mask.
+
+    Each vertical band contributes the heights of its runs of inked rows. Runs
+    shorter than 4 pixels (rules, specks) or taller than MAX_LINE_FRACTION of
+    the image (borders, sidebars, photos, logos) are discarded.
+
+    Args:
+        ink (np.ndarray): 2-D boolean mask of ink pixels
+
+    Returns:
+        float: Median line height in pixels, or None if no run looks like text
+    """
+    max_height = ink.shape[0] * MAX_LINE_FRACTION
+    heights = []
+    for band in np.array_split(ink, min(TEXT_HEIGHT_BANDS, ink.shape[1]), axis=1):
+        _, band_heights = _ink_runs(band.any(axis=1))
+        heights.append(band_heights[(band_heights >= 4) & (band_heights <= max_height)])
+    heights = np.concatenate(heights)
+    return float(np.median(heights)) if heights.size else None
+
+def preprocess_for_ocr(img_array):
+    """
+    Shrink an RGB image to what OCR needs before running the model.
+
+    Crops uniform margins, downscales so text lines are about TARGET_TEXT_HEIGHT
+    pixels tall (never upscales, and never below MIN_SCALE), and drops color
+    from images that carry none.
+
+    Returns:
+        np.ndarray: RGB image ready for OCR
+    """
+    gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+
+    # Crop margins: the background is the most common gray level (not the
+    # border, which a page-high frame or sidebar can cover)
+    background = int(np.bincount(gray.ravel(), minlength=256).argmax())
+    ink = np.abs(gray.astype(np.int16) - background) > INK_THRESHOLD
+    ink_rows = np.flatnonzero(ink.any(axis=1))
+    ink_cols = np.flatnonzero(ink.any(axis=0))
+    if ink_rows.size == 0:
+        return img_array
+    pad = 8
+    top, bottom = max(ink_rows[0] - pad, 0), min(ink_rows[-1] + pad + 1, gray.shape[0])
+    left, right = max(ink_cols[0] - pad, 0), min(ink_cols[-1] + pad + 1, gray.shape[1])
+    img_array, gray, ink = img_array[top:bottom, left:right], gray[top:bottom, left:right], ink[top:bottom, left:right]
+
+    # Drop color when the channels barely differ
+    chroma = (img_array.max(axis=2).astype(np.int16) - img_array.min(axis=2)).mean()
+    if chroma < GRAYSCALE_MAX_CHROMA:
+        img_array = cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
+
+    scale = 1.0
+    text_height = estimate_text_height(ink)
+    if text_height:
+        scale = max(min(scale, TARGET_TEXT_HEIGHT / text_height), MIN_SCALE)
+    scale = min(scale, MAX_IMAGE_SIDE / max(img_array.shape[:2]))
+
+    if scale < 0.9:
+        size = (max(int(img_array.shape[1] * scale), 1), max(int(img_array.shape[0] * scale), 1))
+        img_array = cv2.resize(img_array, size, interpolation=cv2.INTER_AREA)
+
+    return np.ascontiguousarray(img_array)
+
+def image_digest(img_array):
+    """Return a content hash of an image array"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(img_array.shape).encode())
+    digest.update(np.ascontiguousarray(img_array).data)
+    return digest.hexdigest()
+
+def split_into_tiles(img_array, tile_height=TILE_HEIGHT, overlap=TILE_OVERLAP):
+    """
+    Split a tall image into overlapping horizontal tiles.
+
+    Returns:
+        list: (top offset, tile array) pairs; a single pair if no split is needed
+    """
+    height = img_array.shape[0]
+    if height <= tile_height + overlap:
+        return [(0, img_array)]
+
+    tiles = []
+    step = tile_height - overlap
+    for top in range(0, height, step):
+        tiles.append((top, img_array[top:top + tile_height]))
+        if top + tile_height >= height:
+            break
+    return tiles
+
+def order_lines(lines):
+    """
+    Sort OCR lines into reading order: top to bottom, then left to right.
+
+    Lines whose vertical centers are within half a line height of each other
+    are treated as one row.
+
+    Args:
+        lines (list): (box, text, score) tuples with boxes in image coordinates
+
+    Returns:
+        list: The same tuples in reading order
+    """
+    def bounds(box):
+        ys = [point[1] for point in box]
+        return min(ys), max(ys), min(point[0] for point in box)
+
+    rows = []
+    for line in sorted(lines, key=lambda line: bounds(line[0])[0]):
+        top, bottom, _ = bounds(line[0])
+        center = (top + bottom) / 2
+        if rows:
+            row_top, row_bottom = rows[-1][0]
+            if abs(center - (row_top + row_bottom) / 2) <= (row_bottom - row_top) / 2:
+                rows[-1][1].append(line)
+                continue
+        rows.append(((top, bottom), [line]))
+
+    return [line for _, row in rows for line in sorted(row, key=lambda line: bounds(line[0])[2])]
+
+def _run_ocr(ocr_model, img_array, cls):
+    result = ocr_model.ocr(img_array, cls=cls)
+    if not result or not result[0]:
+        return []
+    return [(line[0], line[1][0], line[1][1]) for line in result[0]]
+
+def crop_line(img_array, box):
+    """
+    Cut one detected line out of an image, straightened to a horizontal strip.
+
+    Mirrors the crop PaddleOCR's own pipeline hands to the recognizer: the box
+    is warped to a rectangle, and boxes much taller than wide are turned flat.
+    """
+    points = np.asarray(box, dtype=np.float32)
+    width = max(int(max(np.linalg.norm(points[0] - points[1]), np.linalg.norm(points[2] - points[3]))), 1)
+    height = max(int(max(np.linalg.norm(points[0] - points[3]), np.linalg.norm(points[1] - points[2]))), 1)
+    target = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    crop = cv2.warpPerspective(
+        img_array, cv2.getPerspectiveTransform(points, target), (width, height),
+        flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE,
+    )
+    if height >= width * 1.5:
+        crop = np.rot90(crop)
+    return np.ascontiguousarray(crop)
+
+def _ocr_lines(ocr_model, img_array):
+    """
+    Run OCR on one array and return (box, text, score) tuples.
+
+    Screenshots are almost always upright, so detection and recognition run
+    without the angle classifier. Only lines recognized with low confidence are
+    cut out and recognized again with it, which turns them if they are upside
+    down; the better reading of the two is kept.
+    """
+    lines = []
+    for box, text, score in _run_ocr(ocr_model, img_array, cls=False):
+        if score < ANGLE_RETRY_CONFIDENCE:
+            metrics.increment("ocr_angle_retries_total")
+            result = ocr_model.ocr(crop_line(img_array, box), det=False, cls=True)
+            if result and result[0] and result[0][0][1] > score:
+                text, score = result[0][0]
+        lines.append((box, text, score))
+    return lines
+
+def ocr_image_lines(ocr_model, img_array, tile_height=TILE_HEIGHT, overlap=TILE_OVERLAP):
+    """
+    OCR an image, tiling it if it is tall, and return its lines in reading order.
+
+    Each line is kept only by the tile whose core (the tile minus half the
+    overlap on each shared edge) contains its vertical center, so text in an
+    overlap is not duplicated.
+    """
+    tiles = split_into_tiles(img_array, tile_height, overlap)
+    lines = []
+    for index, (top, tile) in enumerate(tiles):
+        core_top = top + overlap / 2 if index > 0 else float("-inf")
+        core_bottom = top + tile_height - overlap / 2 if index < len(tiles) - 1 else float("inf")
+        for box, text, score in _ocr_lines(ocr_model, tile):
+            box = [[x, y + top] for x, y in box]
+            center = sum(point[1] for point in box) / len(box)
+            if core_top <= center < core_bottom:
+                lines.append((box, text, score))
+    return order_lines(lines)
+
+def extract_image_text(ocr_model, img_array):
+    """
+    Return the text of a normalized image, using the OCR cache when possible.
+
+    Args:
+        ocr_model: Loaded PaddleOCR model or OCRModelPool
+        img_array (np.ndarray): RGB image from normalize_image
+
+    Returns:
+        str: Extracted text in reading order
+    """
+    key = make_key(OCR_PIPELINE_VERSION, image_digest(img_array))
+    cached = ocr_cache.get(key)
+    if cached is not None:
+        return cached
+
+    with metrics.span("ocr_preprocess"):
+        img_array = preprocess_for_ocr(img_array)
+    with metrics.span("ocr"):
+        lines = ocr_image_lines(ocr_model, img_array)
+    text = " ".join(text for _, text, _ in lines).strip()
+    ocr_cache.set(key, text)
+    return text
+
 def process_image_with_ocr(image, ocr_model=None):
     """
     Process image using PaddleOCR and return extracted text
-    
+
     Args:
         image: PIL Image object
         ocr_model: Optional pre-loaded OCR model
-    
+
     Returns:
         str: Extracted text from the image
     """
     # Load model if not provided
     if ocr_model is None:
         ocr_model = load_ocr_model()
-        
+
     if ocr_model is None:
         st.error("OCR model is not available")
         return ""
-    
+
     try:
         # Normalize the image
         img_array = normalize_image(image)
-        
-        # Run OCR on the image
-        result = ocr_model.ocr(img_array, cls=True)
-        
-        # Extract text from OCR result
-        if result and result[0]:
-            text = " ".join([line[1][0] for line in result[0]])
-            return text.strip()
-        else:
-            return ""
+
+        # Preprocess, run OCR and extract text in reading order
+        return extract_image_text(ocr_model, img_array)
     except Exception as e:
+        metrics.increment("ocr_failures_total")
         st.error(f"OCR Error: {str(e)}")
         return ""
 
+def ocr_image(image, ocr_model):
+    """
+    OCR one image and report its latency and any error instead of raising.
+
+    Args:
+        image: PIL Image object
+        ocr_model: Loaded PaddleOCR model or OCRModelPool
+
+    Returns:
+        dict: 'text', 'seconds' and 'error' (None on success)
+    """
+    started = time.perf_counter()
+    try:
+        if ocr_model is None:
+            raise RuntimeError("OCR model is not available")
+        text = extract_image_text(ocr_model, normalize_image(image))
+        error = None
+    except Exception as e:
+        metrics.increment("ocr_failures_total")
+        text, error = "", str(e)
+    return {"text": text, "seconds": time.perf_counter() - started, "error": error}
+
+def process_images_with_ocr(images, ocr_model=None, max_workers=1):
+    """
+    OCR several images, e.g. consecutive screenshots of one long email.
+
+    With max_workers=1 the images are processed in order on the shared model.
+    With more workers, images are processed concurrently on models borrowed
+    from the shared pool, which grows to max_workers models (the predictors
+    are not safe to share).
+
+    Args:
+        images (list): PIL Image objects, in reading order
+        ocr_model: Optional pre-loaded OCR model for the sequential path
+        max_workers (int): Number of OCR threads
+
+    Returns:
+        list: One dict per image, in input order, with 'text', 'seconds' and 'error'
+    """
+    if max_workers > 1 and len(images) > 1:
+        ocr_pool = get_ocr_pool(max_workers)
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(images))) as pool:
+            return list(pool.map(lambda image: ocr_image(image, ocr_pool), images))
+
+    if ocr_model is None:
+        ocr_model = load_ocr_model()
+
+    return [ocr_image(image, ocr_model) for image in images]
+
+def combine_ocr_results(results):
+    """Join per-image OCR text in order, one paragraph per image"""
+    return "\n\n".join(result["text"] for result in results if result["text"])
+
 def process_file_upload(uploaded_file):
     """Process an uploaded file and extract text"""
     if uploaded_file is None:
         return ""
-    
+
     try:
         image = Image.open(uploaded_file)
         with st.spinner("Extracting text from image..."):
@@ -76,15 +502,49 @@ def process_file_upload(uploaded_file):
         st.error(f"Error processing uploaded file: {str(e)}")
         return ""
 
+def process_file_uploads(uploaded_files):
+    """Process several uploaded screenshots and extract their combined text"""
+    if not uploaded_files:
+        return ""
+
+    try:
+        images = [Image.open(uploaded_file) for uploaded_file in uploaded_files]
+        with st.spinner(f"Extracting text from {len(images)} image(s)..."):
+            results = process_images_with_ocr(images)
+        for uploaded_file, result in zip(uploaded_files, results):
+            if result["error"]:
+                st.error(f"OCR Error in {uploaded_file.name}: {result['error']}")
+        return combine_ocr_results(results)
+    except Exception as e:
+        st.error(f"Error processing uploaded files: {str(e)}")
+        return ""
+
 def process_camera_capture(camera_file):
     """Process a camera capture file and extract text"""
     if camera_file is None:
         return ""
-    
+
     try:
         image = Image.open(camera_file)
         with st.spinner("Extracting text from camera image..."):
             return process_image_with_ocr(image)
     except Exception as e:
         st.error(f"Error processing camera file: {str(e)}")
-        return ""
\ No newline at end of file
+        return ""
+
+def main(argv=None):
+    """OCR a batch of screenshot files offline and print one JSON line per image"""
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Extract text from email screenshots")
+    parser.add_argument("images", nargs="+", help="Image files")
+    parser.add_argument("--workers", type=int, default=1, help="OCR threads, each borrowing its own model")
+    args = parser.parse_args(argv)
+
+    images = [Image.open(path) for path in args.images]
+    for path, result in zip(args.images, process_images_with_ocr(images, max_workers=args.workers)):
+        print(json.dumps({"path": path, **result}))
+
+if __name__ == "__main__":
+    main()
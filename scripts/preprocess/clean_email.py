@@ -1,20 +1,159 @@
 import re
-from bs4 import BeautifulSoup
+import time
+from html.entities import html5
+from html.parser import HTMLParser
+from scripts import metrics
+from scripts.preprocess.guard import GUARD_ENABLED, HTML_TIME_BUDGET
+
+# Plain text without tags or entities goes straight to the regex pass
+MARKUP_HINT = re.compile(r"[<&]")
+
+# 'https' URLs are already covered by 'http'
+URL_PATTERN = re.compile(r"http\S+|www\S+")
+# A match can only start at the beginning of a token, so the (?<!\S) anchor
+# keeps results identical while avoiding a rescan from every character
+EMAIL_PATTERN = re.compile(r"(?<!\S)\S+@\S+")
+SPECIAL_CHARS = re.compile(r"[^a-zA-Z0-9.!?]+")
+
+# Strings inside these elements are not text (matches BeautifulSoup's get_text)
+SKIPPED_ELEMENTS = {"script", "style", "template", "rt", "rp"}
+
+# Elements that never have content, so they are never left open
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link",
+    "menuitem", "meta", "param", "source", "track", "wbr", "basefont", "bgsound",
+    "command", "frame", "image", "isindex", "nextid", "spacer",
+}
+
+# Elements inside which BeautifulSoup keeps whitespace-only strings as they are
+PRESERVE_WHITESPACE_ELEMENTS = {"pre", "textarea"}
+ASCII_SPACES = " \n\t\x0c\r"
+
+NUMERIC_PREFIX = re.compile(r"([0-9a-fA-F]*)(.*)", re.DOTALL)
+
+# Fallback once the parsing budget is spent; [^<>] keeps the scan linear even
+# when a '<' is never closed
+TAG_PATTERN = re.compile(r"<[^<>]*>")
+
+# Characters fed to the HTML parser per call; also how often the time budget is checked
+HTML_FEED_SIZE = 1 << 13
+
+# HTMLParser.close() retries every '<' in input it is still holding (an unclosed
+# tag and everything after it) against the rest of that input, which is
+# quadratic. Under a time budget, a held tail longer than this is stripped of
+# tags instead.
+MAX_UNPARSED_TAIL = 1 << 12
+
+class _TextExtractor(HTMLParser):
+    """
+    Collects the text of an HTML document as it is parsed, without building a tree.
+
+    Entity handling, skipped elements and CDATA sections follow BeautifulSoup's
+    html.parser builder, so clean_email's output equals what it was with
+    BeautifulSoup(text, "html.parser").get_text(). The text itself can differ
+    from get_text() only inside whitespace-only strings, which BeautifulSoup
+    collapses to one space or newline and clean_email collapses anyway.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.parts = []
+        # Open non-void elements, and how many of them are skipped elements
+        self._open = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_ELEMENTS:
+            return
+        self._open.append(tag)
+        if tag in SKIPPED_ELEMENTS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag not in self._open:
+            return
+        # Closing an element also closes everything opened inside it
+        while True:
+            closed = self._open.pop()
+            if closed in SKIPPED_ELEMENTS:
+                self._skip_depth -= 1
+            if closed == tag:
+                break
+
+    def handle_startendtag(self, tag, attrs):
+        pass
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+    def handle_entityref(self, name):
+        character = html5.get(name + ";")
+        self.handle_data(character if character is not None else "&" + name)
+
+    def handle_charref(self, name):
+        base = 10
+        if name[:1] in ("x", "X"):
+            name = name[1:]
+            base = 16
+        digits, extra = NUMERIC_PREFIX.match(name).groups()
+        try:
+            self.handle_data(chr(int(digits, base)))
+        except ValueError:
+            self.handle_data("\ufffd")
+        if extra:
+            self.handle_data(extra)
+
+    def unknown_decl(self, data):
+        # CDATA sections count as text, even inside skipped elements
+        if data.upper().startswith("CDATA["):
+            data = data[len("CDATA["):]
+            # A whitespace-only (or empty) section becomes one space or newline,
+            # which keeps the words around it apart
+            if not data.strip(ASCII_SPACES) and not PRESERVE_WHITESPACE_ELEMENTS.intersection(self._open):
+                data = "\n" if "\n" in data else " "
+            self.parts.append(data)
+
+def html_to_text(text, time_budget=None):
+    """
+    Return the text content of an HTML document.
+
+    Args:
+        text (str): HTML document
+        time_budget (float, optional): Seconds to spend parsing. Once spent, the
+            rest of the document is only stripped of tags, which is linear-time
+            but does not drop script/style content or decode entities.
+
+    Returns:
+        str: Text content
+    """
+    extractor = _TextExtractor()
+    started = time.perf_counter()
+    for start in range(0, len(text), HTML_FEED_SIZE):
+        if time_budget is not None and time.perf_counter() - started > time_budget:
+            metrics.increment("guard_budget_exceeded_total", stage="html")
+            # rawdata holds input the parser has buffered but not yet handled
+            rest = extractor.rawdata + text[start:]
+            return "".join(extractor.parts) + " " + TAG_PATTERN.sub(" ", rest)
+        extractor.feed(text[start:start + HTML_FEED_SIZE])
+
+    if time_budget is not None and len(extractor.rawdata) > MAX_UNPARSED_TAIL:
+        metrics.increment("guard_budget_exceeded_total", stage="html_tail")
+        return "".join(extractor.parts) + " " + TAG_PATTERN.sub(" ", extractor.rawdata)
+    extractor.close()
+    return "".join(extractor.parts)
 
 def clean_email(text):
     # Remove HTML/CSS
-    text = BeautifulSoup(text, "html.parser").get_text()
+    if MARKUP_HINT.search(text):
+        text = html_to_text(text, HTML_TIME_BUDGET if GUARD_ENABLED else None)
 
     # Remove URLs
-    text = re.sub(r"http\S+|www\S+|https\S+", "", text)
+    text = URL_PATTERN.sub("", text)
 
     # Remove email addresses
-    text = re.sub(r"\S+@\S+", "", text)
+    text = EMAIL_PATTERN.sub("", text)
 
     # Remove special characters (keep letters, numbers, and basic punctuation)
-    text = re.sub(r"[^a-zA-Z0-9.!?]+", " ", text)
-
-    # Lowercase
-    text = text.lower()
-
-    return text
\ No newline at end of file
+    # and lowercase
+    return SPECIAL_CHARS.sub(" ", text).lower()
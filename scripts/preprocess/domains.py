@@ -0,0 +1,508 @@
+"""
+URL and domain features backed by a local reputation index.
+
+The index lives in models/domains/ as sorted, memory-mapped arrays:
+
+    index.json      brand list and counts; written last, watched for reloads
+    bad.npy         known-bad domains as ASCII (IDNA) bytes, sorted
+    good.npy        known-good domains, same layout
+
+A host matches a list when the host or any parent domain is in it
+(login.evil.com matches evil.com): one np.searchsorted over every suffix of
+every host in an email, O(log n) per suffix. The most specific match wins, so
+a good subdomain of a bad domain stays good. Loading maps the arrays instead of
+reading them, so it takes milliseconds whatever the list sizes.
+
+Brand checks compare a homoglyph skeleton of each domain label (confusable
+Unicode letters, digits and 'rn' mapped to the ASCII letters they imitate)
+against the brand list, then allow one or two edits for longer brand names.
+Results are cached per host, so repeated links cost a dict lookup.
+
+The counts are reported next to extract_features (DOMAIN_FEATURE_NAMES) and
+passed to the explanation; they are not part of the trained feature vector.
+
+Usage:
+    python -m scripts.preprocess.domains --bad phishing.txt --good top-sites.txt   # add to the index
+    python -m scripts.preprocess.domains --bad phishing.txt --replace              # rebuild it
+    python -m scripts.preprocess.domains --check http://amaz0n-tracking-secure.net
+"""
+import argparse
+import ipaddress
+import json
+import os
+import re
+import sys
+import time
+import unicodedata
+import numpy as np
+
+INDEX_DIR = "models/domains"
+INDEX_PATH = os.path.join(INDEX_DIR, "index.json")
+FORMAT_VERSION = 1
+LISTS = ("bad", "good")
+
+DOMAIN_FEATURE_NAMES = (
+    "num_domains", "bad_domains", "good_domains", "lookalike_domains", "ip_hosts", "punycode_hosts",
+)
+
+# Frequently impersonated brands and the domains they really use
+DEFAULT_BRANDS = {
+    "amazon": ["amazon.com", "amazon.co.uk", "amazonaws.com", "amazon.jobs"],
+    "apple": ["apple.com", "icloud.com"],
+    "bankofamerica": ["bankofamerica.com", "bofa.com"],
+    "bdo": ["bdo.com.ph"],
+    "bpi": ["bpi.com.ph", "bpiexpressonline.com"],
+    "chase": ["chase.com", "jpmorganchase.com"],
+    "dhl": ["dhl.com", "dhl.de"],
+    "docusign": ["docusign.com", "docusign.net"],
+    "dropbox": ["dropbox.com", "dropboxmail.com"],
+    "facebook": ["facebook.com", "fb.com", "facebookmail.com", "meta.com"],
+    "fedex": ["fedex.com"],
+    "gcash": ["gcash.com"],
+    "google": ["google.com", "gmail.com", "youtube.com", "googleusercontent.com"],
+    "instagram": ["instagram.com"],
+    "landbank": ["landbank.com"],
+    "lazada": ["lazada.com.ph", "lazada.com"],
+    "linkedin": ["linkedin.com"],
+    "metrobank": ["metrobank.com.ph"],
+    "microsoft": ["microsoft.com", "live.com", "outlook.com", "office.com", "microsoftonline.com"],
+    "netflix": ["netflix.com"],
+    "pagibig": ["pagibigfund.gov.ph"],
+    "paymaya": ["paymaya.com", "maya.ph"],
+    "paypal": ["paypal.com", "paypal.me"],
+    "securitybank": ["securitybank.com"],
+    "shopee": ["shopee.ph", "shopee.com"],
+    "unionbank": ["unionbankph.com"],
+    "wellsfargo": ["wellsfargo.com"],
+}
+
+# Second-level labels under two-letter country codes (example.com.ph)
+COUNTRY_SECOND_LEVELS = {"ac", "co", "com", "edu", "go", "gov", "mil", "ne", "net", "or", "org"}
+
+# Characters that render like ASCII letters, mapped to the letter they imitate.
+# i, 1, | and ! all collapse to l, so paypa1 and paypai both read as paypal
+HOMOGLYPHS = str.maketrans({
+    "0": "o", "1": "l", "i": "l", "|": "l", "!": "l", "3": "e", "4": "a", "5": "s", "7": "t", "8": "b",
+    # Cyrillic
+    "а": "a", "в": "b", "е": "e", "к": "k", "м": "m", "н": "h", "о": "o", "р": "p", "с": "c",
+    "т": "t", "у": "y", "х": "x", "ѕ": "s", "і": "l", "ј": "j", "ԁ": "d", "ɡ": "g", "ԛ": "q", "ԝ": "w",
+    # Greek
+    "α": "a", "β": "b", "ε": "e", "ι": "l", "κ": "k", "ν": "v", "ο": "o", "ρ": "p", "τ": "t", "υ": "u",
+    "χ": "x",
+})
+# Letter pairs that render like one letter
+HOMOGLYPH_PAIRS = (("rn", "m"), ("vv", "w"))
+
+# Hosts after a scheme or a leading www., matched on lowercased text at each
+# position where str.find located a prefix; scanning with str.find is several
+# times faster than letting the regex engine try every position
+URL_PREFIXES = ("http", "www.")
+URL_HOST_PATTERN = re.compile(r"(?:https?://|(?<![\w.-])(?=www\.))([^\s/?#<>\"'\\]+)")
+
+# Analyzed hosts kept per index; cleared when full
+HOST_CACHE_SIZE = 1 << 16
+# Hosts analyzed per email; link-stuffed emails are only counted past this
+MAX_HOSTS_PER_EMAIL = 100
+
+URL_PARTS = re.compile(r"[/?#\\@:\[]")
+PATH_START = re.compile(r"[/?#\\]")
+
+def normalize_domain(value):
+    """Return the lowercase host of a domain, URL or hosts-file entry, or '' if there is none"""
+    value = value.strip().lower()
+    if URL_PARTS.search(value):
+        if "://" in value:
+            value = value.split("://", 1)[1]
+        value = PATH_START.split(value, 1)[0]
+        value = value.rpartition("@")[2]
+        if value.startswith("["):
+            value = value[1:].partition("]")[0]
+        else:
+            value = value.split(":", 1)[0]
+    return value.strip(".,;:!)]}>'\"*").lstrip(".")
+
+def _ascii_host(host):
+    """IDNA form of a host, as stored in the index"""
+    if host.isascii():
+        return host.encode("ascii")
+    try:
+        return host.encode("idna")
+    except UnicodeError:
+        return host.encode("utf-8")
+
+def _unicode_label(label):
+    if label.startswith("xn--"):
+        try:
+            return label.encode("ascii").decode("idna")
+        except UnicodeError:
+            pass
+    return label
+
+def skeleton(label):
+    """Map a domain label to the ASCII letters it looks like"""
+    decomposed = unicodedata.normalize("NFKD", label.lower())
+    text = "".join(char for char in decomposed if not unicodedata.combining(char)).translate(HOMOGLYPHS)
+    for pair, letter in HOMOGLYPH_PAIRS:
+        text = text.replace(pair, letter)
+    return text
+
+def registered_domain(host):
+    """Return the registrable part of a host (example.com, example.com.ph)"""
+    labels = host.split(".")
+    if len(labels) >= 3 and len(labels[-1]) == 2 and labels[-2] in COUNTRY_SECOND_LEVELS:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+def _within_distance(first, second, max_distance):
+    """True if the strings are at most max_distance edits apart (adjacent swaps count as one)"""
+    if abs(len(first) - len(second)) > max_distance:
+        return False
+    previous2, previous = None, list(range(len(second) + 1))
+    for i, char in enumerate(first, start=1):
+        current = [i] + [0] * len(second)
+        for j, other in enumerate(second, start=1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other))
+            if i > 1 and j > 1 and char == second[j - 2] and first[i - 2] == other:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return False
+        previous2, previous = previous, current
+    return previous[-1] <= max_distance
+
+def _max_edits(brand):
+    # Short names are one edit away from many ordinary words
+    if len(brand) < 6:
+        return 0
+    return 1 if len(brand) < 10 else 2
+
+
+class DomainIndex:
+    """
+    Known-bad and known-good domain lists plus a brand list, with per-host lookups.
+
+    Args:
+        bad, good (np.ndarray): Sorted unique 'S' arrays of ASCII domains
+        brands (dict): Brand name -> official domains
+    """
+
+    def __init__(self, bad=None, good=None, brands=None):
+        self.lists = {
+            "bad": bad if bad is not None else np.array([], dtype="S1"),
+            "good": good if good is not None else np.array([], dtype="S1"),
+        }
+        self.brands = brands if brands is not None else DEFAULT_BRANDS
+        self._official = {domain for domains in self.brands.values() for domain in domains}
+        # Brands by skeleton, and the longer ones that also match within a few edits
+        self._brand_skeletons = {skeleton(brand): brand for brand in self.brands}
+        self._fuzzy_brands = [
+            (name, set(name), brand, _max_edits(brand))
+            for name, brand in self._brand_skeletons.items() if _max_edits(brand)
+        ]
+        self._cache = {}
+
+    def _matches(self, name, suffixes):
+        """Return a boolean per suffix: is it in list `name`"""
+        domains = self.lists[name]
+        found = np.zeros(len(suffixes), dtype=bool)
+        if not suffixes or not len(domains):
+            return found
+        width = domains.dtype.itemsize
+        # Longer names cannot be in the list, and numpy would truncate them to fit
+        fits = np.fromiter((len(suffix) <= width for suffix in suffixes), dtype=bool, count=len(suffixes))
+        candidates = np.array([suffix for suffix, ok in zip(suffixes, fits) if ok], dtype=domains.dtype)
+        positions = np.searchsorted(domains, candidates)
+        positions[positions == len(domains)] = 0
+        found[fits] = domains[positions] == candidates
+        return found
+
+    def reputation(self, hosts):
+        """
+        Look up hosts and their parent domains in the bad and good lists.
+
+        Returns:
+            list: 'bad', 'good' or None per host, from its most specific listed suffix
+        """
+        suffixes, owners = [], []
+        for index, host in enumerate(hosts):
+            labels = _ascii_host(host).split(b".")
+            for start in range(len(labels) - 1):
+                suffixes.append(b".".join(labels[start:]))
+                owners.append(index)
+
+        verdicts = [None] * len(hosts)
+        bad, good = self._matches("bad", suffixes), self._matches("good", suffixes)
+        # Suffixes of a host run from most to least specific
+        for owner, is_bad, is_good in zip(owners, bad, good):
+            if verdicts[owner] is None and (is_bad or is_good):
+                verdicts[owner] = "good" if is_good else "bad"
+        return verdicts
+
+    def _official_domain(self, host):
+        labels = host.split(".")
+        return any(".".join(labels[start:]) in self._official for start in range(len(labels) - 1))
+
+    def impersonated_brand(self, host):
+        """Return the brand a host imitates without belonging to it, or None"""
+        if self._official_domain(host):
+            return None
+        labels = [_unicode_label(label) for label in host.split(".")]
+        registered_labels = len(registered_domain(host).split("."))
+        registered_label = labels[-registered_labels]
+
+        # Brand names as subdomains (paypal.com.secure-login.net) or as one word
+        # of a hyphenated name (amaz0n-tracking-secure.net)
+        words = registered_label.split("-")
+        for word in labels[:-registered_labels] + (words if len(words) > 1 else []):
+            brand = self._brand_skeletons.get(skeleton(word))
+            if brand is not None:
+                return brand
+
+        # Homoglyphs of the whole name (paypa1.com); the exact name under another
+        # TLD is left alone, as brands register many country domains
+        brand = self._brand_skeletons.get(skeleton(registered_label))
+        if brand is not None:
+            return brand if registered_label != brand else None
+
+        # Near misses of longer brand names (paypall, micros0ft)
+        label_skeleton = skeleton(registered_label)
+        letters = set(label_skeleton)
+        for name, name_letters, brand, max_edits in self._fuzzy_brands:
+            # Each edit adds or removes at most two distinct letters
+            if len(letters ^ name_letters) > 2 * max_edits:
+                continue
+            if _within_distance(label_skeleton, name, max_edits):
+                return brand
+        return None
+
+    def analyze_hosts(self, hosts):
+        """
+        Classify hosts, looking up the uncached ones in one pass.
+
+        Returns:
+            list: Per host, a dict with 'reputation' ('bad', 'good' or None), the
+                'brand' it imitates, and 'ip' and 'punycode' flags
+        """
+        # Sessions share the cache; read it once so a concurrent clear() cannot
+        # drop entries between the lookup and the return
+        results = {}
+        for host in hosts:
+            cached = self._cache.get(host)
+            if cached is not None:
+                results[host] = cached
+        new_hosts = [host for host in dict.fromkeys(hosts) if host not in results]
+
+        for host, reputation in zip(new_hosts, self.reputation(new_hosts)):
+            try:
+                ipaddress.ip_address(host)
+                is_ip = True
+            except ValueError:
+                is_ip = False
+            results[host] = {
+                "reputation": reputation,
+                "brand": None if is_ip or reputation == "good" else self.impersonated_brand(host),
+                "ip": is_ip,
+                "punycode": not host.isascii() or "xn--" in host,
+            }
+
+        if new_hosts:
+            if len(self._cache) + len(new_hosts) > HOST_CACHE_SIZE:
+                self._cache.clear()
+            self._cache.update((host, results[host]) for host in new_hosts)
+        return [results[host] for host in hosts]
+
+    def analyze_host(self, host):
+        """Classify one host; see analyze_hosts"""
+        return self.analyze_hosts([host])[0]
+
+def extract_hosts(text):
+    """Return the unique hosts of the links in a text, in order of appearance"""
+    text = text.lower()
+    hosts = {}
+    # Visit prefix positions in order, skipping those inside the previous match,
+    # as re.finditer would
+    found = {prefix: text.find(prefix) for prefix in URL_PREFIXES}
+    while True:
+        position = min((found for found in found.values() if found >= 0), default=-1)
+        if position < 0:
+            break
+        match = URL_HOST_PATTERN.match(text, position)
+        end = match.end() if match else position + 1
+        if match:
+            host = normalize_domain(match.group(1))
+            if "." in host:
+                hosts.setdefault(host, None)
+        for prefix, next_position in found.items():
+            if 0 <= next_position < end:
+                found[prefix] = text.find(prefix, end)
+    return list(hosts)
+
+def _load_list(directory, name):
+    path = os.path.join(directory, f"{name}.npy")
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r")
+
+def load_index(header_path=INDEX_PATH):
+    """Load an index from its index.json, mapping the domain arrays"""
+    with open(header_path) as f:
+        header = json.load(f)
+    if header.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported domain index format in {header_path}")
+    directory = os.path.dirname(header_path)
+    return DomainIndex(_load_list(directory, "bad"), _load_list(directory, "good"), header["brands"])
+
+_registry = None
+_default_index = DomainIndex()
+# When the index was last found missing; rechecked at the registry's interval
+_missing_at = None
+
+def get_domain_index():
+    """
+    Return the resident index, reloaded when index.json changes.
+
+    Returns:
+        tuple: (DomainIndex, version); the brand list alone if no index was built
+    """
+    global _registry, _missing_at
+    from scripts.registry import ArtifactRegistry, RELOAD_CHECK_INTERVAL
+
+    if _missing_at is not None and time.monotonic() - _missing_at < RELOAD_CHECK_INTERVAL:
+        return _default_index, "none"
+    if _registry is None:
+        _registry = ArtifactRegistry(loader=load_index)
+    try:
+        index, version = _registry.get_versioned(INDEX_PATH)
+    except OSError:
+        _missing_at = time.monotonic()
+        return _default_index, "none"
+    _missing_at = None
+    return index, version
+
+def index_version():
+    """Version of the resident index; part of classification cache keys"""
+    return get_domain_index()[1]
+
+def domain_features(text, index=None):
+    """
+    Count link hosts by reputation and brand impersonation.
+
+    Args:
+        text (str): Email text
+        index (DomainIndex, optional): Defaults to the resident index
+
+    Returns:
+        dict: One int per name in DOMAIN_FEATURE_NAMES
+    """
+    if index is None:
+        index = get_domain_index()[0]
+    hosts = extract_hosts(text)
+    features = dict.fromkeys(DOMAIN_FEATURE_NAMES, 0)
+    features["num_domains"] = len(hosts)
+    for result in index.analyze_hosts(hosts[:MAX_HOSTS_PER_EMAIL]):
+        features["bad_domains"] += result["reputation"] == "bad"
+        features["good_domains"] += result["reputation"] == "good"
+        features["lookalike_domains"] += result["brand"] is not None
+        features["ip_hosts"] += result["ip"]
+        features["punycode_hosts"] += result["punycode"]
+    return features
+
+
+# --- Building and updating ---------------------------------------------------
+
+def read_domain_list(path):
+    """Read raw entries from a text file: one domain, hosts-file line or URL per line; '#' starts a comment"""
+    entries = set()
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.split("#", 1)[0].split()
+            if line:
+                entries.add(line[-1])
+    return entries
+
+def merge_sorted(existing, additions):
+    """Insert new domains into a sorted unique array, widening it if needed"""
+    additions = np.array(sorted(additions), dtype=bytes) if additions else np.array([], dtype="S1")
+    width = max(existing.dtype.itemsize, additions.dtype.itemsize)
+    existing, additions = existing.astype(f"S{width}"), additions.astype(f"S{width}")
+    if len(existing):
+        positions = np.searchsorted(existing, additions)
+        present = existing[np.minimum(positions, len(existing) - 1)] == additions
+        additions, positions = additions[~present], positions[~present]
+        return np.insert(existing, positions, additions)
+    return additions
+
+def update_index(additions, brands=None, directory=INDEX_DIR, replace=False):
+    """
+    Add domains to the index on disk, creating it if needed.
+
+    Arrays are replaced atomically and index.json is written last, so running
+    processes pick up the new lists on their next registry check.
+
+    Args:
+        additions (dict): List name ('bad' or 'good') -> iterable of domains
+        brands (dict, optional): Brand list to store; keeps the current one by default
+        directory (str): Index directory
+        replace (bool): Start from empty lists instead of the current ones
+
+    Returns:
+        dict: The written header
+    """
+    from scripts.compact import save_array, save_header
+    import hashlib
+
+    os.makedirs(directory, exist_ok=True)
+    header_path = os.path.join(directory, "index.json")
+    current = None if replace or not os.path.exists(header_path) else load_index(header_path)
+
+    digest = hashlib.sha256()
+    counts = {}
+    for name in LISTS:
+        existing = np.array(current.lists[name]) if current is not None else np.array([], dtype="S1")
+        domains = {_ascii_host(normalize_domain(domain)) for domain in additions.get(name, ())}
+        merged = merge_sorted(existing, {domain for domain in domains if b"." in domain})
+        save_array(directory, f"{name}.npy", merged, digest)
+        counts[name] = len(merged)
+
+    if brands is None:
+        brands = current.brands if current is not None else DEFAULT_BRANDS
+    header = {
+        "format_version": FORMAT_VERSION,
+        "counts": counts,
+        "brands": brands,
+        "digest": digest.hexdigest()[:12],
+    }
+    save_header(directory, "index.json", header)
+    return header
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build, update or query the domain reputation index")
+    parser.add_argument("--bad", action="append", default=[], help="File of known-bad domains (repeatable)")
+    parser.add_argument("--good", action="append", default=[], help="File of known-good domains (repeatable)")
+    parser.add_argument("--brands", help="JSON file of brand name -> official domains")
+    parser.add_argument("--replace", action="store_true", help="Rebuild from the given files only")
+    parser.add_argument("--output", default=INDEX_DIR, help="Index directory")
+    parser.add_argument("--check", nargs="+", metavar="URL", help="Print the verdict for URLs or domains")
+    args = parser.parse_args(argv)
+
+    if args.bad or args.good or args.brands or args.replace:
+        brands = None
+        if args.brands:
+            with open(args.brands) as f:
+                brands = json.load(f)
+        additions = {
+            name: set().union(*(read_domain_list(path) for path in paths))
+            for name, paths in (("bad", args.bad), ("good", args.good))
+        }
+        header = update_index(additions, brands, args.output, args.replace)
+        print(f"Wrote {args.output}: {header['counts']['bad']:,} bad, {header['counts']['good']:,} good domains",
+              file=sys.stderr)
+
+    if args.check:
+        header_path = os.path.join(args.output, "index.json")
+        index = load_index(header_path) if os.path.exists(header_path) else DomainIndex()
+        for value in args.check:
+            host = normalize_domain(value)
+            print(f"{host}: {index.analyze_host(host)}")
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,152 @@
 import re
+import numpy as np
 
-def extract_features(text):
-    features = {}
+# Keyword lists counted as features; each list becomes one column whose value is
+# the total number of occurrences of its words (case-sensitive, like str.count)
+KEYWORD_LISTS = {
+    "urgency_score": ("urgent", "immediately", "verify", "password"),
+}
+
+# Column order of the manual features appended to the TF-IDF matrix
+FEATURE_NAMES = ("num_links", "num_obfuscated") + tuple(KEYWORD_LISTS)
+
+LINK_PATTERN = re.compile(r"http\S+")
+# Same matches as r"\w+[@\$]\w+" (a match always covers the word character just
+# before the symbol), without rescanning each word from every start position
+OBFUSCATED_PATTERN = re.compile(r"\w[@\$]\w+")
+NON_SPACE_RUN = re.compile(r"\S+")
+
+# Up to this many keywords, one C-level str.count per keyword beats a regex scan
+COUNT_SCAN_LIMIT = 24
+
+_LINK_PREFIX = "http"
+
+def _trie_pattern(words):
+    """Build a regex matching the longest of `words` at a position, shaped as a trie"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+class FeatureExtractor:
+    """
+    Counts every manual feature with precompiled scans.
+
+    Small keyword sets use str.count, which is the fastest scan per keyword. Past
+    COUNT_SCAN_LIMIT keywords, all keywords plus the 'http' prefix that starts a
+    link are compiled into one trie-shaped regex, so the cost depends on the text
+    length rather than on the number of keywords. Counts match the original
+    per-feature re.findall and str.count calls exactly.
+    """
+
+    def __init__(self, keyword_lists=KEYWORD_LISTS):
+        self.feature_names = ("num_links", "num_obfuscated") + tuple(keyword_lists)
+
+        # Columns each keyword contributes to
+        self._columns = {}
+        for column, words in enumerate(keyword_lists.values(), start=2):
+            for word in words:
+                self._columns.setdefault(word, []).append(column)
+
+        self._scan = None
+        if len(self._columns) <= COUNT_SCAN_LIMIT:
+            return
+
+        words = set(self._columns) | {_LINK_PREFIX}
+        # A match reports the longest word at a position; shorter words that are
+        # prefixes of it start there too
+        self._prefixes = {
+            word: [other for other in words if word.startswith(other)]
+            for word in words
+        }
+        self._scan = re.compile("(?=(" + _trie_pattern(words) + "))")
 
-    # Number of links
-    features["num_links"] = len(re.findall(r"http\S+", text))
+    def fill_row(self, text, row):
+        """Write the feature counts for `text` into the 1-D array `row`"""
+        row[:] = 0
+        row[1] = sum(1 for _ in OBFUSCATED_PATTERN.finditer(text))
 
-    # Number of obfuscated words (e.g., "p@ypal")
-    features["num_obfuscated"] = len(re.findall(r"\w+[@\$]\w+", text))
+        if self._scan is None:
+            row[0] = len(LINK_PATTERN.findall(text))
+            for word, word_columns in self._columns.items():
+                count = text.count(word)
+                for column in word_columns:
+                    row[column] += count
+            return row
 
-    # Urgency keywords
-    urgency_words = ["urgent", "immediately", "verify", "password"]
-    features["urgency_score"] = sum(text.count(word) for word in urgency_words)
+        # Position where each word may next match; str.count and findall do not overlap
+        next_free = {}
+        link_end = 0
+        columns = self._columns
 
-    return features
\ No newline at end of file
+        for match in self._scan.finditer(text):
+            position = match.start()
+            for word in self._prefixes[match.group(1)]:
+                if position < next_free.get(word, 0):
+                    continue
+                next_free[word] = position + len(word)
+
+                if word == _LINK_PREFIX and position >= link_end:
+                    # A link is 'http' plus at least one non-space character
+                    run = NON_SPACE_RUN.match(text, position + len(word))
+                    if run:
+                        row[0] += 1
+                        link_end = run.end()
+
+                for column in columns.get(word, ()):
+                    row[column] += 1
+
+        return row
+
+    def vector(self, text):
+        """Return the features of one text as a dense 1-D array in FEATURE_NAMES order"""
+        return self.fill_row(text, np.zeros(len(self.feature_names)))
+
+    def batch(self, texts, out=None):
+        """
+        Fill a 2-D array with one feature row per text.
+
+        Args:
+            texts (sequence of str): Texts to featurize
+            out (np.ndarray, optional): Preallocated (len(texts), n_features) array
+
+        Returns:
+            np.ndarray: The filled array
+        """
+        if out is None:
+            out = np.zeros((len(texts), len(self.feature_names)))
+        for i, text in enumerate(texts):
+            self.fill_row(text, out[i])
+        return out
+
+    def as_dict(self, row):
+        """Return the dict view of a feature row"""
+        return {name: int(value) for name, value in zip(self.feature_names, row)}
+
+_default_extractor = FeatureExtractor()
+
+def extract_feature_vector(text):
+    """Return the manual features of `text` as a dense row in FEATURE_NAMES order"""
+    return _default_extractor.vector(text)
+
+def extract_features_batch(texts, out=None):
+    """Return an (n, n_features) array of manual features, filling `out` if given"""
+    return _default_extractor.batch(texts, out)
+
+def features_to_dict(row):
+    """Convert a dense feature row to the dict returned by extract_features"""
+    return _default_extractor.as_dict(row)
+
+def extract_features(text):
+    return features_to_dict(extract_feature_vector(text))
@@ -0,0 +1,90 @@
+"""
+Guarded processing mode: size caps and time budgets for untrusted email bodies.
+
+Before cleaning and feature extraction, guard_email removes inline base64 blobs
+and caps the body at MAX_EMAIL_CHARS by keeping a fixed head and tail. Both steps
+are deterministic, so a given email always gets the same verdict, and training
+(scripts.train) applies the same policy so the model is validated against it.
+clean_email additionally stops HTML parsing once HTML_TIME_BUDGET is spent and
+strips the remaining tags with a linear-time regex.
+
+Environment:
+    SALAIN_GUARD=0                  disable the guard (on by default)
+    SALAIN_MAX_EMAIL_CHARS=100000   characters kept per email
+    SALAIN_HTML_TIME_BUDGET=0.25    seconds of HTML parsing per email
+"""
+import os
+import re
+from scripts import metrics
+
+GUARD_ENABLED = os.getenv("SALAIN_GUARD", "1") == "1"
+MAX_EMAIL_CHARS = int(os.getenv("SALAIN_MAX_EMAIL_CHARS", "100000"))
+HTML_TIME_BUDGET = float(os.getenv("SALAIN_HTML_TIME_BUDGET", "0.25"))
+
+# Share of the cap kept from the start of the body; the rest comes from the end,
+# where signatures and unsubscribe links live
+HEAD_FRACTION = 0.75
+# Bodies are first cut to this many times the cap so the base64 scan is bounded too
+PRESCAN_FACTOR = 4
+
+# Runs of base64 characters at least this long are not natural-language text
+MIN_BASE64_RUN = 200
+# The lookbehind makes each match attempt start at the beginning of a run, so
+# the scan stays linear in the text length
+BASE64_RUN = re.compile(r"(?<![A-Za-z0-9+/])[A-Za-z0-9+/]{%d,}={0,2}" % MIN_BASE64_RUN)
+# MIME-wrapped base64: four or more lines made only of base64 characters
+BASE64_LINES = re.compile(r"(?m)^[A-Za-z0-9+/]{60,}={0,2}\r?(?:\n[A-Za-z0-9+/]{4,}={0,2}\r?$){3,}")
+
+def truncate_text(text, max_chars=MAX_EMAIL_CHARS):
+    """Keep the first HEAD_FRACTION of max_chars and the end of the text"""
+    if len(text) <= max_chars:
+        return text
+    head = int(max_chars * HEAD_FRACTION)
+    tail = max_chars - head
+    return text[:head] + "\n" + (text[-tail:] if tail else "")
+
+def strip_base64(text):
+    """Replace inline base64 blobs (attachments, data: URIs) with a space"""
+    text = BASE64_LINES.sub(" ", text)
+    return BASE64_RUN.sub(" ", text)
+
+def guard_email(text, max_chars=MAX_EMAIL_CHARS, stats=None):
+    """
+    Bound the size of an email body before it is processed.
+
+    Args:
+        text (str): Raw email text
+        max_chars (int): Characters kept after base64 blobs are removed
+        stats (dict, optional): Filled with 'original_chars', 'base64_chars' and 'truncated'
+
+    Returns:
+        str: The guarded text; unchanged for ordinary emails
+    """
+    original_chars = len(text)
+    prescan = truncate_text(text, max_chars * PRESCAN_FACTOR)
+    stripped = strip_base64(prescan)
+    guarded = truncate_text(stripped, max_chars)
+
+    truncated = original_chars > len(prescan) or len(stripped) > len(guarded)
+    base64_chars = len(prescan) - len(stripped)
+    if truncated:
+        metrics.increment("guard_truncations_total")
+    if base64_chars:
+        metrics.increment("guard_base64_stripped_total")
+    if stats is not None:
+        stats.update(original_chars=original_chars, base64_chars=base64_chars, truncated=truncated)
+    return guarded
+
+def guard_if_enabled(text):
+    """Apply guard_email when the guard is enabled"""
+    return guard_email(text) if GUARD_ENABLED else text
+
+def guard_emails(texts):
+    """Apply guard_email to every text when the guard is enabled"""
+    if not GUARD_ENABLED:
+        return list(texts)
+    return [guard_email(text) for text in texts]
+
+def guard_settings():
+    """Settings that change guarded output; part of the training cache key"""
+    return [GUARD_ENABLED, MAX_EMAIL_CHARS, HEAD_FRACTION, PRESCAN_FACTOR, MIN_BASE64_RUN]
@@ -0,0 +1,232 @@
+"""
+Raw RFC 822 / MIME messages: body extraction and header signals.
+
+parse_message walks a message by byte offsets. Multipart bodies are split by
+searching for boundary lines with bytes.find, so attachments are never copied,
+decoded or parsed; only the chosen text/plain (or text/html) part is decoded.
+Header blocks are parsed with the standard library's header-only parser.
+
+Header signals (HEADER_FEATURE_NAMES) are cheap checks on the envelope that the
+body classifier cannot see. They are shown next to the extract_features counts
+and passed to the explanation, but are not part of the model's feature vector.
+"""
+import binascii
+import email.header
+import email.parser
+import email.utils
+import mmap
+import re
+from scripts import metrics
+from scripts.preprocess.guard import GUARD_ENABLED, MAX_EMAIL_CHARS, PRESCAN_FACTOR
+
+HEADER_FEATURE_NAMES = (
+    "reply_to_mismatch", "return_path_mismatch", "received_hops",
+    "spf_fail", "dkim_fail", "dmarc_fail", "num_attachments",
+)
+
+# Body subtypes in order of preference, as in email.message.EmailMessage.get_body
+BODY_PREFERENCE = ("text/plain", "text/html")
+
+# Nested multiparts deeper than this are treated as attachments
+MAX_DEPTH = 8
+# Bytes of the chosen body part decoded in guarded mode; guard_email keeps no more
+MAX_PART_BYTES = MAX_EMAIL_CHARS * PRESCAN_FACTOR if GUARD_ENABLED else None
+
+AUTH_RESULT = re.compile(r"\b(spf|dkim|dmarc)\s*=\s*([a-z]+)", re.IGNORECASE)
+AUTH_FAILURES = {"fail", "softfail", "permerror"}
+
+_header_parser = email.parser.BytesHeaderParser()
+
+def _split_headers(data, start, end):
+    """Return the header block starting at `start` and the offset where its body starts"""
+    position = start
+    while position < end:
+        line_end = data.find(b"\n", position, end)
+        if line_end < 0:
+            break
+        if data[position:line_end] in (b"", b"\r"):
+            return bytes(data[start:position]), line_end + 1
+        position = line_end + 1
+    return bytes(data[start:end]), end
+
+def _is_delimiter_line(data, index, end):
+    """True when the rest of the line after a delimiter is an optional '--' and whitespace"""
+    line_end = data.find(b"\n", index, end)
+    tail = bytes(data[index:end if line_end < 0 else line_end])
+    if tail.startswith(b"--"):
+        tail = tail[2:]
+    return not tail.strip(b" \t\r")
+
+def _find_delimiter(data, delimiter, start, end):
+    """Return the offset of the next line holding only `delimiter`, or -1"""
+    position = start
+    while True:
+        index = data.find(delimiter, position, end)
+        if index < 0:
+            return index
+        if (index == start or data[index - 1] == 0x0A) and _is_delimiter_line(data, index + len(delimiter), end):
+            return index
+        position = index + 1
+
+def _iter_parts(data, start, end, boundary):
+    """Yield the (start, end) byte range of each part of a multipart body"""
+    delimiter = b"--" + boundary
+    position = _find_delimiter(data, delimiter, start, end)
+    while position >= 0:
+        after = position + len(delimiter)
+        if data[after:after + 2] == b"--":
+            return
+        line_end = data.find(b"\n", after, end)
+        if line_end < 0:
+            return
+        part_start = line_end + 1
+        position = _find_delimiter(data, delimiter, part_start, end)
+        part_end = end if position < 0 else position
+        # The line break before a delimiter belongs to the delimiter
+        if part_end > part_start and data[part_end - 1] == 0x0A:
+            part_end -= 1
+            if part_end > part_start and data[part_end - 1] == 0x0D:
+                part_end -= 1
+        yield part_start, part_end
+
+def _walk(data, start, end, headers, bodies, attachments, depth=0):
+    """Record text body candidates and attachments of one entity and its subparts"""
+    content_type = headers.get_content_type()
+    boundary = headers.get_param("boundary")
+    if content_type.startswith("multipart/") and boundary and depth < MAX_DEPTH:
+        boundary = email.utils.collapse_rfc2231_value(boundary).encode("utf-8", "surrogateescape")
+        for part_start, part_end in _iter_parts(data, start, end, boundary):
+            header_block, body_start = _split_headers(data, part_start, part_end)
+            _walk(data, body_start, part_end, _header_parser.parsebytes(header_block),
+                  bodies, attachments, depth + 1)
+        return
+
+    if content_type in BODY_PREFERENCE and headers.get_content_disposition() != "attachment":
+        bodies.setdefault(content_type, (start, end, headers))
+    else:
+        attachments.append({
+            "content_type": content_type,
+            "filename": headers.get_filename(),
+            "bytes": end - start,
+        })
+
+def _decode_body(data, start, end, headers, max_bytes=MAX_PART_BYTES):
+    """Decode one text part according to its transfer encoding and charset"""
+    if max_bytes is not None:
+        end = min(end, start + max_bytes)
+    raw = bytes(data[start:end])
+
+    encoding = str(headers.get("Content-Transfer-Encoding", "")).strip().lower()
+    try:
+        if encoding == "base64":
+            # A part cut at max_bytes may end in an incomplete group
+            raw = raw.translate(None, b" \t\r\n")
+            raw = binascii.a2b_base64(raw[:len(raw) - len(raw) % 4])
+        elif encoding == "quoted-printable":
+            raw = binascii.a2b_qp(raw)
+    except binascii.Error:
+        pass
+
+    charset = headers.get_content_charset() or "utf-8"
+    try:
+        return raw.decode(charset, errors="replace")
+    except LookupError:
+        return raw.decode("utf-8", errors="replace")
+
+def _address_domain(value):
+    """Return the lowercase domain of the first address in a header value"""
+    address = email.utils.parseaddr(str(value or ""))[1]
+    return address.rpartition("@")[2].strip().rstrip(".").lower()
+
+def _domains_differ(first, second):
+    """True when both domains are known and neither is a subdomain of the other"""
+    if not first or not second:
+        return False
+    return not (first == second or first.endswith("." + second) or second.endswith("." + first))
+
+def decode_header_value(value):
+    """Decode RFC 2047 encoded words (=?utf-8?b?...?=) in a header value"""
+    if value is None:
+        return ""
+    try:
+        return str(email.header.make_header(email.header.decode_header(str(value))))
+    except (LookupError, UnicodeError, ValueError, binascii.Error):
+        # Unknown charset or malformed encoded word; show it as received
+        return str(value)
+
+def header_features(headers, num_attachments=0):
+    """
+    Compute envelope signals from the top-level headers of a message.
+
+    Args:
+        headers (email.message.Message): Parsed top-level headers
+        num_attachments (int): Number of non-body parts found in the message
+
+    Returns:
+        dict: One int per name in HEADER_FEATURE_NAMES
+    """
+    sender = _address_domain(headers.get("From"))
+    failed = set()
+    for value in headers.get_all("Authentication-Results", []):
+        for method, result in AUTH_RESULT.findall(str(value)):
+            if result.lower() in AUTH_FAILURES:
+                failed.add(method.lower())
+    received_spf = str(headers.get("Received-SPF", "")).strip().split(" ", 1)[0].lower()
+    if received_spf in AUTH_FAILURES:
+        failed.add("spf")
+
+    return {
+        "reply_to_mismatch": int(_domains_differ(sender, _address_domain(headers.get("Reply-To")))),
+        "return_path_mismatch": int(_domains_differ(sender, _address_domain(headers.get("Return-Path")))),
+        "received_hops": len(headers.get_all("Received", [])),
+        "spf_fail": int("spf" in failed),
+        "dkim_fail": int("dkim" in failed),
+        "dmarc_fail": int("dmarc" in failed),
+        "num_attachments": num_attachments,
+    }
+
+def parse_message(data):
+    """
+    Extract the text body and header signals from a raw message.
+
+    Args:
+        data (bytes or mmap.mmap): The raw RFC 822 message
+
+    Returns:
+        dict: 'body' (decoded text, '' if none), 'content_type' of the chosen part,
+            decoded 'subject', 'features' (header_features) and 'attachments' (content type,
+            filename and size of each skipped part)
+    """
+    with metrics.span("mime_parse"):
+        header_block, body_start = _split_headers(data, 0, len(data))
+        headers = _header_parser.parsebytes(header_block)
+
+        bodies, attachments = {}, []
+        _walk(data, body_start, len(data), headers, bodies, attachments)
+
+        body, content_type = "", None
+        for content_type in BODY_PREFERENCE:
+            if content_type in bodies:
+                body = _decode_body(data, *bodies[content_type])
+                break
+        else:
+            content_type = None
+
+    return {
+        "body": body,
+        "content_type": content_type,
+        "subject": decode_header_value(headers.get("Subject")),
+        "features": header_features(headers, len(attachments)),
+        "attachments": attachments,
+    }
+
+def parse_file(path):
+    """Parse a message file without reading its attachments into memory"""
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            return parse_message(b"")
+        with data:
+            return parse_message(data)
@@ -0,0 +1,273 @@
+import hashlib
+import os
+import threading
+import time
+import joblib
+from scripts import metrics
+
+MODEL_PATH = "models/malicious_email_classifier.pkl"
+VECTORIZER_PATH = "models/tfidf_vectorizer.pkl"
+# First tier of the cascade (scripts.cascade), trained by scripts.train
+LINEAR_MODEL_PATH = "models/logreg.pkl"
+
+# Memory-mapped artifacts written by `python -m scripts.compact`; used instead of
+# the pickles when SALAIN_COMPACT_ARTIFACTS=1
+COMPACT_MODEL_PATH = "models/compact/model.json"
+COMPACT_VECTORIZER_PATH = "models/compact/vectorizer.json"
+COMPACT_LINEAR_MODEL_PATH = "models/compact_logreg/model.json"
+USE_COMPACT_ARTIFACTS = os.getenv("SALAIN_COMPACT_ARTIFACTS", "0") == "1"
+
+# Seconds between stat() checks for a changed artifact on disk
+RELOAD_CHECK_INTERVAL = 2.0
+
+
+def _file_stamp(path):
+    """Return a cheap fingerprint of a file that changes when it is replaced"""
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def _file_digest(path):
+    """Return a short content hash used as the artifact version"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+class ArtifactRegistry:
+    """
+    Process-wide cache of unpickled model artifacts.
+
+    Each artifact is loaded once and shared by every thread (and so every
+    Streamlit session) in the process. When the file on disk changes, the new
+    version is loaded in full and then swapped in, so callers always see either
+    the old or the new object, never a half-loaded one.
+
+    Artifacts that only work together (a classifier and the vectorizer it was
+    trained on) are fetched as a group with get_group. A group is reloaded and
+    swapped as one unit, and only once its files have stopped changing for a
+    check interval, so a retrain that replaces both files is never served as a
+    new model with the old vectorizer.
+    """
+
+    def __init__(self, loader=joblib.load, check_interval=RELOAD_CHECK_INTERVAL):
+        self._loader = loader
+        self._check_interval = check_interval
+        self._entries = {}
+        # path -> (stamp, digest) of files hashed by peek_version
+        self._digests = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _lock_for(self, paths):
+        with self._locks_guard:
+            return self._locks.setdefault(paths, threading.Lock())
+
+    def _load(self, paths, stamps):
+        objects = []
+        for path in paths:
+            with metrics.span("model_load", artifact=os.path.basename(path)):
+                objects.append(self._loader(path))
+            metrics.increment("model_loads_total", artifact=os.path.basename(path))
+        return {
+            "objects": tuple(objects),
+            "stamps": stamps,
+            "versions": tuple(_file_digest(path) for path in paths),
+            "loaded_at": time.time(),
+            "checked_at": time.monotonic(),
+        }
+
+    def get(self, path):
+        """
+        Return the resident object for an artifact, loading or reloading it if needed.
+
+        Args:
+            path (str): Path of the pickled artifact
+
+        Returns:
+            object: The unpickled artifact
+        """
+        return self.get_versioned(path)[0]
+
+    def version(self, path):
+        """Return the content hash of the currently loaded artifact"""
+        return self.get_versioned(path)[1]
+
+    def get_versioned(self, path):
+        """
+        Return the resident object for an artifact and the version it was loaded from.
+
+        Returns:
+            tuple: (object, version)
+        """
+        objects, version = self.get_group((path,))
+        return objects[0], version
+
+    def get_group(self, paths):
+        """
+        Return artifacts that are loaded and swapped together, and their combined version.
+
+        Args:
+            paths (tuple): Paths of the pickled artifacts
+
+        Returns:
+            tuple: (tuple of objects in the order of `paths`, version); the version
+                joins the content hash of each file with '-'
+        """
+        entry = self._entry(tuple(paths))
+        return entry["objects"], "-".join(entry["versions"])
+
+    def peek_version(self, paths):
+        """
+        Return the version get_group would report for the files on disk, without loading them.
+
+        Only stat()s the files; a file is hashed again only when it has changed.
+
+        Raises:
+            OSError: If a file is missing
+        """
+        entry = self._entries.get(tuple(paths))
+        versions = []
+        for index, path in enumerate(paths):
+            stamp = _file_stamp(path)
+            if entry is not None and entry["stamps"][index] == stamp:
+                versions.append(entry["versions"][index])
+                continue
+            cached = self._digests.get(path)
+            if cached is None or cached[0] != stamp:
+                cached = self._digests[path] = (stamp, _file_digest(path))
+            versions.append(cached[1])
+        return "-".join(versions)
+
+    def _entry(self, paths):
+        entry = self._entries.get(paths)
+        if entry is not None and time.monotonic() - entry["checked_at"] < self._check_interval:
+            return entry
+
+        with self._lock_for(paths):
+            # Another thread may have refreshed the entry while we waited
+            entry = self._entries.get(paths)
+            if entry is not None and time.monotonic() - entry["checked_at"] < self._check_interval:
+                return entry
+
+            try:
+                stamps = tuple(_file_stamp(path) for path in paths)
+            except OSError:
+                if entry is None:
+                    raise
+                # File is being replaced; keep serving the resident version
+                entry["checked_at"] = time.monotonic()
+                return entry
+
+            if entry is not None and (
+                entry["stamps"] == stamps
+                # Other files of the group may still be on their way
+                or time.time() - max(stamp[0] for stamp in stamps) / 1e9 < self._check_interval
+            ):
+                entry["checked_at"] = time.monotonic()
+                return entry
+
+            try:
+                new_entry = self._load(paths, stamps)
+                if entry is not None and tuple(_file_stamp(path) for path in paths) != stamps:
+                    raise RuntimeError("Artifacts changed while loading")
+            except Exception:
+                if entry is None:
+                    raise
+                entry["checked_at"] = time.monotonic()
+                return entry
+
+            self._entries[paths] = new_entry
+            return new_entry
+
+    def info(self):
+        """Return version and load time for every resident artifact"""
+        return {
+            path: {"version": version, "loaded_at": entry["loaded_at"]}
+            for paths, entry in self._entries.items()
+            for path, version in zip(paths, entry["versions"])
+        }
+
+
+def _load_compact(path):
+    from scripts.compact import load_compact
+    return load_compact(path)
+
+
+# Shared by every caller in the process
+registry = ArtifactRegistry()
+compact_registry = ArtifactRegistry(loader=_load_compact)
+
+
+def _artifact_paths():
+    if USE_COMPACT_ARTIFACTS:
+        return compact_registry, COMPACT_MODEL_PATH, COMPACT_VECTORIZER_PATH, COMPACT_LINEAR_MODEL_PATH
+    return registry, MODEL_PATH, VECTORIZER_PATH, LINEAR_MODEL_PATH
+
+
+def get_linear_model():
+    """
+    Return the resident first-tier logistic model and its version.
+
+    Returns:
+        tuple: (model, model_version)
+    """
+    artifacts, _, _, linear_model_path = _artifact_paths()
+    return artifacts.get_versioned(linear_model_path)
+
+
+def get_classifier_artifacts(cascade=None):
+    """
+    Return the resident classifier, vectorizer and their combined version.
+
+    Args:
+        cascade (bool, optional): Wrap the classifier in the confidence-gated
+            cascade; defaults to SALAIN_CASCADE
+
+    Returns:
+        tuple: (model, tfidf_vectorizer, model_version)
+    """
+    artifacts, model_path, vectorizer_path, linear_model_path = _artifact_paths()
+
+    from scripts import cascade as cascade_module
+    if cascade_module.CASCADE_ENABLED if cascade is None else cascade:
+        # The linear tier reads the same features, so it is swapped with the pair
+        try:
+            (model, tfidf_vectorizer, linear), version = artifacts.get_group(
+                (model_path, vectorizer_path, linear_model_path)
+            )
+        except OSError as e:
+            cascade_module.warn_linear_missing(e)
+        else:
+            return cascade_module.wrap(model, linear), tfidf_vectorizer, cascade_module.cascade_version(version)
+
+    (model, tfidf_vectorizer), version = artifacts.get_group((model_path, vectorizer_path))
+    return model, tfidf_vectorizer, version
+
+
+def get_model_version():
+    """Return the version string of the loaded classifier and vectorizer"""
+    return get_classifier_artifacts()[2]
+
+
+def peek_model_version(cascade=None):
+    """
+    Return the version get_model_version reports for the artifacts on disk, without loading them.
+
+    For processes that key caches on the model but score elsewhere, such as the
+    scoring service with worker processes. Right after a retrain this can name
+    the new files before get_model_version has swapped them in.
+    """
+    artifacts, model_path, vectorizer_path, linear_model_path = _artifact_paths()
+
+    from scripts import cascade as cascade_module
+    if cascade_module.CASCADE_ENABLED if cascade is None else cascade:
+        try:
+            return cascade_module.cascade_version(
+                artifacts.peek_version((model_path, vectorizer_path, linear_model_path))
+            )
+        except OSError:
+            pass
+    return artifacts.peek_version((model_path, vectorizer_path))
@@ -0,0 +1,396 @@
+"""
+Headless bulk scorer for email corpora.
+
+Streams messages from an mbox file, a Maildir, a CSV or a JSONL file, scores
+them in chunks through the scripts.classical pipeline across a process pool and
+writes results incrementally. A checkpoint written after every chunk lets an
+interrupted run continue where it stopped.
+
+Usage:
+    python -m scripts.score emails.mbox -o results.jsonl
+    python -m scripts.score emails.csv --text-field body -o results.parquet --workers 8
+    python -m scripts.score emails.mbox -o results.jsonl --resume
+
+Parquet output is a directory of part files (results.parquet/part-00000.parquet,
+...), one per committed chunk, readable as one dataset with pandas or pyarrow.
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+INPUT_FORMATS = ["mbox", "maildir", "csv", "jsonl"]
+OUTPUT_FORMATS = ["jsonl", "parquet"]
+
+
+# --- Input readers -----------------------------------------------------------
+# Each reader yields (offset, record_id, payload). Payload is raw message bytes
+# for mbox/Maildir and already-extracted text for CSV/JSONL; message parsing is
+# left to the workers so it scales with the pool. A record that cannot be read
+# has a RecordError payload and is written as an error result.
+
+class RecordError:
+    """Payload of an unreadable record; carries the reason into the results"""
+
+    def __init__(self, message):
+        self.message = message
+
+def _read_mbox(path, start_offset=0):
+    """Lazily split an mbox file on 'From ' separator lines"""
+    offset = 0
+    lines = []
+    # Messages before start_offset are only counted, so track their shape separately
+    has_lines, last_line = False, None
+    with open(path, "rb") as f:
+        for line in f:
+            if line.startswith(b"From ") and (not has_lines or last_line in (b"\n", b"\r\n")):
+                if has_lines:
+                    if offset >= start_offset:
+                        yield offset, str(offset), b"".join(lines)
+                    offset += 1
+                    lines = []
+                    has_lines = False
+                continue
+            has_lines, last_line = True, line
+            if offset >= start_offset:
+                lines.append(line)
+        if has_lines and offset >= start_offset:
+            yield offset, str(offset), b"".join(lines)
+
+def _read_maildir(path, start_offset=0):
+    """Yield messages from a Maildir's cur/ and new/ folders in name order"""
+    offset = 0
+    for folder in ("cur", "new"):
+        folder_path = os.path.join(path, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for name in sorted(os.listdir(folder_path)):
+            if offset >= start_offset:
+                with open(os.path.join(folder_path, name), "rb") as f:
+                    yield offset, name, f.read()
+            offset += 1
+
+def _read_csv(path, text_field, id_field, start_offset=0):
+    csv.field_size_limit(sys.maxsize)
+    with open(path, newline="", encoding="utf-8", errors="replace") as f:
+        rows = islice(enumerate(csv.DictReader(f)), start_offset, None)
+        for offset, row in rows:
+            record_id = row.get(id_field) if id_field else None
+            yield offset, record_id or str(offset), row.get(text_field) or ""
+
+def _read_jsonl(path, text_field, id_field, start_offset=0):
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for offset, line in islice(enumerate(f), start_offset, None):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield offset, str(offset), RecordError(f"Invalid JSON: {e}")
+                continue
+            if not isinstance(row, dict):
+                yield offset, str(offset), RecordError(f"Expected a JSON object, got {type(row).__name__}")
+                continue
+            record_id = row.get(id_field) if id_field else None
+            text = row.get(text_field)
+            yield offset, str(record_id) if record_id is not None else str(offset), "" if text is None else str(text)
+
+def detect_input_format(path):
+    """Guess the input format from the path"""
+    if os.path.isdir(path):
+        return "maildir"
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    return "mbox"
+
+def iter_records(path, input_format, text_field="body", id_field=None, start_offset=0):
+    """
+    Lazily yield (offset, record_id, payload) tuples from a corpus.
+
+    Args:
+        path (str): Input file or Maildir directory
+        input_format (str): One of INPUT_FORMATS
+        text_field (str): Column/key holding the email text (CSV/JSONL)
+        id_field (str, optional): Column/key holding a record id (CSV/JSONL)
+        start_offset (int): Skip records before this offset without reading
+            their contents (used when resuming)
+    """
+    if input_format == "mbox":
+        return _read_mbox(path, start_offset)
+    if input_format == "maildir":
+        return _read_maildir(path, start_offset)
+    if input_format == "csv":
+        return _read_csv(path, text_field, id_field, start_offset)
+    if input_format == "jsonl":
+        return _read_jsonl(path, text_field, id_field, start_offset)
+    raise ValueError(f"Unsupported input format: {input_format}")
+
+def message_body(raw_message):
+    """Return the text body of a raw RFC 822 message, preferring text/plain"""
+    # Attachments are skipped without being decoded
+    from scripts.preprocess.mime import parse_message
+    return parse_message(raw_message)["body"]
+
+
+# --- Workers -----------------------------------------------------------------
+
+def _record_text(payload):
+    """Return the text of a record payload, or a RecordError if it has none"""
+    if isinstance(payload, bytes):
+        try:
+            return message_body(payload)
+        except Exception as e:
+            return RecordError(f"Unparseable message: {e}")
+    return payload
+
+def _score_chunk(records):
+    """Score one chunk of records; runs inside a pool worker"""
+    from scripts.classical import classify_emails
+
+    texts = [_record_text(payload) for _, _, payload in records]
+    readable = [text for text in texts if not isinstance(text, RecordError)]
+    scores = iter(classify_emails(readable, chunk_size=len(readable)) if readable else ())
+
+    results = []
+    for (offset, record_id, _), text in zip(records, texts):
+        if isinstance(text, RecordError):
+            results.append({
+                "offset": offset,
+                "id": record_id,
+                "prediction": None,
+                "label": None,
+                "probability": None,
+                "error": text.message,
+            })
+            continue
+        label, probability = next(scores)
+        results.append({
+            "offset": offset,
+            "id": record_id,
+            "prediction": int(label),
+            "label": "malicious" if label == 1 else "safe",
+            "probability": probability,
+            "error": None,
+        })
+    return results
+
+def _warm_worker():
+    """Load model artifacts once when a pool worker starts"""
+    from scripts.registry import get_classifier_artifacts
+    get_classifier_artifacts()
+
+
+# --- Output writers ----------------------------------------------------------
+
+class JsonlWriter:
+    def __init__(self, path, checkpoint=None):
+        truncate_to = checkpoint.get("output_bytes", 0) if checkpoint else 0
+        self._file = open(path, "ab")
+        # Drop anything written after the last checkpoint, or a previous run's output
+        self._file.truncate(truncate_to)
+        self._file.seek(truncate_to)
+
+    def write(self, results):
+        self._file.write("".join(json.dumps(result) + "\n" for result in results).encode("utf-8"))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def position(self):
+        """Checkpoint fields recording how much output is complete"""
+        return {"output_bytes": self._file.tell()}
+
+    def close(self):
+        self._file.close()
+
+class ParquetWriter:
+    """
+    Writes each committed chunk as its own part file in the output directory.
+
+    A Parquet file is only readable once its footer is written, so a single
+    file would be lost if the run were killed. Each part is written to a
+    temporary name and renamed when complete, and the checkpoint records how
+    many parts are done; parts beyond that are removed on resume.
+    """
+
+    def __init__(self, path, checkpoint=None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow)") from e
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self._schema = pyarrow.schema([
+            ("offset", pyarrow.int64()),
+            ("id", pyarrow.string()),
+            ("prediction", pyarrow.int64()),
+            ("label", pyarrow.string()),
+            ("probability", pyarrow.float64()),
+            ("error", pyarrow.string()),
+        ])
+        self.path = path
+        self.parts = checkpoint.get("parts", 0) if checkpoint else 0
+
+        if os.path.isfile(path):
+            # Output of an earlier single-file run; replaced, as before
+            os.remove(path)
+        os.makedirs(path, exist_ok=True)
+        # Parts written after the checkpoint, or left half-written by a crash
+        for part_path in glob.glob(os.path.join(path, "part-*.parquet*")):
+            index = self._part_index(part_path)
+            if index is None or index >= self.parts:
+                os.remove(part_path)
+
+    def _part_path(self, index):
+        return os.path.join(self.path, f"part-{index:05d}.parquet")
+
+    def _part_index(self, part_path):
+        name = os.path.basename(part_path)
+        digits = name[len("part-"):-len(".parquet")]
+        return int(digits) if name.endswith(".parquet") and digits.isdigit() else None
+
+    def write(self, results):
+        part_path = self._part_path(self.parts)
+        self._pq.write_table(self._pa.Table.from_pylist(results, schema=self._schema), part_path + ".tmp")
+        os.replace(part_path + ".tmp", part_path)
+        self.parts += 1
+
+    def position(self):
+        """Checkpoint fields recording how much output is complete"""
+        return {"parts": self.parts}
+
+    def close(self):
+        pass
+
+
+# --- Checkpoints -------------------------------------------------------------
+
+def _checkpoint_path(output_path):
+    return output_path.rstrip(os.sep) + ".checkpoint"
+
+def load_checkpoint(output_path):
+    """Return the saved checkpoint for an output file, or None"""
+    try:
+        with open(_checkpoint_path(output_path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save_checkpoint(output_path, next_offset, position):
+    """
+    Atomically record how far scoring got.
+
+    Args:
+        next_offset (int): First input offset not yet written
+        position (dict): The writer's position() fields
+    """
+    temp_path = _checkpoint_path(output_path) + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump({"next_offset": next_offset, **position}, f)
+    os.replace(temp_path, _checkpoint_path(output_path))
+
+
+# --- Driver ------------------------------------------------------------------
+
+def _chunks(records, chunk_size):
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def score_corpus(input_path, output_path, input_format=None, output_format=None,
+                 text_field="body", id_field=None, chunk_size=500, workers=None,
+                 resume=False, progress=True):
+    """
+    Score a corpus and write one result per message.
+
+    At most two chunks per worker are in flight, so memory use does not depend
+    on corpus size. Results are written in input order. A record that cannot
+    be read (malformed JSON, a non-object row, an unparseable message) gets a
+    result with null scores and an 'error' instead of stopping the run.
+
+    Returns:
+        int: Number of messages scored in this run
+    """
+    input_format = input_format or detect_input_format(input_path)
+    output_format = output_format or ("parquet" if output_path.rstrip(os.sep).endswith(".parquet") else "jsonl")
+    workers = workers or os.cpu_count() or 1
+
+    checkpoint = load_checkpoint(output_path) if resume else None
+    start_offset = checkpoint["next_offset"] if checkpoint else 0
+    writer = (ParquetWriter if output_format == "parquet" else JsonlWriter)(output_path, checkpoint)
+
+    records = iter_records(input_path, input_format, text_field=text_field, id_field=id_field,
+                           start_offset=start_offset)
+
+    scored = 0
+    started = time.perf_counter()
+
+    def _commit(results):
+        nonlocal scored
+        writer.write(results)
+        scored += len(results)
+        save_checkpoint(output_path, results[-1]["offset"] + 1, writer.position())
+        if progress:
+            rate = scored / max(time.perf_counter() - started, 1e-9)
+            print(f"\rScored {scored:,} emails ({rate:,.0f} emails/sec)", end="", file=sys.stderr)
+
+    try:
+        if workers == 1:
+            for chunk in _chunks(records, chunk_size):
+                _commit(_score_chunk(chunk))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_warm_worker) as pool:
+                pending = deque()
+                for chunk in _chunks(records, chunk_size):
+                    pending.append(pool.submit(_score_chunk, chunk))
+                    if len(pending) >= workers * 2:
+                        _commit(pending.popleft().result())
+                while pending:
+                    _commit(pending.popleft().result())
+    finally:
+        writer.close()
+        if progress:
+            print(file=sys.stderr)
+
+    return scored
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score an email corpus with the Salain classifier")
+    parser.add_argument("input", help="mbox file, Maildir directory, CSV or JSONL file")
+    parser.add_argument("-o", "--output", required=True, help="Output .jsonl file or .parquet directory")
+    parser.add_argument("--input-format", choices=INPUT_FORMATS, help="Defaults to a guess from the path")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, help="Defaults to a guess from the output path")
+    parser.add_argument("--text-field", default="body", help="CSV column / JSON key with the email text")
+    parser.add_argument("--id-field", help="CSV column / JSON key with a record id")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Emails scored per task")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--resume", action="store_true", help="Continue from the last checkpoint")
+    parser.add_argument("--quiet", action="store_true", help="Do not print progress")
+    args = parser.parse_args(argv)
+
+    score_corpus(
+        args.input,
+        args.output,
+        input_format=args.input_format,
+        output_format=args.output_format,
+        text_field=args.text_field,
+        id_field=args.id_field,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        resume=args.resume,
+        progress=not args.quiet,
+    )
+
+if __name__ == "__main__":
+    main()
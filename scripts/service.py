@@ -0,0 +1,548 @@
+"""
+Headless HTTP scoring service.
+
+Exposes the classifier, the LLM explainer and OCR over plain HTTP/1.1 so that
+a mail gateway (or the Streamlit app, through scripts.client) can call them
+without running the UI. Built on asyncio.start_server from the standard library.
+
+Concurrent classify requests are collected into micro-batches: a batch is
+closed once it holds max_batch_size emails or max_wait seconds after its first
+email arrived, whichever comes first, and is then scored with one TF-IDF
+transform and one predict_proba call on a worker. Requests wait in a bounded
+queue; when it is full the service answers 503 with Retry-After instead of
+queueing without limit.
+
+Endpoints:
+    POST /classify  {"text": "..."} or {"texts": ["...", ...]}
+    POST /explain   {"text": "...", "prediction": 1, "confidence": 0.93, "features": {...}}
+                    (prediction and confidence are computed when omitted)
+    POST /ocr       raw image bytes
+    GET  /healthz
+    GET  /metrics   Prometheus text format
+
+Usage:
+    python -m scripts.service --port 8080
+    python -m scripts.service --workers 4 --processes --max-batch-size 64 --max-wait-ms 5
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit
+from scripts import metrics
+from scripts.cache import classification_cache
+
+logger = logging.getLogger("salain.service")
+
+DEFAULT_HOST = os.getenv("SALAIN_SERVICE_HOST", "127.0.0.1")
+DEFAULT_PORT = int(os.getenv("SALAIN_SERVICE_PORT", "8080"))
+
+# Micro-batching: close a batch at this many emails or this long after its first email
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT = 0.005
+# Emails waiting to be batched before new requests are rejected
+DEFAULT_MAX_QUEUE = 1024
+
+# Largest request body accepted, in bytes
+MAX_BODY_BYTES = int(os.getenv("SALAIN_SERVICE_MAX_BODY", str(10 * 1024 * 1024)))
+# Seconds an idle keep-alive connection stays open
+KEEPALIVE_TIMEOUT = 15.0
+# Seconds clients are asked to wait after a 503
+RETRY_AFTER = 1
+
+
+class HttpError(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(message or HTTPStatus(status).phrase)
+        self.status = status
+
+
+class Overloaded(HttpError):
+    """Raised when a queue is full; answered with 503 and Retry-After"""
+
+    def __init__(self, message="Service overloaded, retry later"):
+        super().__init__(503, message)
+
+
+# --- Work run on executors ---------------------------------------------------
+
+def _classify_batch(texts):
+    """Score one micro-batch; runs on a worker thread or process"""
+    from scripts.classical import classify_email_batch
+    from scripts.registry import get_classifier_artifacts
+    artifacts = get_classifier_artifacts()
+    return classify_email_batch(texts, artifacts), artifacts[2]
+
+def _current_model_version():
+    # Stats the artifacts instead of loading them: with --processes the model
+    # only lives in the workers
+    from scripts.registry import peek_model_version
+    return peek_model_version()
+
+def _cache_key(model_version, text):
+    from scripts.classical import classification_key
+    return classification_key(model_version, text)
+
+def _warm_worker():
+    """Load model artifacts once when a worker process starts"""
+    from scripts.registry import get_classifier_artifacts
+    get_classifier_artifacts()
+
+def _explain(text, prediction, confidence, features, deadline):
+    from scripts.llm import stream_llm_explanation
+    timings = {}
+    explanation = "".join(stream_llm_explanation(
+        text, prediction, confidence, features, deadline=deadline, timings=timings
+    ))
+    return explanation, timings
+
+def _ocr(image_bytes, pool_size):
+    from PIL import Image
+    from scripts.ocr import get_ocr_pool, ocr_image
+    return ocr_image(Image.open(io.BytesIO(image_bytes)), get_ocr_pool(pool_size))
+
+
+# --- Micro-batching ----------------------------------------------------------
+
+class MicroBatcher:
+    """
+    Collects concurrent classify requests into small, time-bounded batches.
+
+    `workers` batch loops run concurrently, each submitting its batch to the
+    executor, so up to `workers` batches are scored at the same time while the
+    next ones fill up.
+    """
+
+    def __init__(self, executor, workers=1, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait=DEFAULT_MAX_WAIT, max_queue=DEFAULT_MAX_QUEUE):
+        self.executor = executor
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.model_version = None
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def submit(self, text):
+        """
+        Queue one email for classification.
+
+        Returns:
+            asyncio.Future: Resolves to ((label, probability, features dict), model_version)
+                with the version of the model that scored the batch
+
+        Raises:
+            Overloaded: If the queue is full
+        """
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((text, future))
+        except asyncio.QueueFull:
+            metrics.increment("service_rejected_total", endpoint="classify")
+            raise Overloaded()
+        return future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        closes_at = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without waiting
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = closes_at - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Skip requests whose client has already gone away
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            metrics.increment("service_batches_total")
+            metrics.increment("service_batched_emails_total", len(batch))
+            try:
+                with metrics.span("service_batch"):
+                    results, model_version = await loop.run_in_executor(
+                        self.executor, _classify_batch, [text for text, _ in batch]
+                    )
+                self.model_version = model_version
+            except Exception as e:
+                logger.exception("Batch classification failed")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result((result, model_version))
+
+
+class _Limiter:
+    """Caps the number of in-flight requests for one endpoint"""
+
+    def __init__(self, endpoint, limit):
+        self.endpoint = endpoint
+        self.limit = limit
+        self.active = 0
+
+    def __enter__(self):
+        if self.active >= self.limit:
+            metrics.increment("service_rejected_total", endpoint=self.endpoint)
+            raise Overloaded()
+        self.active += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self.active -= 1
+        return False
+
+
+# --- HTTP --------------------------------------------------------------------
+
+class Request:
+    def __init__(self, method, path, headers, body):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        try:
+            payload = json.loads(self.body or b"{}")
+        except ValueError:
+            raise HttpError(400, "Request body is not valid JSON")
+        if not isinstance(payload, dict):
+            raise HttpError(400, "Request body must be a JSON object")
+        return payload
+
+
+async def _read_request(reader):
+    """Parse one HTTP/1.1 request, or return None when the client closed the connection"""
+    try:
+        request_line = await reader.readline()
+    except (asyncio.LimitOverrunError, ValueError):
+        raise HttpError(414)
+    if not request_line:
+        return None
+
+    try:
+        method, target, version = request_line.decode("latin-1").split()
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+
+    headers = {}
+    while True:
+        try:
+            line = await reader.readline()
+        except (asyncio.LimitOverrunError, ValueError):
+            raise HttpError(431)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+        if len(headers) > 100:
+            raise HttpError(431)
+
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise HttpError(400, "Invalid Content-Length")
+    if length < 0:
+        raise HttpError(400, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413)
+    body = await reader.readexactly(length) if length else b""
+
+    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+    return Request(method.upper(), urlsplit(target).path, headers, body), keep_alive
+
+
+def _encode_response(status, body, content_type, keep_alive, extra_headers=()):
+    head = [
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    head += [f"{name}: {value}" for name, value in extra_headers]
+    return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+
+def _json_body(payload):
+    return json.dumps(payload).encode("utf-8"), "application/json"
+
+
+# --- Service -----------------------------------------------------------------
+
+class ScoringService:
+    """
+    Routes HTTP requests to the classifier, the explainer and OCR.
+
+    Args:
+        workers (int): Concurrent classification batches
+        processes (bool): Score batches in worker processes instead of threads
+        max_batch_size (int): Most emails per micro-batch
+        max_wait (float): Seconds a batch stays open after its first email
+        max_queue (int): Emails waiting to be batched before requests get a 503
+        llm_workers (int): Concurrent explanation requests
+        ocr_workers (int): Concurrent OCR requests, each borrowing its own model from the pool
+        explain_deadline (float, optional): Seconds to wait for the LLM before falling back
+    """
+
+    def __init__(self, workers=1, processes=False, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait=DEFAULT_MAX_WAIT, max_queue=DEFAULT_MAX_QUEUE, llm_workers=4,
+                 ocr_workers=1, explain_deadline=None):
+        if processes:
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_warm_worker)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="classify")
+        self.llm_executor = ThreadPoolExecutor(max_workers=llm_workers, thread_name_prefix="explain")
+        self.ocr_executor = ThreadPoolExecutor(max_workers=ocr_workers, thread_name_prefix="ocr")
+
+        self.batcher = MicroBatcher(self.executor, workers, max_batch_size, max_wait, max_queue)
+        # Requests beyond a few per worker are rejected rather than queued
+        self.explain_limiter = _Limiter("explain", llm_workers * 4)
+        self.ocr_limiter = _Limiter("ocr", ocr_workers * 4)
+        self.explain_deadline = explain_deadline
+        self.ocr_workers = ocr_workers
+
+        self.routes = {
+            ("POST", "/classify"): self.classify,
+            ("POST", "/explain"): self.explain,
+            ("POST", "/ocr"): self.ocr,
+            ("GET", "/healthz"): self.healthz,
+            ("GET", "/metrics"): self.metrics,
+        }
+        self.started_at = time.time()
+
+    async def start(self):
+        """Load the model and start the batch loops"""
+        loop = asyncio.get_running_loop()
+        _, self.batcher.model_version = await loop.run_in_executor(self.executor, _classify_batch, [""])
+        self.batcher.start()
+
+    async def close(self):
+        await self.batcher.close()
+        for executor in (self.executor, self.llm_executor, self.ocr_executor):
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    # Endpoints return (status, body bytes, content type)
+
+    async def _classify_one(self, text):
+        """Return ((label, probability, features), model_version) for one email"""
+        # Same keys as classify_email_cached, so both share cached results. The
+        # version is read per request so a hot-reloaded model is never answered
+        # from the old model's entries; hashing a changed file is slow, so keep it
+        # off the event loop
+        loop = asyncio.get_running_loop()
+        model_version = await loop.run_in_executor(None, _current_model_version)
+        cached = classification_cache.get(_cache_key(model_version, text))
+        if cached is not None:
+            return cached, model_version
+
+        result, model_version = await self.batcher.submit(text)
+        # Stored under the version of the model that actually scored it
+        classification_cache.set(_cache_key(model_version, text), list(result))
+        return result, model_version
+
+    def _classification(self, result, model_version):
+        label, probability, features = result
+        return {
+            "prediction": int(label),
+            "label": "malicious" if label == 1 else "safe",
+            "probability": probability,
+            "features": features,
+            "model_version": model_version,
+        }
+
+    async def classify(self, request):
+        payload = request.json()
+        if isinstance(payload.get("text"), str):
+            result, model_version = await self._classify_one(payload["text"])
+            return (200, *_json_body(self._classification(result, model_version)))
+
+        texts = payload.get("texts")
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            raise HttpError(400, "Expected 'text' (string) or 'texts' (list of strings)")
+        if len(texts) > self.batcher.queue.maxsize:
+            raise HttpError(413, f"At most {self.batcher.queue.maxsize} texts per request")
+        results = await asyncio.gather(*(self._classify_one(text) for text in texts))
+        return (200, *_json_body({"results": [self._classification(*result) for result in results]}))
+
+    async def explain(self, request):
+        payload = request.json()
+        text = payload.get("text")
+        if not isinstance(text, str):
+            raise HttpError(400, "Expected 'text' (string)")
+
+        prediction, confidence, features = payload.get("prediction"), payload.get("confidence"), payload.get("features")
+        if prediction is not None and (isinstance(prediction, bool) or prediction not in (0, 1)):
+            raise HttpError(400, "Expected 'prediction' to be 0 or 1")
+        if confidence is not None and (
+            isinstance(confidence, bool) or not isinstance(confidence, (int, float)) or not 0 <= confidence <= 1
+        ):
+            raise HttpError(400, "Expected 'confidence' to be a number between 0 and 1")
+        if features is not None and not isinstance(features, dict):
+            raise HttpError(400, "Expected 'features' to be an object")
+
+        with self.explain_limiter:
+            if prediction is None or confidence is None:
+                (prediction, confidence, classified_features), _ = await self._classify_one(text)
+                features = features if features is not None else classified_features
+
+            loop = asyncio.get_running_loop()
+            explanation, timings = await loop.run_in_executor(
+                self.llm_executor, _explain, text, int(prediction), float(confidence), features,
+                self.explain_deadline,
+            )
+        return (200, *_json_body({
+            "explanation": explanation,
+            "fallback": timings.get("fallback", False),
+            "truncated": timings.get("truncated", False),
+            "prediction": int(prediction),
+            "probability": float(confidence),
+            "timings": {key: value for key, value in timings.items() if key in ("first_token", "total")},
+        }))
+
+    async def ocr(self, request):
+        if not request.body:
+            raise HttpError(400, "Expected image bytes in the request body")
+        with self.ocr_limiter:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.ocr_executor, _ocr, request.body, self.ocr_workers)
+        if result["error"]:
+            raise HttpError(422, result["error"])
+        return (200, *_json_body(result))
+
+    async def healthz(self, request):
+        return (200, *_json_body({
+            "status": "ok",
+            "model_version": self.batcher.model_version,
+            "queue_depth": self.batcher.queue.qsize(),
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+        }))
+
+    async def metrics(self, request):
+        return 200, metrics.render_prometheus().encode(), "text/plain; version=0.0.4"
+
+    async def _dispatch(self, request):
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            known_path = any(path == request.path for _, path in self.routes)
+            raise HttpError(405 if known_path else 404)
+        endpoint = request.path.strip("/")
+        started = time.perf_counter()
+        try:
+            return await handler(request)
+        finally:
+            metrics.observe("service_request_seconds", time.perf_counter() - started, endpoint=endpoint)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                keep_alive = False
+                extra_headers = ()
+                try:
+                    parsed = await asyncio.wait_for(_read_request(reader), KEEPALIVE_TIMEOUT)
+                    if parsed is None:
+                        break
+                    request, keep_alive = parsed
+                    status, body, content_type = await self._dispatch(request)
+                except HttpError as e:
+                    # keep_alive stays False when the request itself could not be parsed
+                    status, (body, content_type) = e.status, _json_body({"error": str(e)})
+                    if isinstance(e, Overloaded):
+                        extra_headers = [("Retry-After", RETRY_AFTER)]
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as e:
+                    logger.exception("Request failed")
+                    keep_alive = False
+                    status, (body, content_type) = 500, _json_body({"error": str(e)})
+
+                metrics.increment("service_requests_total", status=status)
+                writer.write(_encode_response(status, body, content_type, keep_alive, extra_headers))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, **options):
+    """Run the service until cancelled"""
+    service = ScoringService(**options)
+    await service.start()
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    logger.info(f"Serving on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the Salain classifier over HTTP")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Concurrent classification batches")
+    parser.add_argument("--processes", action="store_true", help="Score batches in worker processes instead of threads")
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE, help="Most emails per micro-batch")
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT * 1000, help="Milliseconds a batch stays open")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE, help="Queued emails before answering 503")
+    parser.add_argument("--llm-workers", type=int, default=4, help="Concurrent explanation requests")
+    parser.add_argument("--ocr-workers", type=int, default=1, help="Concurrent OCR requests")
+    parser.add_argument("--explain-deadline", type=float, help="Seconds to wait for the LLM before falling back")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    # The service always records metrics for its /metrics endpoint
+    metrics.enable()
+    try:
+        asyncio.run(serve(
+            args.host,
+            args.port,
+            workers=args.workers,
+            processes=args.processes,
+            max_batch_size=args.max_batch_size,
+            max_wait=args.max_wait_ms / 1000,
+            max_queue=args.max_queue,
+            llm_workers=args.llm_workers,
+            ocr_workers=args.ocr_workers,
+            explain_deadline=args.explain_deadline,
+        ))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Deferred loading helpers: background prewarming and a startup-cost report.
+
+The app imports heavy dependencies (PaddleOCR, langchain) and loads models only
+when an input method or feature first needs them. Prewarming loads selected
+components on a background thread right after startup, so the first request
+that needs them does not pay the cost, without delaying the first page render.
+
+Environment:
+    SALAIN_PREWARM=classifier,ocr,llm   components to load in the background at startup
+
+Usage:
+    python -m scripts.startup                 # import and load cost per component
+    python -m scripts.startup --components classifier,ocr
+"""
+import argparse
+import importlib
+import os
+import sys
+import threading
+import time
+from scripts import metrics
+
+COMPONENTS = ("classifier", "ocr", "llm")
+
+def _load_classifier():
+    from scripts.registry import get_classifier_artifacts
+    get_classifier_artifacts()
+
+def _load_ocr(cached=True):
+    if cached:
+        # Fills the same st.cache_resource entry the app reads
+        from scripts.ocr import load_ocr_model
+        if load_ocr_model() is None:
+            raise RuntimeError("OCR model is not available")
+    else:
+        from scripts.ocr import _create_ocr_model
+        _create_ocr_model()
+
+def _load_llm():
+    from scripts.llm import get_llm
+    get_llm()
+
+# Module imported for each component, and the function that loads its model or client
+_LOADERS = {
+    "classifier": ("scripts.classical", _load_classifier),
+    "ocr": ("scripts.ocr", _load_ocr),
+    "llm": ("scripts.llm", _load_llm),
+}
+
+_prewarm_lock = threading.Lock()
+_prewarmed = set()
+
+def _rss_mb():
+    """Return the current resident set size in MB (the peak where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def load_component(name, **load_options):
+    """
+    Import a component and load its model, timing both steps.
+
+    Args:
+        name (str): One of COMPONENTS
+
+    Returns:
+        dict: 'component', 'import_ms', 'load_ms', 'rss_mb' (growth while loading) and 'error'
+    """
+    module_name, loader = _LOADERS[name]
+    rss_before = _rss_mb()
+    report = {"component": name, "import_ms": 0.0, "load_ms": 0.0, "rss_mb": 0.0, "error": None}
+
+    started = time.perf_counter()
+    try:
+        with metrics.span("component_import", component=name):
+            importlib.import_module(module_name)
+        report["import_ms"] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        with metrics.span("component_load", component=name):
+            loader(**load_options)
+        report["load_ms"] = (time.perf_counter() - started) * 1000
+    except Exception as e:
+        report["error"] = f"{type(e).__name__}: {e}"
+
+    report["rss_mb"] = _rss_mb() - rss_before
+    return report
+
+def _prewarm(components):
+    for name in components:
+        report = load_component(name)
+        if report["error"]:
+            print(f"Prewarming {name} failed: {report['error']}", file=sys.stderr)
+
+def prewarm(components=None):
+    """
+    Load components on a background thread, once per process.
+
+    Safe to call on every Streamlit rerun. Defaults to SALAIN_PREWARM.
+
+    Args:
+        components (iterable of str, optional): Components from COMPONENTS
+
+    Returns:
+        threading.Thread or None: The loading thread, if anything new was started
+    """
+    if components is None:
+        components = [name.strip() for name in os.getenv("SALAIN_PREWARM", "").split(",") if name.strip()]
+    with _prewarm_lock:
+        pending = [name for name in components if name in _LOADERS and name not in _prewarmed]
+        _prewarmed.update(pending)
+    if not pending:
+        return None
+
+    thread = threading.Thread(target=_prewarm, args=(pending,), daemon=True, name="salain-prewarm")
+    thread.start()
+    return thread
+
+def startup_report(components=COMPONENTS):
+    """
+    Measure import and load cost per component, in order, in this process.
+
+    Dependencies shared by several components (numpy, streamlit) are charged to
+    the first component that imports them.
+
+    Returns:
+        list: One load_component report per component
+    """
+    # Outside Streamlit, build the OCR model directly instead of through st.cache_resource
+    return [load_component(name, **({"cached": False} if name == "ocr" else {})) for name in components]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report import and load cost per component")
+    parser.add_argument("--components", default=",".join(COMPONENTS), help="Comma-separated: classifier, ocr, llm")
+    args = parser.parse_args(argv)
+
+    # The app imports streamlit before anything else
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    import streamlit
+    base_ms = (time.perf_counter() - started) * 1000
+
+    print(f"{'component':<12}{'import ms':>12}{'load ms':>12}{'RSS +MB':>10}  error")
+    print(f"{'streamlit':<12}{base_ms:>12.0f}{0:>12.0f}{_rss_mb() - rss_before:>10.0f}")
+    for report in startup_report(args.components.split(",")):
+        print(
+            f"{report['component']:<12}{report['import_ms']:>12.0f}{report['load_ms']:>12.0f}"
+            f"{report['rss_mb']:>10.0f}  {report['error'] or ''}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,491 @@
+"""
+Offline training pipeline for the classical classifier.
+
+Scripted version of notebooks/classical_notebook.ipynb: loads the Kaggle email
+datasets, cleans them with scripts.preprocess.clean_email, extracts the manual
+features with scripts.preprocess.extract_features, fits the TF-IDF vectorizer,
+runs the hyperparameter searches and writes the artifacts classify_email loads.
+
+The cleaned corpus, manual features and TF-IDF matrices are cached under
+data/cache/ as .npz files, keyed by PREPROCESSING_VERSION, the TF-IDF settings
+and a hash of the dataset, so repeated experiments skip straight to the
+searches. Searches fit cross-validation folds and candidates in parallel across
+cores; boosted models stop adding trees once a held-out validation split stops
+improving.
+
+Usage:
+    python -m scripts.train --download
+    python -m scripts.train --models "Logistic Regression,LightGBM" --jobs 8
+    python -m scripts.train --input emails.csv --text-field body --label-field label
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import numpy as np
+
+# Bump when clean_email or extract_features change so cached matrices and verdicts are rebuilt
+PREPROCESSING_VERSION = 2
+
+DATASET_DIR = "data/datasets"
+CACHE_DIR = "data/cache"
+MODELS_DIR = "models"
+RESULTS_PATH = "results/classical_testing/model-params-results.csv"
+
+# Kaggle datasets combined in the notebook: (kaggle handle, file, text column, label column)
+DATASETS = [
+    ("subhajournal/phishingemails", "Phishing_Email.csv", "Email Text", "Email Type"),
+    ("ganiyuolalekan/spam-assassin-email-classification-dataset", "spam_assassin.csv", "text", "target"),
+    ("bayes2003/emails-for-spam-or-ham-classification-enron-2006", "email_text.csv", "text", "label"),
+    ("bayes2003/emails-for-spam-or-ham-classification-trec-2007", "email_text.csv", "text", "label"),
+]
+LABELS = {"Safe Email": 0, "Phishing Email": 1, "safe": 0, "malicious": 1}
+
+# Held-out test split; scripts.cascade evaluates on the same rows
+TEST_SIZE = 0.2
+RANDOM_STATE = 42
+
+TFIDF_PARAMS = {"max_features": 5000, "ngram_range": (1, 2), "stop_words": "english"}
+
+# Boosting rounds without validation improvement before a fit stops
+EARLY_STOPPING_ROUNDS = 20
+MAX_BOOSTING_ROUNDS = 1000
+
+RESULT_FIELDS = [
+    "Model", "Best Params", "Precision", "Recall", "F1", "Training Time (s)", "Search Type",
+    "Search Time (s)", "Candidates", "Best Iteration", "Predict Time (ms/email)",
+]
+
+
+# --- Data --------------------------------------------------------------------
+
+def _dataset_path(handle, filename):
+    return os.path.join(DATASET_DIR, handle.replace("/", "__") + "__" + filename)
+
+def download_datasets():
+    """Download the Kaggle datasets used by the notebook into DATASET_DIR"""
+    import shutil
+    import kagglehub
+
+    os.makedirs(DATASET_DIR, exist_ok=True)
+    for handle, filename, _, _ in DATASETS:
+        target = _dataset_path(handle, filename)
+        if not os.path.exists(target):
+            shutil.copy(os.path.join(kagglehub.dataset_download(handle), filename), target)
+
+def load_corpus(input_path=None, text_field="body", label_field="label"):
+    """
+    Load and deduplicate the training corpus, as the notebook does.
+
+    Args:
+        input_path (str, optional): CSV to use instead of the Kaggle datasets
+
+    Returns:
+        tuple: (list of email texts, np.ndarray of 0/1 labels)
+    """
+    import pandas as pd
+
+    if input_path:
+        frames = [pd.read_csv(input_path).rename(columns={text_field: "body", label_field: "label"})]
+    else:
+        frames = []
+        for handle, filename, text_column, label_column in DATASETS:
+            path = _dataset_path(handle, filename)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"{path} is missing; run with --download first")
+            data = pd.read_csv(path)
+            frames.append(pd.DataFrame({"body": data[text_column], "label": data[label_column]}))
+
+    corpus = pd.concat([frame[["body", "label"]] for frame in frames], axis=0, ignore_index=True)
+    corpus["label"] = corpus["label"].replace(LABELS)
+    corpus = corpus.dropna().drop_duplicates()
+    corpus = corpus[(corpus["body"] != "empty") & (corpus["body"].str.strip() != "")]
+    return corpus["body"].astype(str).tolist(), corpus["label"].astype(int).to_numpy()
+
+def split_corpus(texts, labels, test_size=TEST_SIZE, random_state=RANDOM_STATE):
+    """
+    Split the corpus into training and held-out rows, stratified by label.
+
+    Returns:
+        tuple: (train texts, test texts, train labels, test labels)
+    """
+    from sklearn.model_selection import train_test_split
+    return train_test_split(texts, labels, test_size=test_size, stratify=labels, random_state=random_state)
+
+
+# --- Preprocessing cache -----------------------------------------------------
+
+def _save_texts(path, texts):
+    """Store strings as one UTF-8 buffer plus offsets, avoiding pickled object arrays"""
+    encoded = [text.encode("utf-8", errors="surrogatepass") for text in texts]
+    offsets = np.cumsum([0] + [len(text) for text in encoded])
+    np.savez(path, data=np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets=offsets)
+
+def _load_texts(path):
+    with np.load(path) as stored:
+        data, offsets = stored["data"].tobytes(), stored["offsets"]
+    return [data[start:end].decode("utf-8", errors="surrogatepass") for start, end in zip(offsets[:-1], offsets[1:])]
+
+def preprocessing_key(texts, labels, test_size, random_state):
+    """Key the cleaned corpus on the preprocessing code version, split settings and data"""
+    from scripts.preprocess.extract_features import FEATURE_NAMES
+    from scripts.preprocess.guard import guard_settings
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps([PREPROCESSING_VERSION, FEATURE_NAMES, guard_settings(), test_size, random_state]).encode())
+    for text in texts:
+        digest.update(text.encode("utf-8", errors="surrogatepass"))
+        digest.update(b"\0")
+    digest.update(np.asarray(labels).tobytes())
+    return digest.hexdigest()[:16]
+
+def _tfidf_key(tfidf_params):
+    return hashlib.sha256(repr(sorted(tfidf_params.items())).encode()).hexdigest()[:12]
+
+def _clean_split(texts, labels, directory, test_size, random_state):
+    """Return the cleaned split and manual features, from the cache when present"""
+    from scripts.preprocess.clean_email import clean_email
+    from scripts.preprocess.extract_features import extract_features_batch
+    from scripts.preprocess.guard import guard_emails
+
+    paths = {name: os.path.join(directory, f"{name}.npz") for name in ("clean_train", "clean_test", "features", "labels")}
+    if all(os.path.exists(path) for path in paths.values()):
+        with np.load(paths["features"]) as stored:
+            features = stored["train"], stored["test"]
+        with np.load(paths["labels"]) as stored:
+            y = stored["train"], stored["test"]
+        return _load_texts(paths["clean_train"]), _load_texts(paths["clean_test"]), features, y, True
+
+    X_train, X_test, y_train, y_test = split_corpus(texts, labels, test_size, random_state)
+    # Same size caps as inference, so the model is validated against them
+    clean_train = [clean_email(text) for text in guard_emails(X_train)]
+    clean_test = [clean_email(text) for text in guard_emails(X_test)]
+
+    # The notebook extracts the manual features from the cleaned text
+    features_train = extract_features_batch(clean_train)
+    features_test = extract_features_batch(clean_test)
+
+    os.makedirs(directory, exist_ok=True)
+    _save_texts(paths["clean_train"], clean_train)
+    _save_texts(paths["clean_test"], clean_test)
+    np.savez(paths["features"], train=features_train, test=features_test)
+    # Written last; its presence marks a complete entry
+    np.savez(paths["labels"], train=y_train, test=y_test)
+    return clean_train, clean_test, (features_train, features_test), (y_train, y_test), False
+
+def preprocess(texts, labels, test_size=TEST_SIZE, random_state=RANDOM_STATE, tfidf_params=TFIDF_PARAMS,
+               cache_dir=CACHE_DIR):
+    """
+    Split, clean, featurize and vectorize the corpus, reusing the on-disk cache.
+
+    The cleaned corpus is cached per preprocessing version and dataset, and the
+    TF-IDF matrices below it per vectorizer settings, so trying new TF-IDF
+    settings does not re-clean the emails.
+
+    Returns:
+        dict: 'vectorizer', 'X_train', 'X_test' (TF-IDF plus manual features),
+            'y_train', 'y_test' and which stages came 'from_cache'
+    """
+    import joblib
+    from scipy.sparse import hstack, load_npz, save_npz
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    clean_dir = os.path.join(cache_dir, preprocessing_key(texts, labels, test_size, random_state))
+    clean_train, clean_test, (features_train, features_test), (y_train, y_test), clean_cached = _clean_split(
+        texts, labels, clean_dir, test_size, random_state
+    )
+
+    tfidf_dir = os.path.join(clean_dir, f"tfidf-{_tfidf_key(tfidf_params)}")
+    paths = {name: os.path.join(tfidf_dir, name) for name in ("train.npz", "test.npz", "vectorizer.pkl")}
+    tfidf_cached = all(os.path.exists(path) for path in paths.values())
+    if tfidf_cached:
+        tfidf_train, tfidf_test = load_npz(paths["train.npz"]), load_npz(paths["test.npz"])
+        vectorizer = joblib.load(paths["vectorizer.pkl"])
+    else:
+        vectorizer = TfidfVectorizer(**tfidf_params)
+        tfidf_train = vectorizer.fit_transform(clean_train)
+        tfidf_test = vectorizer.transform(clean_test)
+        os.makedirs(tfidf_dir, exist_ok=True)
+        save_npz(paths["train.npz"], tfidf_train)
+        save_npz(paths["test.npz"], tfidf_test)
+        joblib.dump(vectorizer, paths["vectorizer.pkl"])
+
+    return {
+        "vectorizer": vectorizer,
+        "X_train": hstack([tfidf_train, features_train], format="csr"),
+        "X_test": hstack([tfidf_test, features_test], format="csr"),
+        "y_train": np.asarray(y_train),
+        "y_test": np.asarray(y_test),
+        "from_cache": [stage for stage, cached in (("clean", clean_cached), ("tfidf", tfidf_cached)) if cached],
+    }
+
+
+# --- Searches ----------------------------------------------------------------
+
+def model_configs(random_state=42):
+    """The notebook's model and parameter grid, minus models whose package is missing"""
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.naive_bayes import ComplementNB
+    from sklearn.tree import DecisionTreeClassifier
+
+    # Inner estimators are single-threaded; the searches parallelize across folds and candidates
+    configs = {
+        "Logistic Regression": {
+            "model": LogisticRegression(class_weight="balanced", max_iter=1000, solver="liblinear"),
+            "params": {"C": [0.1, 1, 10], "penalty": ["l1", "l2"]},
+            "search_type": "grid",
+        },
+        "Random Forest": {
+            "model": RandomForestClassifier(class_weight="balanced", n_jobs=1, random_state=random_state),
+            "params": {"n_estimators": [50, 100, 150], "max_depth": [5, 10, None], "min_samples_split": [2, 5, 10]},
+            "search_type": "randomized",
+            "n_iter": 15,
+        },
+        "Decision Tree": {
+            "model": DecisionTreeClassifier(class_weight="balanced", random_state=random_state),
+            "params": {"max_depth": [5, 10, None], "min_samples_split": [2, 5, 10]},
+            "search_type": "grid",
+        },
+        "Naive Bayes": {
+            "model": ComplementNB(),
+            "params": {"alpha": [0.1, 1.0, 10.0]},
+            "search_type": "grid",
+        },
+    }
+
+    try:
+        from xgboost import XGBClassifier
+        configs["XGBoost"] = {
+            "model": XGBClassifier(
+                eval_metric="logloss", n_jobs=1, n_estimators=MAX_BOOSTING_ROUNDS,
+                early_stopping_rounds=EARLY_STOPPING_ROUNDS, random_state=random_state,
+            ),
+            "params": {"max_depth": [3, 5], "learning_rate": [0.05, 0.1], "subsample": [0.8, 1.0]},
+            "search_type": "randomized",
+            "n_iter": 10,
+            "early_stopping": "xgboost",
+        }
+    except ImportError:
+        pass
+
+    try:
+        from lightgbm import LGBMClassifier
+        configs["LightGBM"] = {
+            "model": LGBMClassifier(
+                class_weight="balanced", n_jobs=1, verbose=-1, n_estimators=MAX_BOOSTING_ROUNDS,
+                random_state=random_state,
+            ),
+            "params": {"num_leaves": [31, 63, 127], "learning_rate": [0.05, 0.1], "min_child_samples": [20, 50]},
+            "search_type": "randomized",
+            "n_iter": 10,
+            "early_stopping": "lightgbm",
+        }
+    except ImportError:
+        pass
+
+    return configs
+
+def _fit_params(config, X_valid, y_valid):
+    """Validation split and early stopping for boosted models"""
+    kind = config.get("early_stopping")
+    if kind == "lightgbm":
+        import lightgbm
+        return {
+            "eval_set": [(X_valid, y_valid)],
+            "callbacks": [lightgbm.early_stopping(EARLY_STOPPING_ROUNDS, verbose=False)],
+        }
+    if kind == "xgboost":
+        return {"eval_set": [(X_valid, y_valid)], "verbose": False}
+    return {}
+
+def _best_iteration(model):
+    for attribute in ("best_iteration_", "best_iteration"):
+        value = getattr(model, attribute, None)
+        if value:
+            return int(value)
+    return None
+
+def run_search(name, config, data, sample_size=0.2, jobs=-1, random_state=42, verbose=0):
+    """
+    Run one hyperparameter search on a stratified sample of the training set.
+
+    Like the notebook, candidates are scored by 3-fold cross-validated F1 and the
+    best estimator is evaluated on the full test set.
+
+    Returns:
+        tuple: (results CSV row, best estimator)
+    """
+    from sklearn.metrics import f1_score, precision_score, recall_score
+    from sklearn.model_selection import GridSearchCV, RandomizedSearchCV, train_test_split
+
+    X, y = data["X_train"], data["y_train"]
+    if sample_size < 1.0:
+        X, _, y, _ = train_test_split(X, y, train_size=sample_size, stratify=y, random_state=random_state)
+
+    fit_params = {}
+    if config.get("early_stopping"):
+        # Hold out part of the sample to decide when boosting stops
+        X, X_valid, y, y_valid = train_test_split(X, y, test_size=0.1, stratify=y, random_state=random_state)
+        fit_params = _fit_params(config, X_valid, y_valid)
+
+    if config["search_type"] == "grid":
+        search = GridSearchCV(
+            config["model"], config["params"], scoring="f1", cv=3, n_jobs=jobs, verbose=verbose,
+        )
+    else:
+        search = RandomizedSearchCV(
+            config["model"], config["params"], n_iter=config["n_iter"], scoring="f1", cv=3,
+            n_jobs=jobs, verbose=verbose, random_state=random_state,
+        )
+
+    started = time.perf_counter()
+    search.fit(X, y, **fit_params)
+    search_time = time.perf_counter() - started
+
+    best_model = search.best_estimator_
+    started = time.perf_counter()
+    y_pred = best_model.predict(data["X_test"])
+    predict_time = time.perf_counter() - started
+
+    y_test = data["y_test"]
+    row = {
+        "Model": name,
+        "Best Params": search.best_params_,
+        "Precision": precision_score(y_test, y_pred),
+        "Recall": recall_score(y_test, y_pred),
+        "F1": f1_score(y_test, y_pred),
+        "Training Time (s)": search.refit_time_,
+        "Search Type": config["search_type"],
+        "Search Time (s)": search_time,
+        "Candidates": len(search.cv_results_["params"]),
+        "Best Iteration": _best_iteration(best_model),
+        "Predict Time (ms/email)": predict_time / len(y_test) * 1000,
+    }
+    return row, best_model
+
+
+# --- Final artifacts ---------------------------------------------------------
+
+def fit_final_lightgbm(data, params, random_state=42, jobs=-1):
+    """Fit the deployed LightGBM model on the full training set with the chosen parameters"""
+    from lightgbm import LGBMClassifier
+    from sklearn.model_selection import train_test_split
+
+    # Early stopping picks the number of trees; the held-out split is part of the training set
+    X, X_valid, y, y_valid = train_test_split(
+        data["X_train"], data["y_train"], test_size=0.1, stratify=data["y_train"], random_state=random_state
+    )
+    model = LGBMClassifier(
+        class_weight="balanced", random_state=random_state, n_jobs=jobs, verbose=-1,
+        n_estimators=MAX_BOOSTING_ROUNDS, **params,
+    )
+    model.fit(X, y, **_fit_params({"early_stopping": "lightgbm"}, X_valid, y_valid))
+    return model
+
+def fit_final_logreg(data, params):
+    """Fit the cheap logistic model used as the first tier of the cascade"""
+    from sklearn.linear_model import LogisticRegression
+
+    model = LogisticRegression(class_weight="balanced", max_iter=1000, solver="liblinear", **params)
+    return model.fit(data["X_train"], data["y_train"])
+
+def write_results(rows, path=RESULTS_PATH):
+    import csv
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def train(input_path=None, text_field="body", label_field="label", models=None, sample_size=0.2,
+          jobs=-1, output_dir=MODELS_DIR, results_path=RESULTS_PATH, final_params=None, verbose=0):
+    """
+    Run the full pipeline and write the model artifacts and results CSV.
+
+    Returns:
+        list: One results row per searched model
+    """
+    import joblib
+
+    started = time.perf_counter()
+    texts, labels = load_corpus(input_path, text_field, label_field)
+    data = preprocess(texts, labels)
+    print(
+        f"Preprocessed {len(texts):,} emails in {time.perf_counter() - started:.1f}s"
+        f"{' (cached: ' + ', '.join(data['from_cache']) + ')' if data['from_cache'] else ''}",
+        file=sys.stderr,
+    )
+
+    configs = model_configs()
+    selected = models or list(configs)
+    missing = [name for name in selected if name not in configs]
+    if missing:
+        raise ValueError(f"Unknown or unavailable models: {', '.join(missing)}")
+
+    rows, best = [], {}
+    for name in selected:
+        row, best[name] = run_search(name, configs[name], data, sample_size, jobs, verbose=verbose)
+        rows.append(row)
+        print(f"{name}: F1 {row['F1']:.4f} in {row['Search Time (s)']:.1f}s", file=sys.stderr)
+    if results_path:
+        write_results(rows, results_path)
+
+    os.makedirs(output_dir, exist_ok=True)
+    artifacts = {}
+    if "LightGBM" in configs:
+        # The notebook's chosen parameters unless the LightGBM search ran
+        params = final_params or {"num_leaves": 127, "min_child_samples": 50, "learning_rate": 0.1}
+        if "LightGBM" in best and final_params is None:
+            params = {key: best["LightGBM"].get_params()[key] for key in params}
+        artifacts["malicious_email_classifier.pkl"] = fit_final_lightgbm(data, params, jobs=jobs)
+
+    logreg_params = {"C": 10, "penalty": "l2"}
+    if "Logistic Regression" in best:
+        logreg_params = {key: best["Logistic Regression"].get_params()[key] for key in logreg_params}
+    artifacts["logreg.pkl"] = fit_final_logreg(data, logreg_params)
+
+    # Written back to back once everything is fitted, so a running app reloads the
+    # classifier and its vectorizer together (see registry.ArtifactRegistry)
+    artifacts["tfidf_vectorizer.pkl"] = data["vectorizer"]
+    for filename, artifact in artifacts.items():
+        path = os.path.join(output_dir, filename)
+        joblib.dump(artifact, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    print(f"Wrote artifacts to {output_dir} in {time.perf_counter() - started:.1f}s total", file=sys.stderr)
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the Salain email classifier")
+    parser.add_argument("--download", action="store_true", help="Download the Kaggle datasets first")
+    parser.add_argument("--input", help="CSV to train on instead of the Kaggle datasets")
+    parser.add_argument("--text-field", default="body", help="CSV column with the email text")
+    parser.add_argument("--label-field", default="label", help="CSV column with the 0/1 label")
+    parser.add_argument("--models", help="Comma-separated model names (default: all available)")
+    parser.add_argument("--sample-size", type=float, default=0.2, help="Fraction of the training set used by searches")
+    parser.add_argument("--jobs", type=int, default=-1, help="Parallel search fits (default: all cores)")
+    parser.add_argument("--output-dir", default=MODELS_DIR, help="Where to write the .pkl artifacts")
+    parser.add_argument("--results", default=RESULTS_PATH, help="Results CSV")
+    parser.add_argument("--verbose", type=int, default=0, help="Search verbosity")
+    args = parser.parse_args(argv)
+
+    if args.download:
+        download_datasets()
+    train(
+        input_path=args.input,
+        text_field=args.text_field,
+        label_field=args.label_field,
+        models=args.models.split(",") if args.models else None,
+        sample_size=args.sample_size,
+        jobs=args.jobs,
+        output_dir=args.output_dir,
+        results_path=args.results,
+        verbose=args.verbose,
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""ResultCache tiers and eviction, and what classification keys depend on."""
+import sqlite3
+
+import pytest
+
+from scripts import cache as cache_module
+from scripts import classical
+from scripts.cache import ResultCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    return clock
+
+
+def db_keys(path, namespace):
+    with sqlite3.connect(path) as db:
+        return sorted(key for (key,) in db.execute("SELECT key FROM cache WHERE namespace = ?", (namespace,)))
+
+
+def test_least_recently_used_entry_is_evicted_first(clock):
+    cache = ResultCache("lru", max_entries=3)
+    for key in "abc":
+        cache.set(key, key.upper())
+    # Reading 'a' makes 'b' the least recently used
+    assert cache.get("a") == "A"
+    cache.set("d", "D")
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in "acd"] == ["A", "C", "D"]
+
+    cache.set("e", "E")
+    assert cache.get("a") is None
+    assert cache.stats()["evictions"] == 2
+    assert cache.stats()["size"] == 3
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = ResultCache("ttl", ttl=60)
+    cache.set("key", [1, 0.5])
+    clock.now += 60
+    assert cache.get("key") == [1, 0.5]
+    clock.now += 1
+    assert cache.get("key", "missing") == "missing"
+    stats = cache.stats()
+    assert stats["expirations"] == 1 and stats["size"] == 0
+
+
+def test_sqlite_tier_survives_restart_and_promotes_hits(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+    ResultCache("verdicts", db_path=path).set("key", {"label": 1})
+
+    restarted = ResultCache("verdicts", db_path=path)
+    assert restarted.get("key") == {"label": 1}
+    assert restarted.stats()["disk_hits"] == 1
+    assert restarted.get("key") == {"label": 1}
+    assert restarted.stats()["disk_hits"] == 1 and restarted.stats()["size"] == 1
+
+    # Namespaces sharing a database do not see each other's entries
+    assert ResultCache("other", db_path=path).get("key") is None
+
+
+def test_expired_sqlite_row_is_deleted_on_lookup(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+    ResultCache("verdicts", ttl=60, db_path=path).set("key", 1)
+    clock.now += 61
+    restarted = ResultCache("verdicts", ttl=60, db_path=path, max_db_entries=0)
+    # Opening sweeps expired rows already
+    assert db_keys(path, "verdicts") == []
+
+    ResultCache("verdicts", ttl=3600, db_path=path).set("key", 1)
+    clock.now += 61
+    assert restarted.get("key") is None
+    assert db_keys(path, "verdicts") == []
+
+
+def test_sweep_removes_expired_and_surplus_rows(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(cache_module, "DB_PURGE_INTERVAL", 4)
+    path = str(tmp_path / "cache.db")
+    cache = ResultCache("verdicts", max_entries=100, ttl=100, db_path=path, max_db_entries=3)
+    other = ResultCache("other", db_path=path)
+    other.set("kept", 1)
+
+    for index, key in enumerate("abcd"):
+        clock.now += 1
+        cache.set(key, index)
+    # The fourth write swept the oldest row beyond max_db_entries
+    assert db_keys(path, "verdicts") == ["b", "c", "d"]
+
+    clock.now += 99
+    for key in "efg":
+        cache.set(key, key)
+    assert db_keys(path, "verdicts") == ["b", "c", "d", "e", "f", "g"]
+    cache.set("h", "h")
+    # 'b' has expired and only the newest three of the rest are kept
+    assert db_keys(path, "verdicts") == ["f", "g", "h"]
+    assert db_keys(path, "other") == ["kept"]
+    assert cache.stats()["db_deletions"] == 5
+
+
+def test_classification_key_depends_on_preprocessing(monkeypatch):
+    key = classical.classification_key("model-v1", "Verify your account")
+    assert key == classical.classification_key("model-v1", "Verify your account")
+    assert key != classical.classification_key("model-v2", "Verify your account")
+    assert key != classical.classification_key("model-v1", "Verify  your account")
+
+    monkeypatch.setattr(classical, "PREPROCESSING_VERSION", classical.PREPROCESSING_VERSION + 1)
+    assert key != classical.classification_key("model-v1", "Verify your account")
+    monkeypatch.undo()
+
+    monkeypatch.setattr(classical, "guard_settings", lambda: [False])
+    assert key != classical.classification_key("model-v1", "Verify your account")
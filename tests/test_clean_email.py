@@ -0,0 +1,141 @@
+"""
+Equivalence of clean_email with the BeautifulSoup version it replaced.
+
+bs4_clean_email below is the original implementation, kept verbatim as the
+oracle. Every input must clean to exactly the same string.
+"""
+import random
+import re
+import time
+
+import pytest
+
+from scripts.preprocess import clean_email as clean_email_module
+from scripts.preprocess.clean_email import HTML_FEED_SIZE, clean_email, html_to_text
+
+bs4 = pytest.importorskip("bs4")
+
+pytestmark = pytest.mark.filterwarnings("ignore::bs4.MarkupResemblesLocatorWarning")
+
+
+def bs4_clean_email(text):
+    # Remove HTML/CSS
+    text = bs4.BeautifulSoup(text, "html.parser").get_text()
+
+    # Remove URLs
+    text = re.sub(r"http\S+|www\S+|https\S+", "", text)
+
+    # Remove email addresses
+    text = re.sub(r"\S+@\S+", "", text)
+
+    # Remove special characters (keep letters, numbers, and basic punctuation)
+    text = re.sub(r"[^a-zA-Z0-9.!?]+", " ", text)
+
+    # Lowercase
+    text = text.lower()
+
+    return text
+
+
+CORPUS = [
+    "",
+    "Plain text with no markup at all.",
+    "Visit https://example.com/login or www.example.org now! Mail admin@example.com.",
+    # Entities, with and without the trailing ';'
+    "Fish &amp; chips &amp chips &lt;b&gt; &copy 2024 &nbsp;x&nbspy",
+    "&#65;&#66 &#x43;&#X44 &#x110000; &#0; &#65abc; &#xzz; &#; &unknown; &unknown",
+    "AT&T and R&D &; & ampersand&",
+    "&notit; &notin; &amp;amp;",
+    # Comments, CDATA and declarations
+    "before<!-- hidden <b>comment</b> -->after",
+    "a<!-- unterminated comment",
+    "x<![CDATA[ raw <b>text</b> ]]>y",
+    "word<![CDATA[]]>joined<![CDATA[ \n ]]>apart",
+    "<pre>keep<![CDATA[]]>together</pre><![CDATA[]]>after",
+    "<textarea>a<![CDATA[]]>b</textarea>",
+    "<!DOCTYPE html><html><body>Hi</body></html>",
+    "<?xml version='1.0'?>processing",
+    # Elements whose strings are not text
+    "<script>var a = '<b>x</b>';</script>visible",
+    "<style>.a { color: red }</style>visible",
+    "<template><p>templated</p></template>visible",
+    "<ruby>漢<rp>(</rp><rt>kan</rt><rp>)</rp></ruby> ruby",
+    "<script><![CDATA[ cdata in script ]]></script>shown",
+    "<p>open <script>never closed",
+    "<style>a</p>b</style>c",
+    # Stray '<' and unclosed tags
+    "1 < 2 and 3 > 2",
+    "a <b c",
+    "<a href='x' <b>bold</b>",
+    "<<<>>> < > <>",
+    "<div><p>unclosed <b>bold <i>italic",
+    "</p></div>text after stray end tags",
+    "<br>line<br/>line<hr>rule<img src=x>image",
+    "<a href=\"mailto:someone@example.com\">someone@example.com</a>",
+    "<TABLE><TR><TD>Upper</TD></TR></TABLE>case",
+    "<p title='a > b'>attr with gt</p>",
+    "<div\nclass=\"x\"\n>multi\nline</div>",
+]
+
+FRAGMENTS = [
+    "<p>", "</p>", "<div class='a'>", "</div>", "<b>", "</b>", "<br>", "<br/>", "<img src=x>",
+    "<script>", "</script>", "<style>", "</style>", "<template>", "</template>",
+    "<rt>", "</rt>", "<rp>", "</rp>", "<pre>", "</pre>", "<textarea>", "</textarea>",
+    "<!-- c -->", "<!--", "-->", "<![CDATA[", "]]>", "<![CDATA[]]>",
+    "<!DOCTYPE html>", "<?pi?>", "&amp;", "&amp", "&lt;", "&gt", "&nbsp;", "&copy",
+    "&#65;", "&#x41", "&#9999999;", "&bogus;", "&", "<", ">", "</", "<a href='",
+    "'>", "\"", "=", " ", "\n", "\t", "hello", "World", "verify", "account", "123",
+    "http://evil.example/x", "www.example.com", "user@example.com", "!", "?", ".",
+    "é", "ü", "€", "漢",
+]
+
+
+def random_document(rng, parts):
+    return "".join(rng.choice(FRAGMENTS) for _ in range(parts))
+
+
+@pytest.fixture
+def unguarded(monkeypatch):
+    # The oracle has no time budget, so compare against the unbudgeted parse
+    monkeypatch.setattr(clean_email_module, "GUARD_ENABLED", False)
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_fixed_corpus_matches_beautifulsoup(text, unguarded):
+    assert clean_email(text) == bs4_clean_email(text)
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_fixed_corpus_matches_beautifulsoup_with_guard(text):
+    assert clean_email(text) == bs4_clean_email(text)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_markup_matches_beautifulsoup(seed, unguarded):
+    rng = random.Random(seed)
+    for _ in range(400):
+        text = random_document(rng, rng.randint(1, 60))
+        assert clean_email(text) == bs4_clean_email(text), text
+
+
+def test_documents_spanning_several_feeds_match_beautifulsoup(unguarded):
+    rng = random.Random(1234)
+    text = random_document(rng, 3 * HTML_FEED_SIZE // 4)
+    assert len(text) > HTML_FEED_SIZE
+    assert clean_email(text) == bs4_clean_email(text)
+
+
+def test_spent_time_budget_falls_back_to_stripping_tags():
+    text = "<p>Hello <b>there</b></p>" * 2000
+    result = html_to_text(text, time_budget=0.0)
+    assert "<" not in result and ">" not in result
+    assert result.split() == ["Hello", "there"] * 2000
+
+
+def test_long_unclosed_tail_is_stripped_within_budget():
+    text = "<p>start</p><a " + "x<b>y</b> " * 20000
+    started = time.perf_counter()
+    result = html_to_text(text, time_budget=1.0)
+    assert time.perf_counter() - started < 2.0
+    assert result.startswith("start")
+    assert "<b>" not in result
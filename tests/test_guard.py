@@ -0,0 +1,50 @@
+"""Worst-case latency of guarded preprocessing on inputs built to be slow."""
+import base64
+import random
+import time
+
+import pytest
+
+from scripts.benchmark import DEFAULT_MAX_ADVERSARIAL_MS, adversarial_corpus
+from scripts.preprocess.clean_email import clean_email
+from scripts.preprocess.domains import domain_features
+from scripts.preprocess.extract_features import extract_features
+from scripts.preprocess.guard import GUARD_ENABLED, MAX_EMAIL_CHARS, guard_email
+
+pytestmark = pytest.mark.skipif(not GUARD_ENABLED, reason="measures guarded mode; unset SALAIN_GUARD=0")
+
+CASES = adversarial_corpus(fuzz_cases=3)
+
+
+def preprocess(text):
+    """Every text stage classify_email runs before the model"""
+    guarded = guard_email(text)
+    return clean_email(guarded), extract_features(guarded), domain_features(guarded)
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_adversarial_input_is_processed_within_bound(name):
+    text = CASES[name]
+    started = time.perf_counter()
+    preprocess(text)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    assert elapsed_ms < DEFAULT_MAX_ADVERSARIAL_MS, f"{name}: {elapsed_ms:.0f} ms"
+
+
+def test_unclosed_start_tags_are_bounded():
+    text = "<a " * 1_000_000
+    started = time.perf_counter()
+    cleaned, _, _ = preprocess(text)
+    assert (time.perf_counter() - started) * 1000 < DEFAULT_MAX_ADVERSARIAL_MS
+    assert len(cleaned) <= MAX_EMAIL_CHARS + 1
+
+
+def test_base64_blob_is_stripped_and_bounded():
+    blob = base64.b64encode(random.Random(0).randbytes(3_000_000)).decode()
+    text = "Please see the attached invoice.\n" + blob + "\nRegards"
+    started = time.perf_counter()
+    guarded = guard_email(text)
+    preprocess(text)
+    assert (time.perf_counter() - started) * 1000 < DEFAULT_MAX_ADVERSARIAL_MS
+    assert "attached invoice" in guarded
+    assert len(guarded) < 1000
@@ -0,0 +1,137 @@
+"""Explanation cache keys and streaming with fallbacks."""
+import threading
+import time
+
+import pytest
+
+from scripts import llm
+
+TEXT = "Please verify your account at http://example.com/login?id=1"
+
+
+@pytest.fixture
+def stub_llm():
+    stub = llm.StubLLM()
+    llm.set_llm_backend(stub)
+    llm.explanation_cache.clear()
+    yield stub
+    llm.set_llm_backend(None)
+    llm.explanation_cache.clear()
+
+
+def test_explanation_key_is_shared_by_campaign_copies():
+    key = llm.explanation_cache_key(TEXT, 1, 0.93)
+    assert key == llm.explanation_cache_key(TEXT.replace("id=1", "id=2"), 1, 0.94)
+    assert key != llm.explanation_cache_key(TEXT, 0, 0.93)
+    assert key != llm.explanation_cache_key(TEXT, 1, 0.80)
+
+
+def test_explanation_key_depends_on_prompt_and_model(monkeypatch):
+    key = llm.explanation_cache_key(TEXT, 1, 0.93, {"num_links": 1, "spf_fail": 0})
+    assert key == llm.explanation_cache_key(TEXT, 1, 0.93, {"num_links": 1})
+    assert key != llm.explanation_cache_key(TEXT, 1, 0.93, {"num_links": 1, "spf_fail": 1})
+
+    monkeypatch.setattr(llm, "PROMPT_VERSION", llm.PROMPT_VERSION + 1)
+    assert key != llm.explanation_cache_key(TEXT, 1, 0.93, {"num_links": 1})
+    monkeypatch.undo()
+
+    monkeypatch.setattr(llm, "LLM_MODEL", "another-model")
+    assert key != llm.explanation_cache_key(TEXT, 1, 0.93, {"num_links": 1})
+    monkeypatch.undo()
+
+    monkeypatch.setenv("SALAIN_LLM_BACKEND", "stub")
+    assert key != llm.explanation_cache_key(TEXT, 1, 0.93, {"num_links": 1})
+
+
+def test_replaced_backend_does_not_share_explanations(stub_llm):
+    assert llm.llm_name() == "StubLLM:"
+    explanation = "".join(llm.stream_llm_explanation(TEXT, 1, 0.93, deadline=5))
+    llm.set_llm_backend(None)
+    assert llm.explanation_cache.get(llm.explanation_cache_key(TEXT, 1, 0.93)) is None
+    llm.set_llm_backend(stub_llm)
+    assert llm.explanation_cache.get(llm.explanation_cache_key(TEXT, 1, 0.93)) == explanation
+
+
+class _Chunk:
+    def __init__(self, content):
+        self.content = content
+
+
+class ScriptedLLM:
+    """Streams the given tokens, optionally waiting for `release` first, then raises `error`"""
+
+    def __init__(self, tokens, error=None, release=None):
+        self.tokens = tokens
+        self.error = error
+        self.release = release
+        self.calls = 0
+
+    def stream(self, messages):
+        self.calls += 1
+        if self.release is not None:
+            self.release.wait(5)
+        for token in self.tokens:
+            yield _Chunk(token)
+        if self.error is not None:
+            raise self.error
+
+
+def stream(timings=None, **kwargs):
+    return list(llm.stream_llm_explanation(TEXT, 1, 0.93, {"num_links": 1}, timings=timings, **kwargs))
+
+
+@pytest.fixture
+def scripted():
+    """Returns a function that installs a ScriptedLLM as the chat model"""
+    def install(*args, **kwargs):
+        scripted_llm = ScriptedLLM(*args, **kwargs)
+        llm.set_llm_backend(scripted_llm)
+        return scripted_llm
+
+    llm.explanation_cache.clear()
+    yield install
+    llm.set_llm_backend(None)
+    llm.explanation_cache.clear()
+
+
+def test_failure_after_some_tokens_only_truncates(scripted):
+    scripted(["- First reason\n", "- Second"], error=ConnectionError("connection reset"))
+    timings = {}
+    assert stream(timings, deadline=5) == ["- First reason\n", "- Second", llm.TRUNCATED_NOTICE]
+    assert timings["truncated"] is True and timings["fallback"] is False
+    assert timings["error"] == "connection reset"
+    # A partial explanation is not cached
+    assert llm.explanation_cache.get(llm.explanation_cache_key(TEXT, 1, 0.93, {"num_links": 1})) is None
+
+
+def test_failure_before_any_token_falls_back(scripted):
+    scripted([], error=ConnectionError("refused"))
+    timings = {}
+    assert stream(timings, deadline=5) == [llm.get_fallback_explanation(1, {"num_links": 1})]
+    assert timings["fallback"] is True and timings["truncated"] is False
+
+
+def test_pending_calls_are_bounded(scripted, monkeypatch):
+    monkeypatch.setattr(llm, "LLM_MAX_PENDING", 1)
+    monkeypatch.setattr(llm, "_pending", threading.BoundedSemaphore(1))
+    release = threading.Event()
+    slow = scripted(["- Slow reason"], release=release)
+    fallback = [llm.get_fallback_explanation(1, {"num_links": 1})]
+
+    # The first call misses its deadline but keeps running in the background
+    timings = {}
+    assert stream(timings, deadline=0.05) == fallback
+    assert timings["error"].startswith("No explanation within")
+    # The second is not queued behind it
+    timings = {}
+    started = time.perf_counter()
+    assert stream(timings, deadline=5) == fallback
+    assert time.perf_counter() - started < 1
+    assert timings["error"] == "1 explanations already pending"
+    assert slow.calls == 1
+
+    release.set()
+    assert llm._pending.acquire(timeout=5)
+    llm._pending.release()
+    # The background call finished and warmed the cache
+    assert stream(deadline=5) == ["- Slow reason"]
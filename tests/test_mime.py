@@ -0,0 +1,186 @@
+"""Body extraction and header signals of raw messages."""
+import base64
+import email.parser
+
+import pytest
+
+from scripts.preprocess import mime
+from scripts.preprocess.mime import decode_header_value, header_features, parse_message
+
+
+def message(text, crlf=False):
+    data = text.lstrip("\n").encode()
+    return data.replace(b"\n", b"\r\n") if crlf else data
+
+
+def headers(text):
+    return email.parser.BytesHeaderParser().parsebytes(message(text))
+
+
+ALTERNATIVE_WITH_ATTACHMENT = """
+From: Billing <billing@example.com>
+Subject: Invoice
+Content-Type: multipart/mixed; boundary="outer"
+
+--outer
+Content-Type: multipart/alternative; boundary="outer-alt"
+
+--outer-alt
+Content-Type: text/html; charset=utf-8
+
+<p>Your invoice is attached</p>
+--outer-alt
+Content-Type: text/plain; charset=utf-8
+Content-Transfer-Encoding: quoted-printable
+
+Your invoice is attached =E2=80=93 thanks
+--outer-alt--
+
+--outer
+Content-Type: application/pdf
+Content-Disposition: attachment; filename="invoice.pdf"
+Content-Transfer-Encoding: base64
+
+JVBERi0xLjQKJcfsj6IKNSAwIG9iago8PC9MZW5ndGggNiAwIFI+PgpzdHJlYW0K
+--outer--
+"""
+
+
+@pytest.mark.parametrize("crlf", [False, True])
+def test_multipart_alternative_prefers_plain_text_and_skips_attachment(crlf):
+    result = parse_message(message(ALTERNATIVE_WITH_ATTACHMENT, crlf))
+    assert result["content_type"] == "text/plain"
+    assert result["body"] == "Your invoice is attached – thanks"
+    assert result["subject"] == "Invoice"
+    assert [(a["content_type"], a["filename"]) for a in result["attachments"]] == \
+        [("application/pdf", "invoice.pdf")]
+    assert result["features"]["num_attachments"] == 1
+
+
+def test_nested_boundary_starting_with_outer_boundary():
+    # "--outer-alt" begins with "--outer" but is not a delimiter of the outer multipart
+    text = ALTERNATIVE_WITH_ATTACHMENT.replace("--outer-alt--", "--outer-alt\n"
+                                               "Content-Type: image/png\n\nPNG\n--outer-alt--")
+    result = parse_message(message(text))
+    assert result["body"] == "Your invoice is attached – thanks"
+    assert [a["content_type"] for a in result["attachments"]] == ["image/png", "application/pdf"]
+
+
+def test_line_starting_with_boundary_text_stays_in_body():
+    result = parse_message(message("""
+Content-Type: multipart/mixed; boundary="sep"
+
+--sep
+Content-Type: text/plain
+
+first line
+--separator line in the text
+last line
+--sep--
+"""))
+    assert result["body"] == "first line\n--separator line in the text\nlast line"
+    assert result["attachments"] == []
+
+
+def test_crlf_single_part_message():
+    result = parse_message(message("""
+Subject: hello
+Content-Type: text/plain
+
+line one
+line two
+""", crlf=True))
+    assert result["body"] == "line one\r\nline two\r\n"
+    assert result["attachments"] == []
+
+
+def test_html_only_message():
+    result = parse_message(message("""
+Content-Type: text/html
+
+<p>only html</p>
+"""))
+    assert result["content_type"] == "text/html"
+    assert result["body"] == "<p>only html</p>\n"
+
+
+def test_message_without_body():
+    result = parse_message(b"Subject: empty\r\n")
+    assert result["body"] == ""
+    assert result["content_type"] == "text/plain"
+
+
+@pytest.mark.skipif(mime.MAX_PART_BYTES is None, reason="parts are truncated in guarded mode only")
+def test_base64_body_is_truncated_at_max_part_bytes():
+    plain = ("Please verify your account. " * (mime.MAX_PART_BYTES // 10)).encode()
+    encoded = base64.encodebytes(plain).replace(b"\n", b"\r\n")
+    assert len(encoded) > mime.MAX_PART_BYTES
+    data = (b"Content-Type: text/plain\r\nContent-Transfer-Encoding: base64\r\n\r\n" + encoded)
+
+    body = parse_message(data)["body"]
+    assert body and plain.decode().startswith(body)
+    # Every complete 4-character group in the first MAX_PART_BYTES is decoded
+    groups = len(encoded[:mime.MAX_PART_BYTES].translate(None, b"\r\n")) // 4
+    assert len(body) == groups * 3
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("=?utf-8?q?caf=C3=A9?= menu", "café menu"),
+    ("=?UTF-8?B?w6k=?=", "é"),
+    # Unknown charset and an unterminated encoded word are shown as received
+    ("=?x-unknown?q?hi?=", "=?x-unknown?q?hi?="),
+    ("=?utf-8?b?w6k", "=?utf-8?b?w6k"),
+    (None, ""),
+])
+def test_decode_header_value(value, expected):
+    assert decode_header_value(value) == expected
+
+
+def test_malformed_encoded_subject_does_not_raise():
+    data = b"Subject: =?utf-8?b?!!!?= =?utf-8?q?=ZZ?=\r\n\r\nbody"
+    assert isinstance(parse_message(data)["subject"], str)
+
+
+def test_header_features_of_consistent_sender():
+    features = header_features(headers("""
+From: Alice <alice@example.com>
+Reply-To: alice@mail.example.com
+Return-Path: <bounce@example.com>
+Received: from a by b
+Received: from b by c
+Authentication-Results: mx.example.net; spf=pass; dkim=pass; dmarc=pass
+"""))
+    assert set(features) == set(mime.HEADER_FEATURE_NAMES)
+    assert features == {
+        "reply_to_mismatch": 0, "return_path_mismatch": 0, "received_hops": 2,
+        "spf_fail": 0, "dkim_fail": 0, "dmarc_fail": 0, "num_attachments": 0,
+    }
+
+
+def test_header_features_of_spoofed_sender():
+    features = header_features(headers("""
+From: "PayPal" <service@paypal.com>
+Reply-To: <collect@evil.example>
+Return-Path: <bounce@mailer.evil.example>
+Authentication-Results: mx.example.net; spf=softfail smtp.mailfrom=evil.example;
+ dkim=none; dmarc=FAIL
+"""), num_attachments=2)
+    assert features["reply_to_mismatch"] == 1
+    assert features["return_path_mismatch"] == 1
+    assert features["spf_fail"] == 1
+    assert features["dkim_fail"] == 0
+    assert features["dmarc_fail"] == 1
+    assert features["num_attachments"] == 2
+
+
+def test_received_spf_and_permerror_count_as_failures():
+    features = header_features(headers("""
+From: a@example.com
+Received-SPF: Fail (mx.example.net: domain does not designate sender)
+Authentication-Results: mx.example.net; dkim=permerror
+"""))
+    assert features["spf_fail"] == 1
+    assert features["dkim_fail"] == 1
+    assert features["dmarc_fail"] == 0
+    # No Reply-To or Return-Path: nothing to compare against
+    assert features["reply_to_mismatch"] == 0 and features["return_path_mismatch"] == 0
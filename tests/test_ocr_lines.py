@@ -0,0 +1,68 @@
+"""Angle classifier retries on low-confidence lines."""
+import numpy as np
+
+from scripts import ocr
+from scripts.ocr import ANGLE_RETRY_CONFIDENCE, _ocr_lines, crop_line
+
+
+class FakeOCR:
+    """Detects the given lines; rereading a crop with the classifier returns `reread`"""
+
+    def __init__(self, lines, reread):
+        self.lines = lines
+        self.reread = reread
+        self.calls = []
+
+    def ocr(self, img_array, det=True, cls=False):
+        self.calls.append((det, cls, img_array.shape))
+        if det:
+            return [[[box, (text, score)] for box, text, score in self.lines]]
+        return [[self.reread]]
+
+
+def box(left, top, right, bottom):
+    return [[left, top], [right, top], [right, bottom], [left, bottom]]
+
+
+def test_only_low_confidence_lines_are_reread():
+    image = np.full((200, 400, 3), 255, np.uint8)
+    model = FakeOCR([
+        (box(10, 10, 300, 40), "Your account is suspended", 0.97),
+        (box(10, 60, 210, 90), "ʎɟıɹǝʌ", 0.41),
+    ], reread=("verify", 0.95))
+
+    lines = _ocr_lines(model, image)
+    assert [(text, score) for _, text, score in lines] == [
+        ("Your account is suspended", 0.97), ("verify", 0.95),
+    ]
+    # One full pass without the classifier, then one crop of the second line with it
+    assert model.calls == [(True, False, (200, 400, 3)), (False, True, (30, 200, 3))]
+
+
+def test_worse_reread_keeps_first_reading():
+    image = np.full((100, 400, 3), 255, np.uint8)
+    model = FakeOCR([(box(10, 10, 300, 40), "Invoice #12", 0.5)], reread=("lnvoice", 0.3))
+    assert [(text, score) for _, text, score in _ocr_lines(model, image)] == [("Invoice #12", 0.5)]
+
+
+def test_confident_page_never_runs_the_classifier():
+    image = np.full((100, 400, 3), 255, np.uint8)
+    model = FakeOCR([(box(10, 10, 300, 40), "Hello", ANGLE_RETRY_CONFIDENCE)], reread=("x", 1.0))
+    _ocr_lines(model, image)
+    assert [cls for _, cls, _ in model.calls] == [False]
+
+
+def test_crop_line_straightens_the_box():
+    image = np.zeros((100, 200, 3), np.uint8)
+    image[20:40, 50:150] = (255, 0, 0)
+    crop = crop_line(image, box(50, 20, 150, 40))
+    assert crop.shape == (20, 100, 3)
+    assert (crop[2:-2, 2:-2] == (255, 0, 0)).all()
+
+    # Tall boxes are turned flat for the recognizer
+    assert crop_line(image, box(10, 10, 30, 90)).shape == (20, 80, 3)
+
+
+def test_stub_backend_answers_crop_requests():
+    stub = ocr.StubOCR()
+    assert stub.ocr(np.zeros((20, 100, 3), np.uint8), det=False, cls=True) == [[(ocr.StubOCR.LINES[0], 0.99)]]
@@ -0,0 +1,53 @@
+"""Regression checks for the text height estimate in preprocess_for_ocr."""
+import cv2
+import numpy as np
+import pytest
+
+from scripts.ocr import MIN_SCALE, TARGET_TEXT_HEIGHT, preprocess_for_ocr
+
+LINE_PITCH = 90
+
+
+def screenshot(lines=20, width=1200, border=False, sidebar=False, photo=False):
+    """White page with dark text lines, plus optional page-spanning elements"""
+    height = 60 + LINE_PITCH * lines
+    image = np.full((height, width, 3), 255, np.uint8)
+    left = 300 if sidebar else 60
+    for i in range(lines):
+        baseline = 40 + LINE_PITCH * i + 52
+        cv2.putText(image, "Verify your account Quickly", (left, baseline),
+                    cv2.FONT_HERSHEY_SIMPLEX, 2.0, (20, 20, 20), 4)
+    if border:
+        image[:, :6] = 0
+        image[:, -6:] = 0
+    if sidebar:
+        image[:, :240] = (40, 60, 90)
+    if photo:
+        image[80:height - 80, width - 320:width - 40] = (200, 120, 40)
+    return image
+
+
+def scale_of(image):
+    return preprocess_for_ocr(image).shape[0] / image.shape[0]
+
+
+def test_plain_text_is_scaled_towards_target_height():
+    image = screenshot()
+    rows = np.flatnonzero((image[40:40 + LINE_PITCH] < 128).any(axis=(1, 2)))
+    text_height = rows[-1] - rows[0] + 1
+    # Bands without descenders see shorter lines, so the estimate errs towards larger text
+    assert TARGET_TEXT_HEIGHT * 0.9 <= scale_of(image) * text_height <= TARGET_TEXT_HEIGHT * 1.5
+
+
+@pytest.mark.parametrize("element", ["border", "sidebar", "photo"])
+def test_page_spanning_element_does_not_collapse_the_image(element):
+    plain = scale_of(screenshot())
+    scale = scale_of(screenshot(**{element: True}))
+    assert scale >= MIN_SCALE
+    assert scale == pytest.approx(plain, rel=0.2)
+
+
+def test_single_tall_block_is_not_shrunk_below_min_scale():
+    image = np.full((2000, 800, 3), 255, np.uint8)
+    image[100:1900, 100:700] = 0
+    assert scale_of(image) >= MIN_SCALE - 0.01
@@ -0,0 +1,116 @@
+"""Hot reload of model artifacts, singly and as a versioned group."""
+import os
+import time
+
+import pytest
+
+from scripts.registry import ArtifactRegistry, _file_digest
+
+CHECK_INTERVAL = 0.05
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def write(path, text, age=None):
+    """Replace a file; `age` backdates it so the registry treats it as settled"""
+    with open(path, "w") as f:
+        f.write(text)
+    if age is not None:
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+
+
+def expire():
+    time.sleep(CHECK_INTERVAL * 1.5)
+
+
+@pytest.fixture
+def pair(tmp_path):
+    paths = str(tmp_path / "model"), str(tmp_path / "vectorizer")
+    write(paths[0], "model v1", age=60)
+    write(paths[1], "vectorizer v1", age=60)
+    return paths
+
+
+def test_object_and_version_come_from_one_load(pair):
+    registry = ArtifactRegistry(loader=read, check_interval=CHECK_INTERVAL)
+    model_path, vectorizer_path = pair
+
+    assert registry.get_versioned(model_path) == ("model v1", _file_digest(model_path))
+    objects, version = registry.get_group(pair)
+    assert objects == ("model v1", "vectorizer v1")
+    assert version == f"{_file_digest(model_path)}-{_file_digest(vectorizer_path)}"
+
+
+def test_group_is_swapped_once_every_file_has_settled(pair):
+    registry = ArtifactRegistry(loader=read, check_interval=CHECK_INTERVAL)
+    model_path, vectorizer_path = pair
+    resident = registry.get_group(pair)
+
+    # A retrain has just replaced the model but not yet the vectorizer
+    expire()
+    write(model_path, "model v2")
+    assert registry.get_group(pair) == resident
+
+    expire()
+    write(vectorizer_path, "vectorizer v2")
+    assert registry.get_group(pair) == resident
+
+    # Both files unchanged for a check interval: swapped together
+    time.sleep(CHECK_INTERVAL)
+    objects, version = registry.get_group(pair)
+    assert objects == ("model v2", "vectorizer v2")
+    assert version == f"{_file_digest(model_path)}-{_file_digest(vectorizer_path)}" != resident[1]
+
+
+def test_file_replaced_during_load_keeps_resident_group(pair):
+    model_path, vectorizer_path = pair
+    replace_during_load = []
+
+    def loader(path):
+        text = read(path)
+        if replace_during_load and path == vectorizer_path:
+            write(model_path, "model v3", age=30)
+        return text
+
+    registry = ArtifactRegistry(loader=loader, check_interval=CHECK_INTERVAL)
+    resident = registry.get_group(pair)
+    write(model_path, "model v2", age=30)
+    replace_during_load.append(True)
+    expire()
+    assert registry.get_group(pair) == resident
+
+    replace_during_load.clear()
+    expire()
+    assert registry.get_group(pair)[0] == ("model v3", "vectorizer v1")
+
+
+def test_missing_file_keeps_resident_version(pair):
+    registry = ArtifactRegistry(loader=read, check_interval=CHECK_INTERVAL)
+    resident = registry.get_group(pair)
+    os.remove(pair[0])
+    expire()
+    assert registry.get_group(pair) == resident
+
+    with pytest.raises(OSError):
+        ArtifactRegistry(loader=read).get_group(pair)
+
+
+def test_peek_version_hashes_without_loading(pair):
+    loads = []
+
+    def loader(path):
+        loads.append(path)
+        return read(path)
+
+    registry = ArtifactRegistry(loader=loader, check_interval=CHECK_INTERVAL)
+    version = registry.peek_version(pair)
+    assert loads == []
+    assert registry.get_group(pair)[1] == version
+
+    write(pair[1], "vectorizer v2")
+    assert registry.peek_version(pair) == f"{_file_digest(pair[0])}-{_file_digest(pair[1])}" != version
+    assert len(loads) == 2
@@ -0,0 +1,152 @@
+"""Bulk scoring: error rows, resuming after a crash, and skipping scored input."""
+import json
+import os
+
+import pytest
+
+from scripts import classical, score
+
+
+class Crash(Exception):
+    pass
+
+
+@pytest.fixture
+def fake_classifier(monkeypatch):
+    """Score without model artifacts; crash_after makes the Nth chunk fail"""
+    state = {"chunks": 0, "crash_after": None}
+
+    def classify_emails(texts, chunk_size=None, stats=None):
+        state["chunks"] += 1
+        if state["crash_after"] is not None and state["chunks"] > state["crash_after"]:
+            raise Crash()
+        for text in texts:
+            yield (1, 0.9) if "verify" in text else (0, 0.1)
+
+    monkeypatch.setattr(classical, "classify_emails", classify_emails)
+    return state
+
+
+def write_jsonl(path, rows):
+    with open(path, "w") as f:
+        for row in rows:
+            f.write(row if isinstance(row, str) else json.dumps(row))
+            f.write("\n")
+
+
+def corpus(path, count=23):
+    write_jsonl(path, [
+        {"id": f"m{i}", "body": "please verify your account" if i % 3 else "lunch at noon"}
+        for i in range(count)
+    ])
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def run(input_path, output_path, **kwargs):
+    return score.score_corpus(str(input_path), str(output_path), id_field="id", chunk_size=5,
+                              workers=1, progress=False, **kwargs)
+
+
+def test_unreadable_records_become_error_rows(tmp_path, fake_classifier):
+    input_path, output_path = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_jsonl(input_path, [
+        {"id": "a", "body": "verify now"},
+        "{not json",
+        "[1, 2]",
+        {"id": "n", "body": 12345},
+        {"id": "z", "body": None},
+        {"id": "b", "body": "see you"},
+    ])
+    assert run(input_path, output_path) == 6
+
+    rows = read_jsonl(output_path)
+    assert [row["id"] for row in rows] == ["a", "1", "2", "n", "z", "b"]
+    assert all(set(row) == {"offset", "id", "prediction", "label", "probability", "error"} for row in rows)
+    assert rows[0]["prediction"] == 1 and rows[0]["error"] is None
+    assert rows[1]["prediction"] is None and rows[1]["error"].startswith("Invalid JSON")
+    assert rows[2]["error"] == "Expected a JSON object, got list"
+    assert rows[3]["error"] is None and rows[4]["error"] is None
+
+
+def test_jsonl_resume_after_crash_and_torn_write(tmp_path, fake_classifier):
+    input_path = tmp_path / "in.jsonl"
+    corpus(input_path)
+    expected = tmp_path / "expected.jsonl"
+    run(input_path, expected)
+
+    output_path = tmp_path / "out.jsonl"
+    fake_classifier.update(chunks=0, crash_after=2)
+    with pytest.raises(Crash):
+        run(input_path, output_path)
+    assert score.load_checkpoint(str(output_path))["next_offset"] == 10
+    # A write the checkpoint does not cover, cut off mid-line
+    with open(output_path, "a") as f:
+        f.write('{"offset": 10, "id": "m1')
+
+    fake_classifier.update(chunks=0, crash_after=None)
+    assert run(input_path, output_path, resume=True) == 13
+    assert read_jsonl(output_path) == read_jsonl(expected)
+
+
+def test_parquet_resume_keeps_rows_scored_before_crash(tmp_path, fake_classifier):
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+    input_path = tmp_path / "in.jsonl"
+    corpus(input_path)
+
+    def read(path):
+        table = pyarrow_parquet.read_table(str(path)).to_pylist()
+        return sorted(table, key=lambda row: row["offset"])
+
+    expected = tmp_path / "expected.parquet"
+    run(input_path, expected)
+
+    output_path = tmp_path / "out.parquet"
+    fake_classifier.update(chunks=0, crash_after=2)
+    with pytest.raises(Crash):
+        run(input_path, output_path)
+    # Finished parts are readable on their own
+    assert len(read(output_path)) == 10
+    # A part being written when the process died, and one the checkpoint does not cover
+    (output_path / "part-00002.parquet.tmp").write_bytes(b"PAR1 torn")
+    pyarrow_parquet.write_table(pyarrow_parquet.read_table(str(output_path / "part-00000.parquet")),
+                                str(output_path / "part-00003.parquet"))
+
+    fake_classifier.update(chunks=0, crash_after=None)
+    assert run(input_path, output_path, resume=True) == 13
+    assert read(output_path) == read(expected)
+    assert sorted(os.listdir(output_path)) == [f"part-{index:05d}.parquet" for index in range(5)]
+
+
+def test_resume_does_not_read_scored_messages(tmp_path):
+    maildir = tmp_path / "Maildir"
+    (maildir / "cur").mkdir(parents=True)
+    # Opening either of these would raise, so they must be skipped unread
+    (maildir / "cur" / "0001").mkdir()
+    (maildir / "cur" / "0002").mkdir()
+    (maildir / "cur" / "0003").write_bytes(b"Subject: hi\r\n\r\nbody\r\n")
+
+    records = list(score.iter_records(str(maildir), "maildir", start_offset=2))
+    assert [(offset, record_id) for offset, record_id, _ in records] == [(2, "0003")]
+
+
+@pytest.mark.parametrize("input_format", ["mbox", "jsonl", "csv"])
+def test_start_offset_matches_filtering(tmp_path, input_format):
+    path = tmp_path / f"in.{input_format}"
+    if input_format == "mbox":
+        path.write_bytes(b"".join(
+            b"From sender@example.com Mon Jan 1 00:00:00 2024\n\nmessage %d\n\n" % i for i in range(7)
+        ))
+    elif input_format == "jsonl":
+        corpus(path, 7)
+    else:
+        path.write_text("id,body\n" + "".join(f"m{i},text {i}\n" for i in range(7)))
+
+    full = list(score.iter_records(str(path), input_format, id_field="id"))
+    assert len(full) == 7
+    for start in range(9):
+        assert list(score.iter_records(str(path), input_format, id_field="id", start_offset=start)) == \
+            [record for record in full if record[0] >= start]
@@ -0,0 +1,253 @@
+"""Scoring service: micro-batching, overload answers and the HTTP endpoints."""
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from scripts import llm, service
+from scripts.cache import classification_cache
+from scripts.service import MicroBatcher, Overloaded, ScoringService
+
+MODEL_VERSION = "test-model"
+
+
+@pytest.fixture
+def fake_batches(monkeypatch):
+    """Score without model artifacts; records every batch and can be held back"""
+    state = {"batches": [], "started": [], "release": threading.Event()}
+    state["release"].set()
+
+    def classify_batch(texts):
+        state["started"].append(list(texts))
+        state["release"].wait(5)
+        state["batches"].append(list(texts))
+        return [(1 if "verify" in text else 0, 0.9 if "verify" in text else 0.1, {"num_links": 0})
+                for text in texts], MODEL_VERSION
+
+    monkeypatch.setattr(service, "_classify_batch", classify_batch)
+    monkeypatch.setattr(service, "_current_model_version", lambda: MODEL_VERSION)
+    classification_cache.clear()
+    yield state
+    state["release"].set()
+    classification_cache.clear()
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 10))
+
+
+# --- MicroBatcher ------------------------------------------------------------
+
+def test_concurrent_requests_share_batches(fake_batches):
+    async def main():
+        with ThreadPoolExecutor(1) as executor:
+            batcher = MicroBatcher(executor, max_batch_size=4, max_wait=0.05)
+            batcher.start()
+            futures = [batcher.submit(f"email {i}") for i in range(10)]
+            results = await asyncio.gather(*futures)
+            await batcher.close()
+        return results
+
+    results = run(main())
+    assert [len(batch) for batch in fake_batches["batches"]] == [4, 4, 2]
+    assert sum(fake_batches["batches"], []) == [f"email {i}" for i in range(10)]
+    assert all(version == MODEL_VERSION for _, version in results)
+    assert [result[0] for result, _ in results] == [0] * 10
+
+
+def test_batch_closes_after_max_wait(fake_batches):
+    async def main():
+        with ThreadPoolExecutor(1) as executor:
+            batcher = MicroBatcher(executor, max_batch_size=64, max_wait=0.01)
+            batcher.start()
+            first = await batcher.submit("first")
+            second = await batcher.submit("please verify")
+            await batcher.close()
+        return first, second
+
+    first, second = run(main())
+    assert fake_batches["batches"] == [["first"], ["please verify"]]
+    assert first[0][0] == 0 and second[0][0] == 1
+
+
+def test_failed_batch_fails_each_request(monkeypatch):
+    def classify_batch(texts):
+        raise RuntimeError("model exploded")
+
+    monkeypatch.setattr(service, "_classify_batch", classify_batch)
+
+    async def main():
+        with ThreadPoolExecutor(1) as executor:
+            batcher = MicroBatcher(executor, max_wait=0.01)
+            batcher.start()
+            results = await asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+            await batcher.close()
+        return results
+
+    assert [str(result) for result in run(main())] == ["model exploded"] * 2
+
+
+def test_full_queue_is_rejected(fake_batches):
+    async def main():
+        with ThreadPoolExecutor(1) as executor:
+            batcher = MicroBatcher(executor, max_queue=2)
+            batcher.submit("a")
+            batcher.submit("b")
+            with pytest.raises(Overloaded):
+                batcher.submit("c")
+
+    run(main())
+
+
+# --- HTTP --------------------------------------------------------------------
+
+async def http(port, method, path, body=b"", headers=()):
+    """Send one raw request and return (status, headers dict, body bytes)"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    head = [f"{method} {path} HTTP/1.1", "Host: test", "Connection: close"]
+    if not any(name.lower() == "content-length" for name, _ in headers):
+        head.append(f"Content-Length: {len(body)}")
+    head += [f"{name}: {value}" for name, value in headers]
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+
+    head, _, response_body = response.partition(b"\r\n\r\n")
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    response_headers = dict(line.split(": ", 1) for line in header_lines)
+    return int(status_line.split()[1]), response_headers, response_body
+
+
+def serve(test, **options):
+    """Run test(port, service) against a service on an ephemeral port"""
+    async def main():
+        scoring_service = ScoringService(**{"workers": 1, "max_wait": 0.01, **options})
+        await scoring_service.start()
+        server = await asyncio.start_server(scoring_service.handle_connection, "127.0.0.1", 0)
+        try:
+            return await test(server.sockets[0].getsockname()[1], scoring_service)
+        finally:
+            server.close()
+            await scoring_service.close()
+
+    return run(main())
+
+
+def post_json(port, path, payload):
+    return http(port, "POST", path, json.dumps(payload).encode(), [("Content-Type", "application/json")])
+
+
+def test_classify_endpoint(fake_batches):
+    async def test(port, _):
+        single = await post_json(port, "/classify", {"text": "please verify your account"})
+        many = await post_json(port, "/classify", {"texts": ["hello", "verify now"]})
+        invalid = await post_json(port, "/classify", {"texts": "hello"})
+        return single, many, invalid
+
+    single, many, invalid = serve(test, max_wait=0.05)
+    assert single[0] == 200
+    assert json.loads(single[2]) == {
+        "prediction": 1, "label": "malicious", "probability": 0.9,
+        "features": {"num_links": 0}, "model_version": MODEL_VERSION,
+    }
+    assert many[0] == 200
+    assert [result["label"] for result in json.loads(many[2])["results"]] == ["safe", "malicious"]
+    assert invalid[0] == 400
+
+
+def test_classify_answers_repeats_from_cache(fake_batches):
+    async def test(port, _):
+        for _ in range(3):
+            status, _, _ = await post_json(port, "/classify", {"text": "same email"})
+            assert status == 200
+
+    serve(test)
+    # The warm-up batch from start(), then one batch for the three requests
+    assert fake_batches["batches"] == [[""], ["same email"]]
+
+
+def test_overloaded_classify_gets_503_with_retry_after(fake_batches):
+    async def test(port, scoring_service):
+        fake_batches["release"].clear()
+        # The worker holds the first batch, the second fills the queue
+        pending = [asyncio.create_task(post_json(port, "/classify", {"text": "email 0"}))]
+        while len(fake_batches["started"]) < 2:
+            await asyncio.sleep(0.01)
+        pending.append(asyncio.create_task(post_json(port, "/classify", {"text": "email 1"})))
+        while scoring_service.batcher.queue.qsize() < 1:
+            await asyncio.sleep(0.01)
+        rejected = await post_json(port, "/classify", {"text": "one too many"})
+        fake_batches["release"].set()
+        return rejected, await asyncio.gather(*pending)
+
+    rejected, accepted = serve(test, max_queue=1, max_batch_size=1)
+    assert rejected[0] == 503
+    assert rejected[1]["Retry-After"] == str(service.RETRY_AFTER)
+    assert [status for status, _, _ in accepted] == [200, 200]
+
+
+def test_explain_endpoint(fake_batches):
+    llm.set_llm_backend(llm.StubLLM())
+    llm.explanation_cache.clear()
+    try:
+        async def test(port, _):
+            given = await post_json(port, "/explain", {"text": "verify", "prediction": 1, "confidence": 0.93})
+            computed = await post_json(port, "/explain", {"text": "hello there"})
+            return given, computed
+
+        given, computed = serve(test, explain_deadline=5)
+    finally:
+        llm.set_llm_backend(None)
+        llm.explanation_cache.clear()
+
+    assert given[0] == 200
+    body = json.loads(given[2])
+    assert body["prediction"] == 1 and body["probability"] == 0.93
+    assert body["explanation"].startswith("- Stub explanation") and body["fallback"] is False
+    assert computed[0] == 200
+    assert json.loads(computed[2])["prediction"] == 0
+
+
+@pytest.mark.parametrize("payload", [
+    {"text": "x", "prediction": "malicious", "confidence": 0.5},
+    {"text": "x", "prediction": 2, "confidence": 0.5},
+    {"text": "x", "prediction": [1], "confidence": 0.5},
+    {"text": "x", "prediction": 1, "confidence": "high"},
+    {"text": "x", "prediction": 1, "confidence": 1.5},
+    {"text": "x", "prediction": 1, "confidence": 0.5, "features": ["num_links"]},
+    {"prediction": 1, "confidence": 0.5},
+])
+def test_explain_rejects_invalid_input(fake_batches, payload):
+    async def test(port, _):
+        return await post_json(port, "/explain", payload)
+
+    status, _, body = serve(test)
+    assert status == 400, body
+
+
+@pytest.mark.parametrize("length", ["-1", "abc"])
+def test_invalid_content_length_is_rejected(fake_batches, length):
+    async def test(port, _):
+        return await http(port, "POST", "/classify", b"{}", [("Content-Length", length)])
+
+    status, _, _ = serve(test)
+    assert status == 400
+
+
+def test_routing_and_health(fake_batches):
+    async def test(port, _):
+        return (
+            await http(port, "GET", "/healthz"),
+            await http(port, "GET", "/nowhere"),
+            await http(port, "GET", "/classify"),
+            await http(port, "POST", "/classify", b"[1, 2]"),
+        )
+
+    health, missing, wrong_method, not_object = serve(test)
+    assert health[0] == 200 and json.loads(health[2])["model_version"] == MODEL_VERSION
+    assert missing[0] == 404
+    assert wrong_method[0] == 405
+    assert not_object[0] == 400